@@ -3,8 +3,7 @@ import base64
 import datetime
 from functools import lru_cache
 
-import requests
-
+from intergov import http_client
 from intergov.loggers import logging
 
 logger = logging.getLogger(__name__)
@@ -87,7 +86,7 @@ class AuthMixin:
         cognito_auth = base64.b64encode(
             f"{OAUTH_CLIENT_ID}:{OAUTH_CLIENT_SECRET}".encode("utf-8")
         ).decode("utf-8")
-        token_resp = requests.post(
+        token_resp = http_client.post(
             auth_parameters.get("token_endpoint") or _oidc_token_url(auth_parameters["wellknown_url"]),
             data={
                 "grant_type": "client_credentials",
@@ -112,6 +111,6 @@ class AuthMixin:
 @lru_cache(maxsize=2)  # it's fine to cache for a long time
 def _oidc_token_url(wellknown_url):
     # see _get_cached_cognito_jwt descr about the design concerns
-    wellknown_content = requests.get(wellknown_url)
+    wellknown_content = http_client.get(wellknown_url)
     assert wellknown_content.status_code == 200
     return wellknown_content.json().get("token_endpoint")
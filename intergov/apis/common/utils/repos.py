@@ -0,0 +1,51 @@
+import threading
+
+from flask import current_app
+
+EXTENSION_NAME = 'repos'
+
+
+class RepoRegistry:
+    """
+    App-scoped storage of the repo instances.
+
+    Creating the repo means creating new boto3 client (or DB engine),
+    which is slow, so the repos are created on first use and then
+    shared by all requests (and threads) of the app.
+    Repos are stored by name and class, so the different class
+    (mocked one in tests, for example) means the different repo.
+    """
+
+    def __init__(self):
+        self._repos = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, repo_class, conf):
+        key = (name, repo_class)
+        repo = self._repos.get(key)
+        if repo is None:
+            with self._lock:
+                repo = self._repos.get(key)
+                if repo is None:
+                    repo = repo_class(conf)
+                    self._repos[key] = repo
+        return repo
+
+    def clear(self):
+        with self._lock:
+            self._repos.clear()
+
+
+def init_app(app):
+    app.extensions[EXTENSION_NAME] = RepoRegistry()
+
+
+def get_repo(name, repo_class, conf):
+    """
+    Returns the repo shared by the current app requests
+    (or the new one if the app has no registry)
+    """
+    registry = current_app.extensions.get(EXTENSION_NAME)
+    if registry is None:
+        return repo_class(conf)
+    return registry.get(name, repo_class, conf)
@@ -6,6 +6,7 @@ from flask.wrappers import Request
 from libtrustbridge.utils.specs import register_specs
 
 from intergov.apis.common.errors import handlers
+from intergov.apis.common.utils import repos
 from intergov.apis.document import documents, index
 from intergov.apis.document.conf import Config
 
@@ -41,6 +42,7 @@ def create_app(config_object=None):
         from sentry_sdk.integrations.flask import FlaskIntegration
         from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
         sentry_sdk.init(SENTRY_DSN, integrations=[FlaskIntegration(), AwsLambdaIntegration()])
+    repos.init_app(app)
     app.register_blueprint(index.blueprint)
     app.register_blueprint(documents.blueprint)
     handlers.register(app)
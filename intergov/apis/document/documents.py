@@ -10,6 +10,7 @@ from intergov.apis.common.errors import (
     InternalServerError
 )
 from intergov.apis.common.utils import routing
+from intergov.apis.common.utils.repos import get_repo
 from intergov.domain.jurisdiction import Jurisdiction
 from intergov.domain.uri import URI
 from intergov.loggers import logging  # NOQA
@@ -71,8 +72,8 @@ def document_post(jurisdiction_name):
     except Exception as e:
         raise BadJurisdictionNameError(e)
 
-    object_lake_repo = ObjectLakeRepo(Config.OBJECT_LAKE_CONN)
-    object_acl_repo = ObjectACLRepo(Config.OBJECT_ACL_CONN)
+    object_lake_repo = get_repo('object_lake', ObjectLakeRepo, Config.OBJECT_LAKE_CONN)
+    object_acl_repo = get_repo('object_acl', ObjectACLRepo, Config.OBJECT_ACL_CONN)
 
     if len(request.files) == 0:
         raise NoInputFileError()
@@ -128,8 +129,8 @@ def document_fetch(uri):
     if not URI(uri).is_valid_multihash():
         raise InvalidURIError()
 
-    object_lake_repo = ObjectLakeRepo(Config.OBJECT_LAKE_CONN)
-    object_acl_repo = ObjectACLRepo(Config.OBJECT_ACL_CONN)
+    object_lake_repo = get_repo('object_lake', ObjectLakeRepo, Config.OBJECT_LAKE_CONN)
+    object_acl_repo = get_repo('object_acl', ObjectACLRepo, Config.OBJECT_ACL_CONN)
 
     use_case = AuthenticatedObjectAccessUseCase(
         object_acl_repo=object_acl_repo,
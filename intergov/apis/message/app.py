@@ -5,8 +5,10 @@ from flask import Flask
 from libtrustbridge.utils.specs import register_specs
 
 from intergov.apis.common.errors import handlers
+from intergov.apis.common.utils import repos
 from intergov.apis.message import message, index
 from intergov.apis.message.conf import Config
+from intergov.repos.message_lake import MessageLakeCache
 
 
 spec = APISpec(
@@ -34,6 +36,12 @@ def create_app(config_object=None):
         from sentry_sdk.integrations.flask import FlaskIntegration
         from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
         sentry_sdk.init(SENTRY_DSN, integrations=[FlaskIntegration(), AwsLambdaIntegration()])
+    # shared by the requests of this app
+    app.extensions['message_lake_cache'] = MessageLakeCache(
+        max_size=app.config.get('MESSAGE_CACHE_SIZE', 0),
+        ttl=app.config.get('MESSAGE_CACHE_TTL', 0)
+    )
+    repos.init_app(app)
     app.register_blueprint(index.blueprint)
     app.register_blueprint(message.blueprint)
     handlers.register(app)
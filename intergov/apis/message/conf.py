@@ -7,6 +7,11 @@ class Config(object):
     TESTING = env_bool('IGL_TESTING', default=True)
 
     MESSAGE_LAKE_CONN = env_s3_config('MSGAPI_MESSAGE_LAKE')
+    # messages returned by GET /message/<reference> are cached in memory;
+    # the final status ones until pushed out, others for the TTL seconds
+    # 0 size disables the cache
+    MESSAGE_CACHE_SIZE = int(env('IGL_MSGAPI_MESSAGE_CACHE_SIZE', default=1000))
+    MESSAGE_CACHE_TTL = float(env('IGL_MSGAPI_MESSAGE_CACHE_TTL', default=2))
 
     BC_INBOX_CONF = env_queue_config('MSG_RX_API_BC_INBOX')
 
@@ -2,11 +2,11 @@ import json
 import uuid
 from http import HTTPStatus
 
-from flask import Blueprint, Response, request
+from flask import Blueprint, Response, current_app, request
 from marshmallow import Schema, fields
 
 from intergov.conf import env
-from intergov.repos.message_lake import MessageLakeRepo
+from intergov.repos.message_lake import CachedMessageLakeRepo, MessageLakeRepo
 from intergov.repos.bc_inbox.elasticmq.elasticmqrepo import BCInboxRepo
 from intergov.repos.notifications import NotificationsRepo
 from intergov.domain.wire_protocols.generic_discrete import (
@@ -25,6 +25,7 @@ from intergov.use_cases.common.errors import (
     UseCaseError
 )
 from intergov.apis.common.utils import routing
+from intergov.apis.common.utils.repos import get_repo
 from intergov.apis.common.errors import (
     InternalServerError
 )
@@ -79,7 +80,10 @@ def message_retrieve(reference):
 
     """
     # TODO: auth
-    repo = MessageLakeRepo(Config.MESSAGE_LAKE_CONN)
+    repo = CachedMessageLakeRepo(
+        get_repo('message_lake', MessageLakeRepo, Config.MESSAGE_LAKE_CONN),
+        current_app.extensions['message_lake_cache']
+    )
 
     use_case = GetMessageBySenderRefUseCase(repo)
 
@@ -144,9 +148,9 @@ def message_patch(reference):
             FINAL_STATUSES + [None]
         )
 
-    repo = MessageLakeRepo(Config.MESSAGE_LAKE_CONN)
-    publish_notifications_repo = NotificationsRepo(
-        Config.PUBLISH_NOTIFICATIONS_REPO_CONN
+    repo = get_repo('message_lake', MessageLakeRepo, Config.MESSAGE_LAKE_CONN)
+    publish_notifications_repo = get_repo(
+        'publish_notifications', NotificationsRepo, Config.PUBLISH_NOTIFICATIONS_REPO_CONN
     )
 
     use_case = PatchMessageMetadataUseCase(
@@ -166,6 +170,12 @@ def message_patch(reference):
             # but in future it will be easier to decide
             # what kind of info we want to put here
             raise InternalServerError(e)
+    finally:
+        # patch works with the fresh data and invalidates the cached one
+        if ':' in reference:
+            current_app.extensions['message_lake_cache'].invalidate(
+                *reference.split(':', maxsplit=1)
+            )
     if not message:
         raise MessageNotFoundError(reference)
     return Response(
@@ -215,9 +225,7 @@ def message_post():
     else:
         message.kwargs["status"] = "received"
 
-    repo = BCInboxRepo(
-        Config.BC_INBOX_CONF
-    )
+    repo = get_repo('bc_inbox', BCInboxRepo, Config.BC_INBOX_CONF)
     use_case = EnqueueMessageUseCase(repo)
 
     if use_case.execute(message):
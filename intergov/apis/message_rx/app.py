@@ -1,6 +1,7 @@
 from flask import Flask
 
 from intergov.apis.common.errors import handlers
+from intergov.apis.common.utils import repos
 from intergov.apis.message_rx import message, index
 from intergov.apis.message_rx.conf import Config
 from intergov.loggers import logging  # NOQA
@@ -20,6 +21,7 @@ def create_app(config_object=None):
         from sentry_sdk.integrations.flask import FlaskIntegration
         from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
         sentry_sdk.init(SENTRY_DSN, integrations=[FlaskIntegration(), AwsLambdaIntegration()])
+    repos.init_app(app)
     app.register_blueprint(index.blueprint)
     app.register_blueprint(message.blueprint)
     handlers.register(app)
@@ -1,4 +1,6 @@
-from libtrustbridge.utils.conf import env, env_bool, env_json, env_queue_config
+from libtrustbridge.utils.conf import env, env_bool, env_queue_config
+
+from intergov.channels.routing import ReloadingRoutingIndex
 
 
 class Config(object):
@@ -7,7 +9,9 @@ class Config(object):
     TESTING = env_bool('IGL_TESTING', default=True)
 
     CHANNEL_NOTIFICATION_REPO_CONF = env_queue_config('CHANNEL_NOTIFICATION_REPO')
-    ROUTING_TABLE = env_json("IGL_MCHR_ROUTING_TABLE")
+    # IGL_MCHR_ROUTING_TABLE or the IGL_MCHR_ROUTING_TABLE_FILE content;
+    # only the file is reloaded when changed
+    ROUTING_TABLE = ReloadingRoutingIndex()
 
     SENTRY_DSN = env("SENTRY_DSN", default=None)
 
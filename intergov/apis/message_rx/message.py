@@ -3,6 +3,7 @@ from flask import (
 )
 
 from intergov.apis.common.utils import routing
+from intergov.apis.common.utils.repos import get_repo
 from intergov.apis.message_rx.conf import Config
 from intergov.loggers import logging
 from intergov.monitoring import increase_counter
@@ -47,8 +48,8 @@ def channel_message_receive(channel_id):
     """
     body = request.get_json(silent=True)
     increase_counter("message_rx.message.received")
-    repo = ChannelNotificationRepo(
-        Config.CHANNEL_NOTIFICATION_REPO_CONF
+    repo = get_repo(
+        'channel_notifications', ChannelNotificationRepo, Config.CHANNEL_NOTIFICATION_REPO_CONF
     )
     use_case = EnqueueChannelNotificationUseCase(channel_notification_repo=repo)
     channel = get_channel_by_id(channel_id, Config.ROUTING_TABLE)
@@ -4,6 +4,7 @@ from apispec_webframeworks.flask import FlaskPlugin
 from flask import Flask
 from libtrustbridge.utils.specs import register_specs
 
+from intergov.apis.common.utils import repos
 from intergov.apis.subscriptions import subscriptions, index
 from intergov.apis.subscriptions.conf import Config
 from libtrustbridge.errors import handlers
@@ -34,6 +35,7 @@ def create_app(config_object=None):
         from sentry_sdk.integrations.flask import FlaskIntegration
         from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
         sentry_sdk.init(SENTRY_DSN, integrations=[FlaskIntegration(), AwsLambdaIntegration()])
+    repos.init_app(app)
     app.register_blueprint(index.blueprint)
     app.register_blueprint(subscriptions.blueprint)
     handlers.register(app)
@@ -6,6 +6,9 @@ class Config(object):
     DEBUG = env_bool('IGL_DEBUG', default=True)
     TESTING = env_bool('IGL_TESTING', default=True)
     SUBSCR_REPO_CONF = env_s3_config('SUBSCR_API_REPO')
+    # record subscription changes for the callbacks spreaders' subscriptions index
+    SUBSCR_CHANGES = env_bool('IGL_SUBSCR_CHANGES', default=False)
+    SUBSCR_CHANGES_REPO_CONF = env_s3_config('SUBSCR_API_CHANGES_REPO')
     SENTRY_DSN = env("SENTRY_DSN", default=None)
 
 
@@ -33,7 +33,9 @@ from libtrustbridge.websub.exceptions import (
     LeaseSecondsValidationError
 )
 
+from intergov.apis.common.utils.repos import get_repo
 from intergov.monitoring import statsd_timer
+from intergov.repos.subscriptions import SubscriptionsChangesRepo
 from intergov.use_cases import (
     SubscriptionDeregisterUseCase,
     SubscriptionRegisterUseCase,
@@ -45,9 +47,15 @@ from .conf import Config
 blueprint = Blueprint('subscriptions', __name__)
 
 
+def _get_changes_repo():
+    if not Config.SUBSCR_CHANGES:
+        return None
+    return get_repo('subscriptions_changes', SubscriptionsChangesRepo, Config.SUBSCR_CHANGES_REPO_CONF)
+
+
 def _deregister_subscription(form):
-    repo = SubscriptionsRepo(Config.SUBSCR_REPO_CONF)
-    use_case = SubscriptionDeregisterUseCase(repo)
+    repo = get_repo('subscriptions', SubscriptionsRepo, Config.SUBSCR_REPO_CONF)
+    use_case = SubscriptionDeregisterUseCase(repo, changes_repo=_get_changes_repo())
     try:
         use_case.execute(form[CALLBACK_ATTR_KEY], form[TOPIC_ATTR_KEY])
     except SubscriptionNotFound as e:
@@ -58,8 +66,8 @@ def _deregister_subscription(form):
 
 
 def _register_subscription(form):
-    repo = SubscriptionsRepo(Config.SUBSCR_REPO_CONF)
-    use_case = SubscriptionRegisterUseCase(repo)
+    repo = get_repo('subscriptions', SubscriptionsRepo, Config.SUBSCR_REPO_CONF)
+    use_case = SubscriptionRegisterUseCase(repo, changes_repo=_get_changes_repo())
     result = use_case.execute(form[CALLBACK_ATTR_KEY], form[TOPIC_ATTR_KEY], form[LEASE_SECONDS_ATTR_KEY])
     if result is None:
         raise UnableToPostSubscriptionError()
@@ -0,0 +1,125 @@
+import re
+import threading
+import time
+from collections import deque
+
+from intergov.loggers import logging
+from intergov.monitoring import increase_counter, statsd_gauge
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+# gauge values
+STATE_VALUES = {
+    CLOSED: 0,
+    HALF_OPEN: 1,
+    OPEN: 2,
+}
+
+
+class CircuitBreaker:
+    """
+    Tracks results of the calls to a channel and stops calling it
+    while it's failing.
+
+    closed: calls are made, results of the last window_seconds are kept;
+        once there are at least min_calls of them and the failure rate
+        reaches failure_rate the breaker opens.
+    open: no calls for open_seconds, then it's half open.
+    half_open: a single trial call is allowed; its success closes
+        the breaker, its failure opens it again.
+
+    Thread-safe, state changes are sent as the gauge metric.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window_seconds=60, open_seconds=30):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.metric_name = "channels.{}.circuit_state".format(
+            re.sub(r'[^A-Za-z0-9_-]', '_', name)
+        )
+        self.state = CLOSED
+        self._calls = deque()
+        self._opened_at = None
+        self._trial_in_progress = False
+        # state changes not reported as metrics yet
+        self._changes = []
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if the call may be made now
+        """
+        with self._lock:
+            allowed = self._allow()
+            changes = self._take_changes()
+        self._report(changes)
+        return allowed
+
+    def _allow(self):
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trial_in_progress:
+                return False
+            self._trial_in_progress = True
+        return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._calls.clear()
+                self._set_state(CLOSED)
+            else:
+                self._add_call(True)
+            changes = self._take_changes()
+        self._report(changes)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open()
+            else:
+                self._add_call(False)
+                if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                    failures = sum(1 for at, ok in self._calls if not ok)
+                    if failures / len(self._calls) >= self.failure_rate:
+                        self._open()
+            changes = self._take_changes()
+        self._report(changes)
+
+    def _add_call(self, ok):
+        now = time.monotonic()
+        self._calls.append((now, ok))
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self._set_state(OPEN)
+
+    def _set_state(self, state):
+        self._trial_in_progress = False
+        if state == self.state:
+            return
+        logger.warning("Channel %s circuit is %s now (was %s)", self.name, state, self.state)
+        self.state = state
+        self._changes.append(state)
+
+    def _take_changes(self):
+        changes, self._changes = self._changes, []
+        return changes
+
+    def _report(self, changes):
+        # metrics may be sent over the network, so never under the lock
+        for state in changes:
+            increase_counter("{}.{}".format(self.metric_name, state))
+            statsd_gauge(self.metric_name, STATE_VALUES[state])
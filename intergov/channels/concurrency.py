@@ -0,0 +1,35 @@
+import threading
+
+
+class ConcurrencyLimitedChannel:
+    """
+    Wrapper of the channel instance which allows no more than `limit`
+    messages to be posted to it at the same time, so the parallel
+    router doesn't overload the channel endpoint.
+    Posting threads above the limit wait for their turn;
+    everything else is just passed to the channel.
+    """
+
+    def __init__(self, channel, limit):
+        self.channel = channel
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def __str__(self):
+        # used as the channel id
+        return str(self.channel)
+
+    def post_message(self, message):
+        with self._semaphore:
+            return self.channel.post_message(message)
+
+    def post_messages(self, messages):
+        # the whole batch takes a single slot
+        with self._semaphore:
+            post_messages = getattr(self.channel, 'post_messages', None)
+            if post_messages is None:
+                return [self.channel.post_message(message) for message in messages]
+            return post_messages(messages)
+
+    def __getattr__(self, name):
+        return getattr(self.channel, name)
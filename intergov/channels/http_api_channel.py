@@ -1,9 +1,11 @@
 import base64
 import datetime
+import threading
 from functools import lru_cache
 
 import requests
 
+from intergov import http_client
 from intergov.conf import env
 from intergov.loggers import logging
 
@@ -26,6 +28,8 @@ class HttpApiChannel:
     """
 
     ID = 'HttpApiChannel'
+    DEFAULT_BATCH_SIZE = 100
+    BATCH_TIMEOUT = 30
 
     def __init__(self, config):
         self.CONFIG = config.copy()
@@ -35,6 +39,11 @@ class HttpApiChannel:
             raise Exception("Lack of required parameter in the config")
         if self.CONFIG['ChannelUrl'].endswith("/"):
             self.CONFIG['ChannelUrl'] = self.CONFIG['ChannelUrl'][:-1]
+        # messages may be posted from several threads,
+        # but the token should be issued once
+        self._cognito_jwt_lock = threading.Lock()
+        # keeps the connections to the channel open between the messages
+        self.session = http_client.get_session()
 
     def __str__(self):
         return f"HttpApiChannel({self.CONFIG['ChannelUrl']})"
@@ -44,6 +53,12 @@ class HttpApiChannel:
         # they could be added in the future
         return False
 
+    def _message_payload(self, message):
+        payload = message.to_dict()
+        del payload["sender_ref"]
+        del payload["status"]
+        return payload
+
     def post_message(self, message):
         logger.info(
             "Sending message %s to %s",
@@ -58,13 +73,9 @@ class HttpApiChannel:
             else "/post"
         )
 
-        payload = message.to_dict()
-        del payload["sender_ref"]
-        del payload["status"]
-
-        resp = requests.post(
+        resp = self.session.post(
             f"{self.CONFIG['ChannelUrl']}{relative_url}",
-            json=payload,
+            json=self._message_payload(message),
             headers=self._get_headers(),
             timeout=5,
         )
@@ -85,6 +96,65 @@ class HttpApiChannel:
             )
         return result
 
+    def post_messages(self, messages):
+        """
+        Sends many messages, returns list of the channel message ids
+        (or False for the failed ones) in the same order.
+
+        If the channel has the batch endpoint ("ChannelBatchEndpoint" config key,
+        relative to the ChannelUrl) messages are sent there by ChannelBatchSize,
+        as the list of the same payloads post_message sends; the response must be
+        the list of the same length, with {"id": ...} for the accepted ones.
+        Otherwise they are sent one by one, reusing the same connection.
+        """
+        messages = list(messages)
+        batch_endpoint = self.CONFIG.get("ChannelBatchEndpoint")
+        if not batch_endpoint:
+            return [self.post_message(message) for message in messages]
+        batch_size = int(self.CONFIG.get("ChannelBatchSize") or self.DEFAULT_BATCH_SIZE)
+        results = []
+        for i in range(0, len(messages), batch_size):
+            results += self._post_batch(batch_endpoint, messages[i:i + batch_size])
+        return results
+
+    def _post_batch(self, batch_endpoint, messages):
+        logger.info(
+            "Sending %s messages to %s",
+            len(messages),
+            self.CONFIG["ChannelUrl"]
+        )
+        try:
+            resp = self.session.post(
+                f"{self.CONFIG['ChannelUrl']}{batch_endpoint}",
+                json=[self._message_payload(message) for message in messages],
+                headers=self._get_headers(),
+                timeout=self.BATCH_TIMEOUT,
+            )
+        except requests.RequestException as e:
+            logger.exception(e)
+            return [False] * len(messages)
+        if not str(resp.status_code).startswith("2"):
+            logger.error(
+                "Error sending %s messages: %s", len(messages), resp.content
+            )
+            return [False] * len(messages)
+        items = resp.json()
+        if not isinstance(items, list) or len(items) != len(messages):
+            logger.error(
+                "Unexpected response to %s messages sent: %s", len(messages), resp.content
+            )
+            return [False] * len(messages)
+        results = []
+        for message, item in zip(messages, items):
+            ch_msg_id = item.get("id") if isinstance(item, dict) else None
+            if ch_msg_id:
+                self._subscribe_to_message(ch_msg_id)
+                results.append(ch_msg_id)
+            else:
+                logger.error("Error sending %s: %s", message.sender_ref, item)
+                results.append(False)
+        return results
+
     def get_messages(self):
         raise NotImplementedError()
 
@@ -107,26 +177,27 @@ class HttpApiChannel:
         Good thing - it could be moved to a subclass easily, preserving the core
         intergov pureness
         """
-        old_token_exp = getattr(self, "_cognito_jwt_expiration_date", None)
-        old_token_value = getattr(self, "_cognito_jwt", None)
+        with self._cognito_jwt_lock:
+            old_token_exp = getattr(self, "_cognito_jwt_expiration_date", None)
+            old_token_value = getattr(self, "_cognito_jwt", None)
 
-        if old_token_exp and old_token_exp < datetime.datetime.utcnow():
-            old_token_value = None
+            if old_token_exp and old_token_exp < datetime.datetime.utcnow():
+                old_token_value = None
 
-        if old_token_value:
-            # cache hit
-            return old_token_value
+            if old_token_value:
+                # cache hit
+                return old_token_value
 
-        new_token, expires = self._issue_cognito_jwt()
-        self._cognito_jwt = new_token
-        if expires < 60:
-            seconds_to_renew = int(expires / 2)
-        else:
-            seconds_to_renew = expires - 60
-        self._cognito_jwt_expiration_date = (
-            datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds_to_renew)
-        )
-        return new_token
+            new_token, expires = self._issue_cognito_jwt()
+            self._cognito_jwt = new_token
+            if expires < 60:
+                seconds_to_renew = int(expires / 2)
+            else:
+                seconds_to_renew = expires - 60
+            self._cognito_jwt_expiration_date = (
+                datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds_to_renew)
+            )
+            return new_token
 
     def _issue_cognito_jwt(self):
         # see _get_cached_cognito_jwt descr about the design concerns
@@ -151,7 +222,7 @@ class HttpApiChannel:
         cognito_auth = base64.b64encode(
             f"{OAUTH_CLIENT_ID}:{OAUTH_CLIENT_SECRET}".encode("utf-8")
         ).decode("utf-8")
-        token_resp = requests.post(
+        token_resp = http_client.post(
             TOKEN_URL,
             data={
                 "grant_type": "client_credentials",
@@ -196,6 +267,6 @@ def _oidc_token_url():
             "HttpApiChannel uses Cognito/JWT auth but you haven't configured "
             "env variables correctly, and they are required to issue the token"
         )
-    wellknown_content = requests.get(wnurl)
+    wellknown_content = http_client.get(wnurl)
     assert wellknown_content.status_code == 200
     return wellknown_content.json().get("token_endpoint")
@@ -0,0 +1,309 @@
+"""
+Routing table is a list of rules like
+
+    {
+        "Id": "...",
+        "Name": "...",
+        "Jurisdiction": "SG",  # receiver
+        "ChannelUrl": "...",
+        ...
+    }
+
+in the order of preference. RoutingIndex compiles it to dicts,
+so the rules for the receiver (or the rule by Id) are found without
+scanning the whole table for each message.
+
+Rules may also have the optional keys:
+
+    "Match": {
+        # predicate prefix, whole dot separated segments
+        # ("UN.CEFACT.Trade" matches "UN.CEFACT.Trade.CertificateOfOrigin.created"
+        # but not "UN.CEFACT.TradeX"); string or list
+        "predicate": "UN.CEFACT.Trade",
+        # regular expression matched from the subject start
+        "subject": "AU\\.abn:",
+        # string or list
+        "sender": ["AU", "NZ"],
+    },
+    # for the rules matching the message equally well
+    "Weight": 3,
+
+Rules with the longer predicate prefix matched are preferred; the rules
+matching equally well are used in the routing table order, unless any
+of them has the Weight - then the order is random, proportional to the
+weights (1 by default, 0 means "only if others fail"), so the load is
+spread between the channels.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from intergov.conf import string_or_b64kms
+from intergov.loggers import logging
+
+logger = logging.getLogger(__name__)
+
+ROUTING_TABLE_ENV = "IGL_MCHR_ROUTING_TABLE"
+# path of the JSON file with the routing table, used instead of the env variable if set
+ROUTING_TABLE_FILE_ENV = "IGL_MCHR_ROUTING_TABLE_FILE"
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _predicate_segments(predicate):
+    return [segment for segment in str(predicate).split('.') if segment]
+
+
+class PredicateTrie:
+    """
+    Rules by their predicate prefixes, split to segments, so the rules
+    for the message predicate are found in O(predicate depth)
+    """
+
+    def __init__(self):
+        self.rules = []
+        self.children = {}
+
+    def add(self, prefix_segments, item):
+        node = self
+        for segment in prefix_segments:
+            node = node.children.setdefault(segment, PredicateTrie())
+        node.rules.append(item)
+
+    def find(self, predicate):
+        """
+        Returns list of (depth, item) for all the prefixes of the predicate
+        """
+        found = [(0, item) for item in self.rules]
+        node = self
+        for depth, segment in enumerate(_predicate_segments(predicate), 1):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            found += [(depth, item) for item in node.rules]
+        return found
+
+
+class _CompiledMatch:
+    """
+    Subject and sender conditions of the rule "Match"
+    """
+
+    def __init__(self, match):
+        subject = match.get("subject")
+        self.subject = re.compile(subject) if subject else None
+        self.senders = set(str(sender) for sender in _as_list(match.get("sender")))
+
+    def __call__(self, message):
+        if self.senders and str(message.sender) not in self.senders:
+            return False
+        if self.subject is not None and not self.subject.match(str(message.subject)):
+            return False
+        return True
+
+
+def _weighted_order(rules):
+    """
+    Random order, the rule with bigger weight is more likely to be earlier
+    (weighted sampling without replacement)
+    """
+    keyed = []
+    for rule in rules:
+        weight = float(rule.get("Weight", 1))
+        key = random.random() ** (1 / weight) if weight > 0 else -1
+        keyed.append((key, rule))
+    keyed.sort(key=lambda pair: pair[0], reverse=True)
+    return [rule for key, rule in keyed]
+
+
+class RoutingIndex:
+    """
+    Routing table indexed by the receiver jurisdiction and the channel Id.
+
+    prepare_rule(rule) is called for each rule when the index is built
+    (to create the channel instance, for example).
+    Iterating over the index gives the rules in the original order.
+    Version is increased every time the index is (re)built.
+    """
+
+    version = 0
+
+    def __init__(self, routing_table, prepare_rule=None):
+        self.prepare_rule = prepare_rule
+        self._build(routing_table)
+
+    def _build(self, routing_table):
+        rules = []
+        by_jurisdiction = {}
+        by_id = {}
+        tries = {}
+        for position, rule in enumerate(routing_table or []):
+            if self.prepare_rule:
+                self.prepare_rule(rule)
+            rules.append(rule)
+            jurisdiction = rule.get("Jurisdiction")
+            by_jurisdiction.setdefault(jurisdiction, []).append(rule)
+            if "Id" in rule:
+                # the first one wins, as the linear search did
+                by_id.setdefault(rule["Id"], rule)
+            match = rule.get("Match") or {}
+            trie = tries.setdefault(jurisdiction, PredicateTrie())
+            item = (position, rule, _CompiledMatch(match))
+            for prefix in _as_list(match.get("predicate")) or [""]:
+                trie.add(_predicate_segments(prefix), item)
+        # replaced at once, so readers see either old or new index
+        self._rules, self._by_jurisdiction, self._by_id, self._tries = (
+            rules, by_jurisdiction, by_id, tries
+        )
+        self.version += 1
+
+    def for_receiver(self, jurisdiction):
+        """
+        Rules for the receiver jurisdiction, in the order of preference
+        """
+        return self._by_jurisdiction.get(str(jurisdiction), [])
+
+    def for_message(self, message):
+        """
+        Rules matching the message (receiver and the "Match" conditions),
+        in the order of preference
+        """
+        trie = self._tries.get(str(message.receiver))
+        if trie is None:
+            return []
+        # {position: (depth, rule)}, the deepest match of each rule
+        matched = {}
+        for depth, (position, rule, match) in trie.find(message.predicate):
+            if position in matched and matched[position][0] >= depth:
+                continue
+            if match(message):
+                matched[position] = (depth, rule)
+        tiers = {}
+        for position in sorted(matched):
+            depth, rule = matched[position]
+            tiers.setdefault(depth, []).append(rule)
+        result = []
+        for depth in sorted(tiers, reverse=True):
+            tier = tiers[depth]
+            if any("Weight" in rule for rule in tier):
+                tier = _weighted_order(tier)
+            result += tier
+        return result
+
+    def get_by_id(self, channel_id):
+        return self._by_id.get(channel_id)
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, [rule.get("Id") for rule in self._rules])
+
+
+def read_routing_table_source():
+    """
+    Raw (not decoded) routing table configuration:
+    the file content if the file is configured, the env variable value otherwise
+    """
+    return read_routing_table_file() or os.environ.get(ROUTING_TABLE_ENV)
+
+
+def read_routing_table_file():
+    """
+    Raw routing table from the IGL_MCHR_ROUTING_TABLE_FILE file,
+    None if the file is not configured
+    """
+    path = os.environ.get(ROUTING_TABLE_FILE_ENV)
+    if not path:
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def parse_routing_table(source):
+    if not source:
+        return []
+    return json.loads(string_or_b64kms(source))
+
+
+class ReloadingRoutingIndex(RoutingIndex):
+    """
+    RoutingIndex built from the routing table configuration
+    (see read_routing_table_source). Only the IGL_MCHR_ROUTING_TABLE_FILE
+    file can be reloaded: it is checked for changes at most once
+    per check_interval seconds and the index is rebuilt if changed,
+    so the running workers pick up the new table without restart.
+    Env variables can't change in a running process, so the table from
+    IGL_MCHR_ROUTING_TABLE is read once and never checked again.
+    Broken configuration is logged and the old index is kept.
+    """
+
+    def __init__(self, prepare_rule=None, check_interval=10, source=None):
+        if source is None and os.environ.get(ROUTING_TABLE_FILE_ENV):
+            source = read_routing_table_file
+        self.source = source
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        if self.source is None:
+            logger.warning(
+                "%s is not set, the routing table won't be reloaded",
+                ROUTING_TABLE_FILE_ENV
+            )
+            self._source_value = read_routing_table_source()
+        else:
+            self._source_value = self.source()
+        self._checked_at = time.monotonic()
+        super().__init__(parse_routing_table(self._source_value), prepare_rule=prepare_rule)
+
+    def reload_if_changed(self):
+        """
+        Returns True if the index has been rebuilt
+        """
+        if self.source is None:
+            return False
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return False
+            self._checked_at = time.monotonic()
+            try:
+                source_value = self.source()
+                if source_value == self._source_value:
+                    return False
+                self._build(parse_routing_table(source_value))
+            except Exception as e:
+                logger.error("Unable to reload the routing table, the old one is used")
+                logger.exception(e)
+                return False
+            self._source_value = source_value
+            logger.info("The routing table has been reloaded: %r", self)
+            return True
+
+    def for_receiver(self, jurisdiction):
+        self.reload_if_changed()
+        return super().for_receiver(jurisdiction)
+
+    def for_message(self, message):
+        self.reload_if_changed()
+        return super().for_message(message)
+
+    def get_by_id(self, channel_id):
+        self.reload_if_changed()
+        return super().get_by_id(channel_id)
+
+    def __iter__(self):
+        self.reload_if_changed()
+        return super().__iter__()
@@ -261,7 +261,31 @@ def env_postgres_config(prefix):
         'dbname': env(
             f'IGL_{prefix}_DBNAME',
             default=env('IGL_DEFAULT_POSTGRES_DBNAME', default=None)
-        )
+        ),
+        # connection pool of the process
+        'pool_size': int(env(
+            f'IGL_{prefix}_POOL_SIZE',
+            default=env('IGL_DEFAULT_POSTGRES_POOL_SIZE', default=5)
+        )),
+        'max_overflow': int(env(
+            f'IGL_{prefix}_POOL_MAX_OVERFLOW',
+            default=env('IGL_DEFAULT_POSTGRES_POOL_MAX_OVERFLOW', default=10)
+        )),
+        # seconds, connections are re-created after that
+        'pool_recycle': int(env(
+            f'IGL_{prefix}_POOL_RECYCLE',
+            default=env('IGL_DEFAULT_POSTGRES_POOL_RECYCLE', default=1800)
+        )),
+        # check the connection before use, so DB restarts don't break the workers
+        'pool_pre_ping': env_bool(
+            f'IGL_{prefix}_POOL_PRE_PING',
+            default=env('IGL_DEFAULT_POSTGRES_POOL_PRE_PING', default=True)
+        ),
+        # create tables and apply migrations on start
+        'create_schema': env_bool(
+            f'IGL_{prefix}_CREATE_SCHEMA',
+            default=env('IGL_DEFAULT_POSTGRES_CREATE_SCHEMA', default=True)
+        ),
     }
 
     return config
@@ -11,7 +11,17 @@ with that exact value for that partiular attribute.
 The .blacklist(attr, value) method specifically blocks all messages
 with that particular value for that attribute.
 
+The .whitelist_prefix(attr, prefix) and .blacklist_prefix(attr, prefix)
+methods do the same for all values starting with the prefix
+("UN.CEFACT." for predicates, for example).
+
 Blacklist has higher precedence to order_any.
 Adding items to blacklist removes them from whitelist
 (and vica versa), so there is no sense in defining precedence between them.
+
+Values are compared as strings, so the message attributes
+(URI and Jurisdiction objects) match the plain string rules.
+The rules are compiled to frozensets and prefix tuples on first use
+after any change; .screen_messages(messages) screens the whole batch
+evaluating each distinct attribute value once.
 """
@@ -1,3 +1,40 @@
+def _normalise(value):
+    if value is None:
+        return ''
+    return str(value)
+
+
+class CompiledFieldRule:
+    """
+    Immutable rules of the single message field
+    """
+
+    def __init__(self, allow_any, whitelist, whitelist_prefixes, blacklist, blacklist_prefixes):
+        self.allow_any = allow_any
+        self.whitelist = frozenset(whitelist)
+        self.whitelist_prefixes = tuple(whitelist_prefixes)
+        self.blacklist = frozenset(blacklist)
+        self.blacklist_prefixes = tuple(blacklist_prefixes)
+
+    @property
+    def passes_all(self):
+        return self.allow_any and not self.blacklist and not self.blacklist_prefixes
+
+    def blocks(self, value):
+        """
+        Return True if the (normalised) value shall not pass.
+        """
+        if value in self.blacklist:
+            return True
+        if self.blacklist_prefixes and value.startswith(self.blacklist_prefixes):
+            return True
+        if self.allow_any or value in self.whitelist:
+            return False
+        if self.whitelist_prefixes and value.startswith(self.whitelist_prefixes):
+            return False
+        return True
+
+
 class DiscreteGenericMessageFilter:
     def __init__(self):
         self.fields = (
@@ -6,62 +43,101 @@ class DiscreteGenericMessageFilter:
         self._allow_any = {}
         self._whitelist = {}
         self._blacklist = {}
+        self._whitelist_prefixes = {}
+        self._blacklist_prefixes = {}
         for f in self.fields:
             self._allow_any[f] = False
-            self._whitelist[f] = []
-            self._blacklist[f] = []
+            self._whitelist[f] = set()
+            self._blacklist[f] = set()
+            self._whitelist_prefixes[f] = set()
+            self._blacklist_prefixes[f] = set()
+        self._compiled = None
 
-    def whitelist(self, field, value):
+    def _check_field(self, field):
         if field not in self.fields:
             raise Exception("invalid message field")
-        if value in self._blacklist[field]:
-            self._blacklist[field].remove(value)
-        if value not in self._whitelist[field]:
-            self._whitelist[field].append(value)
+        # any change makes the compiled rules outdated
+        self._compiled = None
+
+    def whitelist(self, field, value):
+        self._check_field(field)
+        value = _normalise(value)
+        self._blacklist[field].discard(value)
+        self._whitelist[field].add(value)
 
     def blacklist(self, field, value):
-        if field not in self.fields:
-            raise Exception("invalid message field")
-        if value in self._whitelist[field]:
-            self._whitelist[field].remove(value)
-        if value not in self._blacklist[field]:
-            self._blacklist[field].append(value)
+        self._check_field(field)
+        value = _normalise(value)
+        self._whitelist[field].discard(value)
+        self._blacklist[field].add(value)
+
+    def whitelist_prefix(self, field, prefix):
+        self._check_field(field)
+        prefix = _normalise(prefix)
+        self._blacklist_prefixes[field].discard(prefix)
+        self._whitelist_prefixes[field].add(prefix)
+
+    def blacklist_prefix(self, field, prefix):
+        self._check_field(field)
+        prefix = _normalise(prefix)
+        self._whitelist_prefixes[field].discard(prefix)
+        self._blacklist_prefixes[field].add(prefix)
 
     def allow_any(self, field):
-        if field not in self.fields:
-            raise Exception("invalid message field")
-        if not self._allow_any[field]:
-            self._allow_any[field] = True
+        self._check_field(field)
+        self._allow_any[field] = True
 
     def disallow_any(self, field):
-        if field not in self.fields:
-            raise Exception("invalid message field")
-        if self._allow_any[field]:
-            self._allow_any[field] = False
+        self._check_field(field)
+        self._allow_any[field] = False
+
+    def compile(self):
+        """
+        Return tuple of (field, CompiledFieldRule), cached until the next change.
+        """
+        compiled = self._compiled
+        if compiled is None:
+            compiled = tuple(
+                (field, CompiledFieldRule(
+                    self._allow_any[field],
+                    self._whitelist[field],
+                    self._whitelist_prefixes[field],
+                    self._blacklist[field],
+                    self._blacklist_prefixes[field],
+                ))
+                for field in self.fields
+            )
+            self._compiled = compiled
+        return compiled
 
     def screen_message(self, msg):
         """
         Return True if the message shall not pass.
         """
-        # block all messages if a field is neither allow_any or whitelisted
-        for field in self.fields:
-            if not self._allow_any[field]:
-                if field not in self._whitelist.keys():
-                    return True
-
-        # blacklist has presedence over allow_any
-        for field in self.fields:
-            if msg.kwargs[field] in self._blacklist[field]:
+        for field, rule in self.compile():
+            if rule.passes_all:
+                continue
+            if rule.blocks(_normalise(msg.kwargs.get(field))):
                 return True
+        return False
 
-        # block if neither allow_any or whitelisted
-        for field in self.fields:
-            if self._allow_any[field]:
+    def screen_messages(self, messages):
+        """
+        Return list of booleans, True for each message which shall not pass.
+        """
+        messages = list(messages)
+        mask = [False] * len(messages)
+        for field, rule in self.compile():
+            if rule.passes_all:
                 continue
-            else:
-                if msg.kwargs[field] in self._whitelist[field]:
+            # batches have few distinct senders, receivers and predicates
+            decisions = {}
+            for i, msg in enumerate(messages):
+                if mask[i]:
                     continue
-                else:
-                    return True
-
-        return False
+                value = _normalise(msg.kwargs.get(field))
+                blocked = decisions.get(value)
+                if blocked is None:
+                    blocked = decisions[value] = rule.blocks(value)
+                mask[i] = blocked
+        return mask
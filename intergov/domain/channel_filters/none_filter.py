@@ -4,3 +4,6 @@ class NoneFilter:
     """
     def screen_message(self, msg):
         return False
+
+    def screen_messages(self, messages):
+        return [False] * len(list(messages))
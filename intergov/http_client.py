@@ -0,0 +1,113 @@
+"""
+Shared HTTP client for all the outbound requests (channels, callbacks,
+message APIs of other components and so on).
+
+Module level requests.get/post open the new connection (and do the TLS
+handshake) for every call and wait for the response forever by default.
+The session from this module keeps connections to each host in the pool,
+retries connection errors (and gateway errors for the idempotent methods)
+and has the default timeout, so the hung server can't stall the worker.
+
+Usage is the same as for requests:
+
+    from intergov import http_client
+    resp = http_client.post(url, json=payload)
+
+Timeout passed explicitly wins over the default one.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from intergov.conf import env
+
+# seconds, (connect, read)
+DEFAULT_TIMEOUT = (
+    float(env('IGL_HTTP_CONNECT_TIMEOUT', default=5)),
+    float(env('IGL_HTTP_READ_TIMEOUT', default=30)),
+)
+# number of hosts to keep the connections to
+POOL_CONNECTIONS = int(env('IGL_HTTP_POOL_CONNECTIONS', default=20))
+# number of connections kept for each host
+POOL_MAXSIZE = int(env('IGL_HTTP_POOL_MAXSIZE', default=20))
+RETRIES = int(env('IGL_HTTP_RETRIES', default=2))
+RETRY_BACKOFF_FACTOR = float(env('IGL_HTTP_RETRY_BACKOFF_FACTOR', default=0.3))
+RETRY_STATUSES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    """
+    requests.Session with the default timeout
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def create_session(
+    timeout=DEFAULT_TIMEOUT,
+    retries=RETRIES,
+    pool_connections=POOL_CONNECTIONS,
+    pool_maxsize=POOL_MAXSIZE
+):
+    """
+    New session with the pooled, retrying adapters.
+    Use get_session unless the different settings are needed.
+    """
+    session = TimeoutSession(timeout=timeout)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        # the last response is returned, it's up to the caller what to do with it
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """
+    The session shared by the whole process (and all its threads)
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def request(method, url, **kwargs):
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    return request('GET', url, params=params, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def patch(url, data=None, **kwargs):
+    return request('PATCH', url, data=data, **kwargs)
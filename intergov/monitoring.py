@@ -65,7 +65,22 @@ class statsd_timer():
 
 
 def statsd_gauge(name, value):
-    raise NotImplementedError()
+    """
+    Sends the current value of something (queue length, state)
+    to all backends configured for this setup
+    """
+    try:
+        if not isinstance(value, (float, int)):
+            value = float(value)
+        if ig_conf.PRINT_CONSOLE_METRICS:
+            print(f"\t{name}:\t{value}")
+        if ig_conf.STATSD_HOST:
+            gauge = statsd.Gauge(ig_conf.STATSD_PREFIX)
+            gauge.send(name, value)
+        if ig_conf.SEND_CLOUDWATCH_METRICS:
+            _send_cloudwatch_metric(name, value, unit="None")
+    except Exception as e:
+        logger.exception(e)
 
 
 def _send_cloudwatch_metric(name, value, unit):
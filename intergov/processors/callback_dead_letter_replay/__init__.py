@@ -0,0 +1,95 @@
+"""
+* Get the callback delivery jobs dropped after max retries
+  from the CallbackDeadLetterRepo
+* Put them back to the delivery outbox at the controlled rate
+
+Is started by hand when the subscriber is back after the outage,
+stops when there is nothing left to replay:
+
+    IGL_PROC_DEAD_LETTER_REPLAY_HOST=subscriber.example.com \\
+    PYTHONPATH="`pwd`" python intergov/processors/callback_dead_letter_replay/__init__.py
+"""
+import time
+
+from libtrustbridge.utils.conf import env_queue_config
+
+from intergov.conf import env, env_s3_config
+from intergov.repos.callback_dead_letters import CallbackDeadLetterRepo
+from intergov.repos.delivery_outbox import DeliveryOutboxRepo
+from intergov.use_cases import ReplayCallbackDeadLettersUseCase
+
+from intergov.loggers import logging
+
+logger = logging.getLogger('callback_dead_letter_replay')
+
+
+class CallbackDeadLetterReplayer(object):
+    """
+    Iterate over ReplayCallbackDeadLettersUseCase,
+    no more than RATE jobs per second
+    """
+
+    # replay jobs of this callback host only, all of them if empty
+    HOST = env('IGL_PROC_DEAD_LETTER_REPLAY_HOST', default='') or None
+    BATCH_SIZE = int(env('IGL_PROC_DEAD_LETTER_REPLAY_BATCH_SIZE', default=100))
+    # jobs per second
+    RATE = float(env('IGL_PROC_DEAD_LETTER_REPLAY_RATE', default=50))
+
+    def __init__(self, dead_letter_repo_conf=None, delivery_outbox_repo_conf=None, host=None):
+        self.host = host or self.HOST
+        self._prepare_dead_letter_repo(dead_letter_repo_conf)
+        self._prepare_delivery_outbox_repo(delivery_outbox_repo_conf)
+        self._prepare_use_case()
+        self._next_batch_at = 0
+
+    def _prepare_dead_letter_repo(self, conf):
+        dead_letter_repo_conf = env_s3_config('PROC_CALLBACK_DEAD_LETTERS')
+        if conf:
+            dead_letter_repo_conf.update(conf)
+        self.dead_letter_repo = CallbackDeadLetterRepo(dead_letter_repo_conf)
+
+    def _prepare_delivery_outbox_repo(self, conf):
+        delivery_outbox_repo_conf = env_queue_config('PROC_DELIVERY_OUTBOX_REPO')
+        if conf:
+            delivery_outbox_repo_conf.update(conf)
+        self.delivery_outbox_repo = DeliveryOutboxRepo(delivery_outbox_repo_conf)
+
+    def _prepare_use_case(self):
+        self.use_case = ReplayCallbackDeadLettersUseCase(
+            dead_letter_repo=self.dead_letter_repo,
+            delivery_outbox_repo=self.delivery_outbox_repo,
+            host=self.host,
+            batch_size=self.BATCH_SIZE,
+        )
+
+    def __iter__(self):
+        logger.info("Starting the CallbackDeadLetterReplayer, host: %s", self.host or "any")
+        return self
+
+    def __next__(self):
+        # previous batch has taken its share of the rate
+        wait = self._next_batch_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            result = self.use_case.execute()
+        except Exception as e:
+            logger.exception(e)
+            result = None
+        if result and self.RATE > 0:
+            self._next_batch_at = time.monotonic() + result / self.RATE
+        return result
+
+
+if __name__ == '__main__':   # pragma: no cover
+    total = 0
+    for result in CallbackDeadLetterReplayer():
+        if result is None:
+            # failed, try again a bit later
+            time.sleep(5)
+            continue
+        if not result:
+            break
+        total += result
+        logger.info("%s dead letters replayed", total)
+    logger.info("Done, %s dead letters replayed", total)
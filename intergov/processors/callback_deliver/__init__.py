@@ -1,29 +1,130 @@
 import time
 
+from intergov.conf import env, env_bool, env_s3_config
 from intergov.loggers import logging
 from libtrustbridge.utils.conf import env_queue_config
-from libtrustbridge.websub.processors import Processor
-from libtrustbridge.websub.repos import DeliveryOutboxRepo
 
+from intergov.rate_limiter import CallbackRateLimiter, get_store
+from intergov.repos.callback_dead_letters import CallbackDeadLetterRepo
+from intergov.repos.callback_payloads import CallbackPayloadRepo
+from intergov.repos.delivery_outbox import DeliveryOutboxRepo
 from intergov.use_cases import DeliverCallbackUseCase
 
 logger = logging.getLogger('callback_deliver')
 
 
+class CallbacksDeliveryProcessor:
+    """
+    Iterate over the DeliverCallbackUseCase.
+
+    If batch size is greater than 1 then jobs are received from the
+    delivery outbox using long polling, up to batch size jobs at once,
+    delivered by the pool of workers (no more than per host limit
+    callbacks to the same host at once), then deleted and re-posted
+    using batch calls.
+
+    Rate limits are shared with the other deliverers using
+    the same IGL_PROC_DELIVERY_RATE_LIMIT_STORE file.
+
+    CALLBACK_PAYLOADS must be enabled if the callbacks spreader has it,
+    so the payloads stored by the spreader are read from the payload bucket.
+    """
+
+    # 1 means the old one-by-one mode
+    BATCH_SIZE = int(env('IGL_PROC_DELIVERY_BATCH_SIZE', default=1))
+    BATCH_WAIT_SECONDS = int(env('IGL_PROC_DELIVERY_BATCH_WAIT_SECONDS', default=20))
+    WORKERS = int(env('IGL_PROC_DELIVERY_WORKERS', default=10))
+    PER_HOST_LIMIT = int(env('IGL_PROC_DELIVERY_PER_HOST_LIMIT', default=4))
+    # save jobs dropped after max retries, see callback_dead_letter_replay;
+    # the bucket is configured by IGL_PROC_CALLBACK_DEAD_LETTERS_* variables
+    DEAD_LETTERS = env_bool('IGL_PROC_DELIVERY_DEAD_LETTERS', default=False)
+    CALLBACK_PAYLOADS = env_bool('IGL_CALLBACK_PAYLOADS', default=False)
+
+    def _prepare_delivery_outbox_repo(self, conf):
+        delivery_outbox_repo_conf = env_queue_config('PROC_DELIVERY_OUTBOX_REPO')
+        if conf:
+            delivery_outbox_repo_conf.update(conf)
+        self.delivery_outbox_repo = DeliveryOutboxRepo(delivery_outbox_repo_conf)
+
+    def _prepare_dead_letter_repo(self, conf):
+        self.dead_letter_repo = None
+        if not self.DEAD_LETTERS:
+            return
+        dead_letter_repo_conf = env_s3_config('PROC_CALLBACK_DEAD_LETTERS')
+        if conf:
+            dead_letter_repo_conf.update(conf)
+        self.dead_letter_repo = CallbackDeadLetterRepo(dead_letter_repo_conf)
+
+    def _prepare_payload_repo(self, conf):
+        self.payload_repo = None
+        if not self.CALLBACK_PAYLOADS:
+            return
+        payload_repo_conf = env_s3_config('PROC_CALLBACK_PAYLOADS')
+        if conf:
+            payload_repo_conf.update(conf)
+        self.payload_repo = CallbackPayloadRepo(payload_repo_conf)
+
+    def _prepare_use_cases(self):
+        self.uc = DeliverCallbackUseCase(
+            delivery_outbox_repo=self.delivery_outbox_repo,
+            workers=self.WORKERS if self.batch_size > 1 else 0,
+            per_host_limit=self.PER_HOST_LIMIT,
+            rate_limiter=CallbackRateLimiter(get_store()),
+            dead_letter_repo=self.dead_letter_repo,
+            payload_repo=self.payload_repo,
+        )
+
+    def __init__(
+        self,
+        delivery_outbox_repo_conf=None,
+        dead_letter_repo_conf=None,
+        batch_size=None,
+        batch_wait_seconds=None,
+        payload_repo_conf=None
+    ):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        if batch_wait_seconds is None:
+            batch_wait_seconds = self.BATCH_WAIT_SECONDS
+        self.batch_wait_seconds = batch_wait_seconds
+        self._prepare_delivery_outbox_repo(delivery_outbox_repo_conf)
+        self._prepare_dead_letter_repo(dead_letter_repo_conf)
+        self._prepare_payload_repo(payload_repo_conf)
+        self._prepare_use_cases()
+
+    def __iter__(self):
+        logger.info("Starting the callback deliverer")
+        return self
+
+    def __next__(self):
+        try:
+            if self.batch_size > 1:
+                result = self.uc.execute_batch(
+                    self.batch_size,
+                    wait_time_seconds=self.batch_wait_seconds
+                )
+            else:
+                result = self.uc.execute()
+        except Exception as e:
+            logger.exception(e)
+            result = None
+            if self.batch_size > 1:
+                # the main loop doesn't sleep in the batch mode,
+                # so don't let failing queue connection spin it
+                time.sleep(1)
+        return result
+
+
 def get_processor():
-    delivery_outbox_repo_conf = env_queue_config('PROC_DELIVERY_OUTBOX_REPO')
-    delivery_outbox_repo = DeliveryOutboxRepo(delivery_outbox_repo_conf)
-    use_case = DeliverCallbackUseCase(
-        delivery_outbox_repo=delivery_outbox_repo,
-    )
-    return Processor(use_case=use_case)
+    return CallbacksDeliveryProcessor()
 
 
 if __name__ == '__main__':  # pragma: no cover
     # To start it manually, from the base dir:
     # PYTHONPATH="`pwd`" python intergov/processors/callback_deliver/__init__.py
-    for result in get_processor():
+    processor = get_processor()
+    for result in processor:
         # no message was processed, might not have been any, sleep
-        # or the exception has been raised, sleep as well
-        if result is None:
+        # or the exception has been raised, sleep as well;
+        # in the batch mode the queue is long-polled already
+        if result is None and processor.batch_size <= 1:
             time.sleep(1)
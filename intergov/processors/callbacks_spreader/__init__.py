@@ -1,9 +1,12 @@
 import time
 
-from libtrustbridge.websub.repos import NotificationsRepo, DeliveryOutboxRepo, SubscriptionsRepo
+from libtrustbridge.websub.repos import NotificationsRepo, SubscriptionsRepo
 
-from intergov.conf import env_s3_config, env_queue_config
+from intergov.conf import env, env_bool, env_s3_config, env_queue_config
 
+from intergov.repos.callback_payloads import CallbackPayloadRepo
+from intergov.repos.delivery_outbox import DeliveryOutboxRepo
+from intergov.repos.subscriptions import SubscriptionsChangesRepo, SubscriptionsIndex
 from intergov.use_cases import (
     DispatchMessageToSubscribersUseCase,
 )
@@ -17,8 +20,26 @@ class CallbacksSpreaderProcessor(object):
     """
     Convert each incoming message to set of messages containing (websub_url, message)
     so they may be sent and fail separately
+
+    Subscribers are cached by the predicate for SUBSCRIPTIONS_INDEX_TTL seconds;
+    with SUBSCRIPTIONS_CHANGES enabled (the subscriptions API must have it too)
+    the changed predicates are dropped from the cache within
+    SUBSCRIPTIONS_CHANGES_CHECK_INTERVAL seconds.
+
+    Jobs are posted to the delivery outbox in batches. With CALLBACK_PAYLOADS
+    enabled (the callback deliverers must have it too) payloads bigger than
+    PAYLOAD_SIZE_LIMIT bytes are stored once to the payload bucket,
+    so jobs for all the subscribers have just the key.
     """
 
+    # 0 disables the cache, so every message looks up the subscriptions repo
+    SUBSCRIPTIONS_INDEX_TTL = int(env('IGL_PROC_SUB_INDEX_TTL', default=30))
+    SUBSCRIPTIONS_INDEX_MAX_NODES = int(env('IGL_PROC_SUB_INDEX_MAX_NODES', default=10000))
+    SUBSCRIPTIONS_CHANGES = env_bool('IGL_SUBSCR_CHANGES', default=False)
+    SUBSCRIPTIONS_CHANGES_CHECK_INTERVAL = int(env('IGL_PROC_SUB_CHANGES_CHECK_INTERVAL', default=5))
+    CALLBACK_PAYLOADS = env_bool('IGL_CALLBACK_PAYLOADS', default=False)
+    PAYLOAD_SIZE_LIMIT = int(env('IGL_PROC_SUB_PAYLOAD_SIZE_LIMIT', default=16 * 1024))
+
     def _prepare_notifications_repo(self, conf):
         notifications_repo_conf = env_queue_config('PROC_OBJ_OUTBOX_REPO')
         if conf:
@@ -37,22 +58,60 @@ class CallbacksSpreaderProcessor(object):
             subscriptions_repo_conf.update(conf)
         self.subscriptions_repo = SubscriptionsRepo(subscriptions_repo_conf)
 
+    def _prepare_subscriptions_changes_repo(self, conf):
+        self.subscriptions_changes_repo = None
+        if not self.SUBSCRIPTIONS_CHANGES:
+            return
+        subscriptions_changes_repo_conf = env_s3_config('PROC_SUB_CHANGES_REPO')
+        if conf:
+            subscriptions_changes_repo_conf.update(conf)
+        self.subscriptions_changes_repo = SubscriptionsChangesRepo(subscriptions_changes_repo_conf)
+
+    def _prepare_payload_repo(self, conf):
+        self.payload_repo = None
+        if not self.CALLBACK_PAYLOADS:
+            return
+        payload_repo_conf = env_s3_config('PROC_CALLBACK_PAYLOADS')
+        if conf:
+            payload_repo_conf.update(conf)
+        self.payload_repo = CallbackPayloadRepo(payload_repo_conf)
+
+    def _prepare_subscriptions_index(self):
+        self.subscriptions_index = None
+        if self.SUBSCRIPTIONS_INDEX_TTL <= 0:
+            return
+        self.subscriptions_index = SubscriptionsIndex(
+            self.subscriptions_repo,
+            changes_repo=self.subscriptions_changes_repo,
+            ttl=self.SUBSCRIPTIONS_INDEX_TTL,
+            check_interval=self.SUBSCRIPTIONS_CHANGES_CHECK_INTERVAL,
+            max_nodes=self.SUBSCRIPTIONS_INDEX_MAX_NODES,
+        )
+
     def _prepare_use_cases(self):
         self.uc = DispatchMessageToSubscribersUseCase(
             notifications_repo=self.notifications_repo,
             delivery_outbox_repo=self.delivery_outbox_repo,
             subscriptions_repo=self.subscriptions_repo,
+            subscriptions_index=self.subscriptions_index,
+            payload_repo=self.payload_repo,
+            payload_size_limit=self.PAYLOAD_SIZE_LIMIT,
         )
 
     def __init__(
         self,
         notifications_repo_conf=None,
         delivery_outbox_repo_conf=None,
-        subscriptions_repo_conf=None
+        subscriptions_repo_conf=None,
+        subscriptions_changes_repo_conf=None,
+        payload_repo_conf=None
     ):
         self._prepare_notifications_repo(notifications_repo_conf)
         self._prepare_outbox_repo(delivery_outbox_repo_conf)
         self._prepare_subscriptions_repo(subscriptions_repo_conf)
+        self._prepare_subscriptions_changes_repo(subscriptions_changes_repo_conf)
+        self._prepare_subscriptions_index()
+        self._prepare_payload_repo(payload_repo_conf)
         self._prepare_use_cases()
 
     def __iter__(self):
@@ -1,7 +1,7 @@
 import time
-import requests
 from http import HTTPStatus
 
+from intergov import http_client
 from intergov.conf import env_queue_config
 from intergov.repos.channel_pending_message import ChannelPendingMessageRepo
 from intergov.repos.message_updates import MessageUpdatesRepo
@@ -42,7 +42,7 @@ class ChannelPollerWorker:
         return False
 
     def _poll_memory_channel(self, payload):
-        resp = requests.get(payload['channel_response']['link'])
+        resp = http_client.get(payload['channel_response']['link'])
         if resp.status_code != HTTPStatus.OK:
             raise RuntimeError("Can't get batch status")
         data = resp.json()
@@ -1,7 +1,7 @@
 import time
 
 from intergov.repos.bc_inbox.elasticmq.elasticmqrepo import BCInboxRepo
-from intergov.conf import env, env_s3_config, env_queue_config, env_postgres_config
+from intergov.conf import env, env_bool, env_s3_config, env_queue_config, env_postgres_config
 from intergov.repos.api_outbox import ApiOutboxRepo
 from intergov.repos.message_lake import MessageLakeRepo
 from intergov.repos.object_acl import ObjectACLRepo
@@ -17,8 +17,21 @@ logger = logging.getLogger('message_processor')
 class InboundMessageProcessor(object):
     """
     Efficiently iterate over the ProcessMessageUseCase.
+
+    If batch size is greater than 1 then messages are received from the
+    bc_inbox using long polling, up to batch size messages at once,
+    and deleted using a single batch call.
     """
 
+    # 1 means the old one-by-one mode
+    BATCH_SIZE = int(env('IGL_PROC_BC_INBOX_BATCH_SIZE', default=1))
+    BATCH_WAIT_SECONDS = int(env('IGL_PROC_BC_INBOX_BATCH_WAIT_SECONDS', default=20))
+    # 0 or 1 means side effects of each message are done one by one
+    SIDE_EFFECTS_WORKERS = int(env('IGL_PROC_MESSAGE_SIDE_EFFECTS_WORKERS', default=0))
+    # record completed steps next to the message in the message lake
+    # so redelivered messages don't repeat them
+    STEP_JOURNAL = env_bool('IGL_PROC_MESSAGE_STEP_JOURNAL', default=False)
+
     def _prepare_bc_inbox_repo(self, conf):
         bc_inbox_repo_conf = env_queue_config('PROC_BC_INBOX')
         if conf:
@@ -64,6 +77,8 @@ class InboundMessageProcessor(object):
             object_retreval_repo=self.object_retrieval_repo,
             notifications_repo=self.notifications_repo,
             blockchain_outbox_repo=self.blockchain_outbox_repo,
+            side_effects_workers=self.SIDE_EFFECTS_WORKERS,
+            step_journal_repo=self.message_lake_repo if self.STEP_JOURNAL else None,
         )
 
     def __init__(
@@ -73,8 +88,14 @@ class InboundMessageProcessor(object):
         object_acl_repo_conf=None,
         object_retrieval_repo_conf=None,
         notifications_repo_conf=None,
-        blockchain_outbox_repo_conf=None
+        blockchain_outbox_repo_conf=None,
+        batch_size=None,
+        batch_wait_seconds=None
     ):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        if batch_wait_seconds is None:
+            batch_wait_seconds = self.BATCH_WAIT_SECONDS
+        self.batch_wait_seconds = batch_wait_seconds
         self._prepare_bc_inbox_repo(bc_inbox_repo_conf)
         self._prepare_message_lake_repo(message_lake_repo_conf)
         self._prepare_object_acl_repo(object_acl_repo_conf)
@@ -89,14 +110,26 @@ class InboundMessageProcessor(object):
 
     def __next__(self):
         try:
-            result = self.uc.execute()
+            if self.batch_size > 1:
+                result = self.uc.execute_batch(
+                    self.batch_size,
+                    wait_time_seconds=self.batch_wait_seconds
+                )
+            else:
+                result = self.uc.execute()
         except Exception as e:
             logger.exception(e)
             result = None
+            if self.batch_size > 1:
+                # the main loop doesn't sleep in the batch mode,
+                # so don't let failing queue connection spin it
+                time.sleep(1)
         return result
 
 
 if __name__ == '__main__':   # pragma: no cover
-    for result in InboundMessageProcessor():
-        if result is None:
+    processor = InboundMessageProcessor()
+    for result in processor:
+        # in the batch mode the queue is long-polled already
+        if result is None and processor.batch_size <= 1:
             time.sleep(1)
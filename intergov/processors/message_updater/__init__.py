@@ -1,6 +1,6 @@
 import time
-import requests
 from http import HTTPStatus
+from intergov import http_client
 from intergov.apis.common.interapi_auth import AuthMixin
 from intergov.conf import env_queue_config
 from intergov.domain.wire_protocols import generic_discrete as gd
@@ -66,7 +66,7 @@ class MessageUpdater(AuthMixin, object):
             sender_ref,
             patch_payload
         )
-        resp = requests.patch(
+        resp = http_client.patch(
             MESSAGE_PATCH_API_ENDPOINT.format(
                 sender=sender,
                 sender_ref=sender_ref
@@ -10,15 +10,19 @@ local storage - postgres for example (and for the demo)
 """
 import random
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from intergov.conf import env_json, env_postgres_config, env_queue_config
+from intergov.conf import env, env_json, env_postgres_config, env_queue_config
+from intergov.channels.concurrency import ConcurrencyLimitedChannel
 from intergov.channels.http_api_channel import HttpApiChannel
+from intergov.channels.routing import ReloadingRoutingIndex, RoutingIndex
 from intergov.repos.api_outbox import ApiOutboxRepo
 from intergov.repos.api_outbox.postgres_objects import Message as PostgresMessageRepr
 from intergov.repos.message_updates import MessageUpdatesRepo
 from intergov.loggers import logging
 from intergov.domain.wire_protocols import generic_discrete as gd
-from intergov.use_cases.route_to_channel import RouteToChannelUseCase
+from intergov.monitoring import increase_counter
+from intergov.use_cases.route_to_channel import CIRCUIT_OPEN, RouteToChannelUseCase
 
 logger = logging.getLogger('multichannel_router')
 
@@ -29,6 +33,27 @@ class MultichannelWorker(object):
     """
 
     ROUTING_TABLE = env_json("IGL_MCHR_ROUTING_TABLE", default=[])
+    # if set, the IGL_MCHR_ROUTING_TABLE_FILE file (used instead of the env variable)
+    # is checked for changes that often and reloaded without restart;
+    # the table from the env variable is never reloaded
+    ROUTING_TABLE_RELOAD_SECONDS = int(env("IGL_MCHR_ROUTING_TABLE_RELOAD_SECONDS", default=0))
+    # the message which is being sent for longer than that
+    # is considered abandoned and may be taken by another worker
+    CLAIM_LEASE_SECONDS = int(env("IGL_MCHR_CLAIM_LEASE_SECONDS", default=120))
+    # number of messages being sent at the same time;
+    # 0 or 1 means they are sent one by one
+    CONCURRENCY = int(env("IGL_MCHR_CONCURRENCY", default=0))
+    # number of messages being sent to the same channel at the same time,
+    # may be overridden by the "MaxConcurrency" routing rule key; 0 means no limit
+    CHANNEL_CONCURRENCY = int(env("IGL_MCHR_CHANNEL_CONCURRENCY", default=0))
+    # how long the parallel worker waits for the messages in flight
+    # before looking for the new ones
+    IN_FLIGHT_WAIT_SECONDS = 1
+    # number of messages routed together, so channels supporting it
+    # get them by a single request; 1 means message by message
+    BATCH_SIZE = int(env("IGL_MCHR_BATCH_SIZE", default=1))
+    # CircuitBreaker parameters for the channels, like {"failure_rate": 0.5, "open_seconds": 30}
+    CIRCUIT_BREAKER_CONF = env_json("IGL_MCHR_CIRCUIT_BREAKER", default={})
 
     def _prepare_outbox_repo(self, conf):
         outbox_repo_conf = env_postgres_config('PROC_BCH_OUTBOX')
@@ -47,17 +72,40 @@ class MultichannelWorker(object):
         self.message_updates_repo = MessageUpdatesRepo(repo_conf)
 
     def _prepare_use_cases(self):
-        self.uc = RouteToChannelUseCase(self.ROUTING_TABLE)
+        self.uc = RouteToChannelUseCase(
+            self.routing_index,
+            circuit_breaker_conf=self.CIRCUIT_BREAKER_CONF
+        )
 
-    def _prepare_channels(self):
+    def _prepare_channel(self, routing_rule):
         """
         For each channel in the use-case we create channel object
         and put it into the route table; so underlying use-cases
         don't think about it at all and just use the object.
         """
-        for routing_rule in self.ROUTING_TABLE:
-            routing_rule["ChannelInstance"] = HttpApiChannel(routing_rule.copy())
-        return
+        channel = HttpApiChannel(routing_rule.copy())
+        limit = int(routing_rule.get("MaxConcurrency") or self.CHANNEL_CONCURRENCY)
+        if self.executor and limit > 0:
+            channel = ConcurrencyLimitedChannel(channel, limit)
+        routing_rule["ChannelInstance"] = channel
+
+    def _prepare_routing_index(self):
+        if self.ROUTING_TABLE_RELOAD_SECONDS > 0:
+            self.routing_index = ReloadingRoutingIndex(
+                prepare_rule=self._prepare_channel,
+                check_interval=self.ROUTING_TABLE_RELOAD_SECONDS
+            )
+        else:
+            self.routing_index = RoutingIndex(
+                self.ROUTING_TABLE,
+                prepare_rule=self._prepare_channel
+            )
+
+    def _prepare_executor(self):
+        self.executor = None
+        self.in_flight = set()
+        if self.CONCURRENCY > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.CONCURRENCY)
 
     def _update_message_status(self, msg, new_status, channel_id=None, channel_msg_id=None):
         # In the message lake
@@ -93,23 +141,81 @@ class MultichannelWorker(object):
         self._prepare_outbox_repo(outbox_repo_conf)
         # self._prepare_channel_pending_message_repo(channel_pending_message_repo_conf)
         self._prepare_message_updates_repo(message_updates_repo_conf)
+        self._prepare_executor()
+        self._prepare_routing_index()
         self._prepare_use_cases()
-        self._prepare_channels()
 
     def __iter__(self):
         logger.info(
             "Starting the multichannel worker with channels %s",
-            [ch["Name"] for ch in self.ROUTING_TABLE]
+            [ch["Name"] for ch in self.routing_index]
         )
         return self
 
     def __next__(self):
+        if self.executor:
+            return self._next_parallel()
         try:
-            pg_msg = self.outbox_repo.get_next_pending_message()
-            if not pg_msg:
+            # the message is marked as 'sending' already
+            claimed = self.outbox_repo.claim_next_pending(
+                self.BATCH_SIZE, lease_seconds=self.CLAIM_LEASE_SECONDS
+            )
+            if not claimed:
                 return None
+            if self.BATCH_SIZE > 1:
+                return self._send_many(claimed)
+            return self._send(claimed[0])
+        except Exception as e:
+            logger.exception(e)
+            return None
+
+    def _next_parallel(self):
+        """
+        Keeps up to CONCURRENCY messages (or batches) in flight: claims as many
+        as there are free workers, then waits for any of them to finish.
+        Returns list of the results of the finished ones
+        or None if there is nothing to do.
+        """
+        try:
+            free = self.CONCURRENCY - len(self.in_flight)
+            if free > 0:
+                claimed = self.outbox_repo.claim_next_pending(
+                    free * self.BATCH_SIZE, lease_seconds=self.CLAIM_LEASE_SECONDS
+                )
+                for i in range(0, len(claimed), self.BATCH_SIZE):
+                    if self.BATCH_SIZE > 1:
+                        future = self.executor.submit(
+                            self._send_many, claimed[i:i + self.BATCH_SIZE], backoff=False
+                        )
+                    else:
+                        future = self.executor.submit(self._send, claimed[i], backoff=False)
+                    self.in_flight.add(future)
+        except Exception as e:
+            logger.exception(e)
+        if not self.in_flight:
+            return None
+        done, self.in_flight = wait(
+            self.in_flight,
+            timeout=self.IN_FLIGHT_WAIT_SECONDS,
+            return_when=FIRST_COMPLETED
+        )
+        results = []
+        for future in done:
+            result = future.result()
+            if isinstance(result, list):
+                results += result
+            else:
+                results.append(result)
+        return results
+
+    def _send(self, pg_msg, backoff=True):
+        """
+        Sends the claimed message and updates its status.
+        With backoff the worker sleeps after the use case failure;
+        the parallel worker doesn't, so other messages are not delayed.
+        """
+        try:
             logger.info("Processing message %s (%s)", pg_msg, pg_msg.id)
-            self.outbox_repo.patch(pg_msg.id, {'status': 'sending'})
 
             # If not result message wasn't posted to channel
             # it looks like ok situation from the use case point of view
@@ -137,39 +243,92 @@ class MultichannelWorker(object):
                     str(e)
                 )
                 self.outbox_repo.patch(pg_msg.id, {'status': 'rejected'})
-                for i in range(random.randint(30, 100)):
-                    time.sleep(0.1)
+                if backoff:
+                    for i in range(random.randint(30, 100)):
+                        time.sleep(0.1)
                 return False
 
-            if result:
-                # message has been sent somewhere
-                recipient_channel_id, recipient_channel_message_id = result
-                logger.info(
-                    "[%s] The message has been sent to channel %s",
-                    gd_msg.sender_ref, recipient_channel_id
-                )
-                self._update_message_status(
-                    gd_msg, new_status="accepted",
-                    channel_id=recipient_channel_id,
-                    channel_msg_id=recipient_channel_message_id
-                )
-                if not self.outbox_repo.patch(pg_msg.id, {'status': 'accepted'}):
-                    logger.warning("[%s] Failed to update msg in outbox", gd_msg.sender_ref)
-                    result = False
-                else:
-                    result = True
-            else:
-                # no channel accepted the message or there was other error
-                logger.warning("[%s] Message has NOT been sent", gd_msg.sender_ref)
-                self._update_message_status(gd_msg, "rejected")
-                self.outbox_repo.patch(pg_msg.id, {'status': 'rejected'})
-                result = False
-            return result
+            return self._settle(pg_msg, gd_msg, result)
 
         except Exception as e:
             logger.exception(e)
             return None
-        return True
+
+    def _settle(self, pg_msg, gd_msg, result):
+        """
+        Updates the message status according to the use case result
+        """
+        if result is CIRCUIT_OPEN:
+            # not rejected: the message is left 'sending' and claimed again
+            # once its lease has expired, when the circuits may be closed
+            logger.warning(
+                "[%s] Message has NOT been sent, channel circuits are open, "
+                "it will be retried in %s seconds",
+                gd_msg.sender_ref, self.CLAIM_LEASE_SECONDS
+            )
+            increase_counter("processors.multichannel_router.circuit_open")
+            return False
+        if result:
+            # message has been sent somewhere
+            recipient_channel_id, recipient_channel_message_id = result
+            logger.info(
+                "[%s] The message has been sent to channel %s",
+                gd_msg.sender_ref, recipient_channel_id
+            )
+            self._update_message_status(
+                gd_msg, new_status="accepted",
+                channel_id=recipient_channel_id,
+                channel_msg_id=recipient_channel_message_id
+            )
+            if not self.outbox_repo.patch(pg_msg.id, {'status': 'accepted'}):
+                logger.warning("[%s] Failed to update msg in outbox", gd_msg.sender_ref)
+                result = False
+            else:
+                result = True
+        else:
+            # no channel accepted the message or there was other error
+            logger.warning("[%s] Message has NOT been sent", gd_msg.sender_ref)
+            self._update_message_status(gd_msg, "rejected")
+            self.outbox_repo.patch(pg_msg.id, {'status': 'rejected'})
+            result = False
+        return result
+
+    def _send_many(self, pg_msgs, backoff=True):
+        """
+        Same as _send, but all the messages are routed together,
+        so the channels get them in batches. Returns list of results.
+        """
+        try:
+            gd_msgs = [
+                gd.Message.from_dict(pg_msg.to_dict())
+                for pg_msg in pg_msgs
+            ]
+            try:
+                results = self.uc.execute_many(gd_msgs)
+            except Exception as e:
+                logger.error(
+                    "Rejecting %s messages due to use-case exception %s",
+                    len(gd_msgs),
+                    str(e)
+                )
+                for pg_msg in pg_msgs:
+                    self.outbox_repo.patch(pg_msg.id, {'status': 'rejected'})
+                if backoff:
+                    for i in range(random.randint(30, 100)):
+                        time.sleep(0.1)
+                return [False] * len(pg_msgs)
+        except Exception as e:
+            logger.exception(e)
+            return [None] * len(pg_msgs)
+        settled = []
+        for pg_msg, gd_msg, result in zip(pg_msgs, gd_msgs, results):
+            try:
+                settled.append(self._settle(pg_msg, gd_msg, result))
+            except Exception as e:
+                # others still must be updated
+                logger.exception(e)
+                settled.append(None)
+        return settled
 
 
 if __name__ == '__main__':  # pragma: no cover
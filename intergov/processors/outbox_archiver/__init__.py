@@ -0,0 +1,67 @@
+"""
+* Get accepted and rejected messages which are not updated for a long time
+  from the ApiOutboxRepo
+* Move them to the archive table (partitioned by month)
+
+so the outbox table used by the multichannel router stays small.
+"""
+import time
+
+from intergov.conf import env, env_postgres_config
+from intergov.repos.api_outbox import ApiOutboxRepo
+from intergov.use_cases import ArchiveOutboxMessagesUseCase
+
+from intergov.loggers import logging
+
+logger = logging.getLogger('outbox_archiver')
+
+
+class OutboxArchiver(object):
+    """
+    Iterate over ArchiveOutboxMessagesUseCase
+    """
+
+    # messages not updated for that long are archived (a week by default)
+    ARCHIVE_AFTER_SECONDS = int(env('IGL_PROC_OUTBOX_ARCHIVE_AFTER_SECONDS', default=7 * 24 * 3600))
+    BATCH_SIZE = int(env('IGL_PROC_OUTBOX_ARCHIVE_BATCH_SIZE', default=1000))
+    # how long to sleep when there is nothing to archive
+    IDLE_SECONDS = int(env('IGL_PROC_OUTBOX_ARCHIVE_IDLE_SECONDS', default=600))
+
+    def __init__(self, outbox_repo_conf=None):
+        self._prepare_outbox_repo(outbox_repo_conf)
+        self._prepare_use_case()
+
+    def _prepare_outbox_repo(self, conf):
+        outbox_repo_conf = env_postgres_config('PROC_BCH_OUTBOX')
+        if conf:
+            outbox_repo_conf.update(conf)
+        self.outbox_repo = ApiOutboxRepo(outbox_repo_conf)
+
+    def _prepare_use_case(self):
+        self.use_case = ArchiveOutboxMessagesUseCase(
+            outbox_repo=self.outbox_repo,
+            older_than_seconds=self.ARCHIVE_AFTER_SECONDS,
+            batch_size=self.BATCH_SIZE,
+        )
+
+    def __iter__(self):
+        logger.info("Starting the OutboxArchiver")
+        return self
+
+    def __next__(self):
+        try:
+            result = self.use_case.execute()
+        except Exception as e:
+            logger.exception(e)
+            result = None
+        return result
+
+
+if __name__ == '__main__':   # pragma: no cover
+    # To start it manually, from the base dir:
+    # PYTHONPATH="`pwd`" python intergov/processors/outbox_archiver/__init__.py
+    for result in OutboxArchiver():
+        if not result:
+            time.sleep(OutboxArchiver.IDLE_SECONDS)
+        else:
+            logger.info("%s messages archived", result)
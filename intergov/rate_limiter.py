@@ -0,0 +1,233 @@
+"""
+Rate limits and backoff for the outbound callbacks.
+
+Each callback host has a token bucket (rate tokens per second, up to burst
+tokens), so no host gets more than it can handle however many
+subscriptions it has. The host may also be blocked for a while,
+when it asks for that using the Retry-After header.
+Each subscriber (callback URL) has the number of consecutive failures,
+next attempt is delayed exponentially with jitter.
+
+The state is kept in the store:
+
+* MemoryRateLimitStore - in the process memory, the default
+* SqliteRateLimitStore - in the local SQLite file, so all deliverer
+  processes sharing that file (the same host or volume) share the limits
+
+    limiter = CallbackRateLimiter(get_store(path))
+    wait = limiter.acquire(url)
+    if wait:
+        # come back in `wait` seconds
+"""
+import json
+import math
+import random
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from intergov.conf import env
+
+# tokens per second and the bucket size for each callback host:
+# no more than 100 messages to a single host per 10 seconds by default
+HOST_RATE = float(env('IGL_PROC_DELIVERY_HOST_RATE', default=10))
+HOST_BURST = float(env('IGL_PROC_DELIVERY_HOST_BURST', default=100))
+BACKOFF_BASE_SECONDS = float(env('IGL_PROC_DELIVERY_BACKOFF_BASE_SECONDS', default=2))
+BACKOFF_MAX_SECONDS = float(env('IGL_PROC_DELIVERY_BACKOFF_MAX_SECONDS', default=300))
+# path of the SQLite file shared by the deliverers, in-memory state if empty
+STORE_PATH = env('IGL_PROC_DELIVERY_RATE_LIMIT_STORE', default='')
+
+
+class MemoryRateLimitStore:
+    """
+    State of the current process only
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, key, func):
+        """
+        Calls func(state) -> (new_state, result) atomically,
+        state is the dict ({} for the new key), new_state None means delete.
+        Returns the result.
+        """
+        with self._lock:
+            new_state, result = func(dict(self._states.get(key) or {}))
+            if new_state is None:
+                self._states.pop(key, None)
+            else:
+                self._states[key] = new_state
+            return result
+
+
+class SqliteRateLimitStore:
+    """
+    State in the SQLite file, shared by all processes using that file.
+    Each update is a single immediate transaction, so the concurrent
+    updates of the same key are serialized by the SQLite lock.
+    """
+
+    TABLE = 'rate_limit_state'
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "key TEXT PRIMARY KEY, "
+                "state TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        # sqlite connections can't be shared by threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def update(self, key, func):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT state FROM {self.TABLE} WHERE key = ?", (key,)
+            ).fetchone()
+            new_state, result = func(json.loads(row[0]) if row else {})
+            if new_state is None:
+                conn.execute(f"DELETE FROM {self.TABLE} WHERE key = ?", (key,))
+            else:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.TABLE} (key, state) VALUES (?, ?)",
+                    (key, json.dumps(new_state))
+                )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+
+def get_store(path=STORE_PATH):
+    if path:
+        return SqliteRateLimitStore(path)
+    return MemoryRateLimitStore()
+
+
+def parse_retry_after(value, now=None):
+    """
+    Seconds from the Retry-After header value (seconds or HTTP date),
+    None if there is no (valid) value
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, retry_at - now)
+
+
+def _host(url):
+    return urlparse(url).netloc
+
+
+class CallbackRateLimiter:
+    """
+    Token bucket per callback host and backoff per subscriber,
+    see the module docstring
+    """
+
+    def __init__(
+        self,
+        store=None,
+        rate=HOST_RATE,
+        burst=HOST_BURST,
+        backoff_base=BACKOFF_BASE_SECONDS,
+        backoff_max=BACKOFF_MAX_SECONDS
+    ):
+        self.store = store if store is not None else MemoryRateLimitStore()
+        self.rate = rate
+        self.burst = burst
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def acquire(self, url):
+        """
+        Takes the token of the url host if possible.
+        Returns 0 if the callback may be sent now,
+        number of seconds to wait otherwise (no token is taken then).
+        """
+        now = time.time()
+
+        def take(state):
+            blocked_until = state.get('blocked_until', 0)
+            if blocked_until > now:
+                return state, blocked_until - now
+            tokens = min(
+                self.burst,
+                state.get('tokens', self.burst) + (now - state.get('updated_at', now)) * self.rate
+            )
+            state['updated_at'] = now
+            if tokens >= 1:
+                state['tokens'] = tokens - 1
+                return state, 0
+            state['tokens'] = tokens
+            return state, (1 - tokens) / self.rate if self.rate > 0 else self.backoff_max
+
+        return self.store.update('host:' + _host(url), take)
+
+    def block(self, url, seconds):
+        """
+        No callbacks to the url host for that many seconds
+        """
+        blocked_until = time.time() + seconds
+
+        def set_blocked(state):
+            state['blocked_until'] = max(state.get('blocked_until', 0), blocked_until)
+            return state, None
+
+        self.store.update('host:' + _host(url), set_blocked)
+
+    def record_success(self, url):
+        self.store.update('subscriber:' + url, lambda state: (None, None))
+
+    def record_failure(self, url):
+        """
+        Returns number of seconds before the next attempt:
+        exponential backoff with jitter for this subscriber,
+        but not less than the host is blocked for.
+        """
+        now = time.time()
+
+        def increase(state):
+            state['failures'] = state.get('failures', 0) + 1
+            return state, state['failures']
+
+        failures = self.store.update('subscriber:' + url, increase)
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** min(failures - 1, 32))
+        # "equal jitter", so retries of many failed callbacks are spread
+        delay = backoff / 2 + random.uniform(0, backoff / 2)
+        blocked_for = self.store.update(
+            'host:' + _host(url),
+            lambda state: (state or None, max(0, state.get('blocked_until', 0) - now))
+        )
+        return max(delay, blocked_for)
+
+
+def queue_delay(seconds, max_delay=900):
+    """
+    Whole number of seconds suitable for the SQS DelaySeconds (up to 15 minutes)
+    """
+    return int(min(max_delay, max(1, math.ceil(seconds))))
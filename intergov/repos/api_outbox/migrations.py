@@ -0,0 +1,108 @@
+"""
+Schema changes of the api_outbox tables.
+
+Base.metadata.create_all creates the missing tables but never changes
+the existing ones, so everything added after the first release
+(columns, indexes) is done here. Each migration is applied once,
+applied ones are recorded in the MIGRATIONS_TABLE; statements are
+idempotent anyway, so the database changed by hand is fine too.
+
+New migrations are added to the end of the list and never changed after release.
+"""
+from sqlalchemy import text
+
+from intergov.loggers import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = 'api_outbox_migrations'
+# any number unique for this database, so parallel workers
+# starting at the same time don't apply the same migration twice
+MIGRATIONS_LOCK_ID = 7310001
+
+# final messages moved out of the message table, see PostgresRepo.archive_final;
+# partitioned by archived_at, partitions are created on demand by month
+ARCHIVE_TABLE = 'message_archive'
+
+MIGRATIONS = [
+    ('0001_claimed_at', [
+        "ALTER TABLE message ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP",
+    ]),
+    ('0002_updated_at', [
+        "ALTER TABLE message ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT now()",
+    ]),
+    ('0003_active_status_index', [
+        # workers look for these only, and they are a tiny part of the table
+        "CREATE INDEX IF NOT EXISTS message_active_status_idx ON message (status, id) "
+        "WHERE status IN ('pending', 'sending')",
+    ]),
+    ('0004_dedup_index', [
+        # subject may be too long for the btree index, so its hash is used;
+        # fails if the table has duplicates already, then they must be rejected first
+        "CREATE UNIQUE INDEX IF NOT EXISTS message_dedup_idx ON message "
+        "(sender, sender_ref, receiver, md5(subject), obj, predicate) "
+        "WHERE status != 'rejected'",
+    ]),
+    ('0005_message_archive', [
+        f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} ("
+        "id INTEGER NOT NULL, "
+        "sender VARCHAR(16) NOT NULL, "
+        "receiver VARCHAR(16) NOT NULL, "
+        "subject VARCHAR(2048) NOT NULL, "
+        "obj VARCHAR(256) NOT NULL, "
+        "predicate VARCHAR(512) NOT NULL, "
+        "sender_ref VARCHAR(256) NOT NULL, "
+        "status VARCHAR(12), "
+        "claimed_at TIMESTAMP, "
+        "updated_at TIMESTAMP, "
+        "archived_at TIMESTAMP NOT NULL"
+        ") PARTITION BY RANGE (archived_at)",
+        # the archiver looks for these
+        "CREATE INDEX IF NOT EXISTS message_final_updated_at_idx ON message (updated_at) "
+        "WHERE status IN ('accepted', 'rejected')",
+    ]),
+]
+
+
+def migrate(engine, migrations=None):
+    """
+    Applies the migrations which are not applied yet.
+    Failed ones are logged and will be tried again next time,
+    the rest are applied anyway.
+    Returns names of the migrations applied.
+    """
+    if migrations is None:
+        migrations = MIGRATIONS
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+            "name VARCHAR(128) PRIMARY KEY, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+    applied = []
+    for name, statements in migrations:
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("SELECT pg_advisory_xact_lock(:lock_id)"),
+                    lock_id=MIGRATIONS_LOCK_ID
+                )
+                is_applied = conn.execute(
+                    text(f"SELECT 1 FROM {MIGRATIONS_TABLE} WHERE name = :name"),
+                    name=name
+                ).first()
+                if is_applied:
+                    continue
+                for statement in statements:
+                    conn.execute(text(statement))
+                conn.execute(
+                    text(f"INSERT INTO {MIGRATIONS_TABLE} (name) VALUES (:name)"),
+                    name=name
+                )
+        except Exception as e:
+            logger.error("Migration %s has failed", name)
+            logger.exception(e)
+            continue
+        logger.info("Migration %s has been applied", name)
+        applied.append(name)
+    return applied
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String  # , Float
+from sqlalchemy import Column, DateTime, Integer, String, func  # , Float
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -25,6 +25,11 @@ class Message(Base):
     # outbox: pending, accepted, rejected
     # bc: block depth? block number?
     status = Column(String(12), default="accepted")
+    # when the message has been taken by the worker ('sending' status)
+    claimed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True, default=func.now(), onupdate=func.now())
+
+    # indexes are created by the migrations module
 
     def __str__(self):
         return self.subject
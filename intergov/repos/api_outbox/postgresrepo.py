@@ -1,13 +1,87 @@
+import datetime
+import threading
+
 from libtrustbridge.utils.conf import TESTING
-from sqlalchemy import create_engine, or_
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import and_, create_engine, func, or_, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from intergov.domain.wire_protocols import generic_discrete as message
 from intergov.loggers import logging
+from intergov.repos.api_outbox.migrations import ARCHIVE_TABLE, migrate
 from intergov.repos.api_outbox.postgres_objects import Base, Message
 
 logger = logging.getLogger(__name__)
 
+# the same message can't be posted twice unless it's rejected
+DEDUP_KEY = ('sender', 'sender_ref', 'receiver', 'subject', 'obj', 'predicate')
+
+# rows fetched by a single query of iter_search
+DEFAULT_SEARCH_PAGE_SIZE = 1000
+
+# rows moved to the archive by a single statement
+DEFAULT_ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_COLUMNS = (
+    'id', 'sender', 'receiver', 'subject', 'obj', 'predicate', 'sender_ref',
+    'status', 'claimed_at', 'updated_at',
+)
+# parallel archivers wait for each other instead of racing for the partitions
+ARCHIVE_LOCK_ID = 7310002
+
+# connection pool settings used for the keys missing in the connection data,
+# see intergov.conf.env_postgres_config for the configured ones
+DEFAULT_POOL_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    # seconds, connections are re-created after that
+    'pool_recycle': 1800,
+    # check the connection before use, so DB restarts don't break the workers
+    'pool_pre_ping': True,
+}
+# create tables and apply migrations on start
+DEFAULT_CREATE_SCHEMA = True
+
+# engines (and so connection pools) and session factories are shared
+# by all repos of the process with the same connection settings
+_engines = {}
+_session_factories = {}
+_schema_created = set()
+_lock = threading.Lock()
+
+
+def _get_engine(connection_string, pool_options):
+    key = (connection_string, tuple(sorted(pool_options.items())))
+    with _lock:
+        if key not in _engines:
+            engine = create_engine(connection_string, **pool_options)
+            _engines[key] = engine
+            _session_factories[key] = scoped_session(sessionmaker(bind=engine))
+        return _engines[key], _session_factories[key]
+
+
+def _create_schema(engine):
+    with _lock:
+        if engine in _schema_created:
+            return
+        Base.metadata.create_all(bind=engine)
+        # columns and indexes added to the existing tables
+        migrate(engine)
+        _schema_created.add(engine)
+
+
+def dispose_engines():
+    """
+    Closes all the connections and forgets the engines,
+    so the next repo creates the new one
+    """
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _session_factories.clear()
+        _schema_created.clear()
+
 
 class PostgresRepo:
     """
@@ -16,6 +90,8 @@ class PostgresRepo:
     """
 
     DEFAULT_DB = 'postgres'
+    # for how long the message claimed by the worker is not given to others
+    DEFAULT_CLAIM_LEASE_SECONDS = 120
 
     def __init__(self, connection_data):
         connection_string = "postgresql+psycopg2://{}:{}@{}/{}".format(
@@ -24,12 +100,14 @@ class PostgresRepo:
             connection_data['host'],
             connection_data['dbname'] or self.DEFAULT_DB
         )
-        self.engine = create_engine(
-            connection_string,
-        )
+        pool_options = {
+            key: connection_data.get(key, default)
+            for key, default in DEFAULT_POOL_OPTIONS.items()
+        }
         # echo=True  # use this for debugging
-        Base.metadata.bind = self.engine
-        Base.metadata.create_all()
+        self.engine, self.DBSession = _get_engine(connection_string, pool_options)
+        if connection_data.get('create_schema', DEFAULT_CREATE_SCHEMA):
+            _create_schema(self.engine)
 
     def _create_message_objects(self, results):
         return [
@@ -44,42 +122,116 @@ class PostgresRepo:
             for q in results
         ]
 
+    @staticmethod
+    def _dedup_key(values):
+        return tuple(values[name] for name in DEDUP_KEY)
+
+    def _insert_values(self, msg):
+        # need to convert from domain message to PG message
+        return {
+            'sender': str(msg.sender),
+            'receiver': str(msg.receiver),
+            'subject': str(msg.subject),
+            'obj': str(msg.obj),
+            'predicate': str(msg.predicate),
+            'sender_ref': str(msg.sender_ref),
+            'status': 'pending',
+        }
+
+    def _insert_ignoring_dupes(self, values_list):
+        """
+        Single INSERT statement for all the values, which skips the ones
+        that would create a duplicate (see the dedup index in the migrations).
+        Returns {dedup key: id} for the inserted rows.
+        """
+        table = Message.__table__
+        statement = insert(table).values(values_list).on_conflict_do_nothing(
+            index_elements=[
+                table.c.sender,
+                table.c.sender_ref,
+                table.c.receiver,
+                func.md5(table.c.subject),
+                table.c.obj,
+                table.c.predicate,
+            ],
+            index_where=table.c.status != 'rejected'
+        ).returning(
+            table.c.id, *[table.c[name] for name in DEDUP_KEY]
+        )
+        DBSession = self.DBSession
+        session = DBSession()
+        try:
+            rows = session.execute(statement).fetchall()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return {
+            self._dedup_key(row): row.id
+            for row in rows
+        }
+
     def post(self, msg):
-        DBSession = sessionmaker(bind=self.engine)
+        """
+        Returns id of the new message or True if such message exists already
+        """
+        values = self._insert_values(msg)
+        try:
+            inserted = self._insert_ignoring_dupes([values])
+        except ProgrammingError as e:
+            if not self._is_dedup_index_missing(e):
+                raise
+            return self._post_checking_dupes(values)
+        return inserted.get(self._dedup_key(values), True)
+
+    def post_many(self, msgs):
+        """
+        Same as post but for many messages at once (single statement).
+        Returns list of results in the same order as messages.
+        """
+        values_list = [self._insert_values(msg) for msg in msgs]
+        if not values_list:
+            return []
+        try:
+            inserted = self._insert_ignoring_dupes(values_list)
+        except ProgrammingError as e:
+            if not self._is_dedup_index_missing(e):
+                raise
+            return [self._post_checking_dupes(values) for values in values_list]
+        return [
+            inserted.get(self._dedup_key(values), True)
+            for values in values_list
+        ]
+
+    @staticmethod
+    def _is_dedup_index_missing(e):
+        # the dedup index migration fails if the table has duplicates already
+        if 'no unique or exclusion constraint' in str(e):
+            logger.warning("The dedup index is missing, check the outbox migrations")
+            return True
+        return False
+
+    def _post_checking_dupes(self, values):
+        DBSession = self.DBSession
         result = True
         try:
             session = DBSession()
 
-            # need to convert from domain message to PG message
-            sender = str(msg.sender)
-            receiver = str(msg.receiver)
-            subject = str(msg.subject)
-            obj = str(msg.obj)
-            predicate = str(msg.predicate)
-            sender_ref = str(msg.sender_ref)
-
             # but not if it would create a duplicate
             dupes_query = session.query(Message).filter(
-                Message.sender == sender,
-                Message.sender_ref == sender_ref,
-                Message.receiver == receiver,
-                Message.subject == subject,
-                Message.obj == obj,
-                Message.predicate == predicate,
+                Message.sender == values['sender'],
+                Message.sender_ref == values['sender_ref'],
+                Message.receiver == values['receiver'],
+                Message.subject == values['subject'],
+                Message.obj == values['obj'],
+                Message.predicate == values['predicate'],
                 Message.status != 'rejected'
             )
 
             if dupes_query.count() == 0:
-                m = Message(
-                    sender=sender,
-                    receiver=receiver,
-                    subject=subject,
-                    obj=obj,
-                    predicate=predicate,
-                    sender_ref=sender_ref,
-                    status='pending'
-                )
-
+                m = Message(**values)
                 session.add(m)
                 session.flush()
                 result = m.id
@@ -99,7 +251,7 @@ class PostgresRepo:
         if new_status not in ('sending', 'rejected', 'accepted'):
             return False
 
-        DBSession = sessionmaker(bind=self.engine)
+        DBSession = self.DBSession
         session = DBSession()
         msg = session.query(Message).get(msg_id)
         if not msg:
@@ -117,7 +269,7 @@ class PostgresRepo:
         return True
 
     def delete(self, msg_id):
-        DBSession = sessionmaker(bind=self.engine)
+        DBSession = self.DBSession
         session = DBSession()
         msg = session.query(Message).get(msg_id)
 
@@ -132,7 +284,7 @@ class PostgresRepo:
         return True
 
     def get(self, msg_id):
-        DBSession = sessionmaker(bind=self.engine)
+        DBSession = self.DBSession
         session = DBSession()
         found = session.query(Message).get(msg_id)
 
@@ -143,14 +295,8 @@ class PostgresRepo:
         session.close()
         return self._create_message_objects([found])[0]
 
-    def search(self, filters=None):
-        DBSession = sessionmaker(bind=self.engine)
-        session = DBSession()
-        query = session.query(Message)
-
-        if filters is None:
-            return self._create_message_objects(query.all())
-
+    @staticmethod
+    def _apply_filters(query, filters):
         if 'sender__eq' in filters:
             query = query.filter(
                 Message.sender == filters['sender__eq'])
@@ -176,14 +322,66 @@ class PostgresRepo:
             query = query.filter(
                 Message.predicate.like(
                     "{}%".format(w)))
+        return query
+
+    def search(self, filters=None):
+        DBSession = self.DBSession
+        session = DBSession()
+        query = self._apply_filters(session.query(Message), filters or {})
 
         output = self._create_message_objects(query.all())
         session.close()
         return output
 
+    def iter_search(self, filters=None, page_size=DEFAULT_SEARCH_PAGE_SIZE, after_id=None):
+        """
+        Same as search, but yields (id, message) tuples ordered by id
+        instead of loading the whole table into memory.
+
+        Rows are fetched by page_size using the id (keyset pagination),
+        each page in its own short session, so the scan of any size
+        takes constant memory and doesn't keep the transaction open.
+        Pass the last id seen as after_id to continue the interrupted scan.
+        """
+        last_id = after_id
+        while True:
+            DBSession = self.DBSession
+            session = DBSession()
+            try:
+                query = self._apply_filters(session.query(Message), filters or {})
+                if last_id is not None:
+                    query = query.filter(Message.id > last_id)
+                rows = query.order_by(Message.id).limit(page_size).all()
+                page = list(zip(
+                    [row.id for row in rows],
+                    self._create_message_objects(rows)
+                ))
+            finally:
+                session.close()
+            for msg_id, msg in page:
+                yield msg_id, msg
+            if len(page) < page_size:
+                return
+            last_id = page[-1][0]
+
+    def search_count(self, filters=None):
+        """
+        Number of messages search would return,
+        counted by the database without fetching them
+        """
+        DBSession = self.DBSession
+        session = DBSession()
+        try:
+            query = self._apply_filters(session.query(Message), filters or {})
+            return query.count()
+        finally:
+            session.close()
+
     def get_next_pending_message(self):
+        # doesn't change the status, so parallel workers may get the same
+        # message; claim_next_pending is the safe way
         try:
-            DBSession = sessionmaker(bind=self.engine)
+            DBSession = self.DBSession
             session = DBSession()
             return session.query(Message).filter(
                 or_(
@@ -200,6 +398,126 @@ class PostgresRepo:
         finally:
             session.close()
 
+    def claim_next_pending(self, batch_size=1, lease_seconds=None):
+        """
+        Atomically marks up to batch_size messages as 'sending' and returns them.
+
+        Both 'pending' messages and 'sending' ones with the expired lease
+        (the worker has died) are claimed. It is a single UPDATE statement
+        and the rows locked by the other workers are skipped, so the same
+        message is never given to two workers running in parallel.
+        """
+        if lease_seconds is None:
+            lease_seconds = self.DEFAULT_CLAIM_LEASE_SECONDS
+        table = Message.__table__
+        claimable = select([table.c.id]).where(
+            or_(
+                table.c.status == 'pending',
+                and_(
+                    table.c.status == 'sending',
+                    or_(
+                        table.c.claimed_at.is_(None),
+                        table.c.claimed_at < func.now() - datetime.timedelta(seconds=lease_seconds)
+                    )
+                )
+            )
+        ).order_by(
+            table.c.id
+        ).limit(
+            batch_size
+        ).with_for_update(
+            skip_locked=True
+        )
+        claim = table.update().where(
+            table.c.id.in_(claimable)
+        ).values(
+            status='sending',
+            claimed_at=func.now()
+        ).returning(
+            *table.c
+        )
+        DBSession = self.DBSession
+        session = DBSession()
+        try:
+            rows = session.execute(claim).fetchall()
+            session.commit()
+        except Exception as e:
+            logger.exception(e)
+            session.rollback()
+            return []
+        finally:
+            session.close()
+        return sorted(
+            [Message(**dict(row)) for row in rows],
+            key=lambda m: m.id
+        )
+
+    @staticmethod
+    def _archive_partition(archived_at):
+        """
+        Name and bounds of the monthly archive partition
+        """
+        start = archived_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = (start + datetime.timedelta(days=32)).replace(day=1)
+        name = "{}_{:%Y_%m}".format(ARCHIVE_TABLE, start)
+        return name, start, end
+
+    def archive_final(self, older_than_seconds, batch_size=DEFAULT_ARCHIVE_BATCH_SIZE):
+        """
+        Moves up to batch_size accepted and rejected messages not updated
+        for older_than_seconds to the archive table, so the message table
+        contains only the recent ones and its scans stay fast.
+        Returns number of messages moved (0 means nothing to do).
+
+        Archived messages don't take part in the deduplication anymore,
+        so the same message may be posted again after that; the age
+        should be much longer than any sender retries.
+        """
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        DBSession = self.DBSession
+        session = DBSession()
+        try:
+            session.execute(
+                text("SELECT pg_advisory_xact_lock(:lock_id)"),
+                {'lock_id': ARCHIVE_LOCK_ID}
+            )
+            archived_at = session.execute(text("SELECT now()::timestamp")).scalar()
+            partition, start, end = self._archive_partition(archived_at)
+            session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {ARCHIVE_TABLE} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {partition}_sender_ref_idx "
+                f"ON {partition} (sender, sender_ref)"
+            ))
+            result = session.execute(
+                text(
+                    "WITH moved AS ("
+                    "DELETE FROM message WHERE id IN ("
+                    "SELECT id FROM message "
+                    "WHERE status IN ('accepted', 'rejected') "
+                    "AND updated_at < now() - :age * interval '1 second' "
+                    "LIMIT :batch_size"
+                    f") RETURNING {columns}"
+                    ") "
+                    f"INSERT INTO {ARCHIVE_TABLE} ({columns}, archived_at) "
+                    f"SELECT {columns}, :archived_at FROM moved"
+                ),
+                {
+                    'age': older_than_seconds,
+                    'batch_size': batch_size,
+                    'archived_at': archived_at,
+                }
+            )
+            session.commit()
+            return result.rowcount
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
     # primarily for testing purposes
     # do not use in production code
     def _unsafe_method__clear(self):
@@ -207,7 +525,7 @@ class PostgresRepo:
             raise RuntimeError(
                 'repo._unsafe_method__clear method allowed only when env TESTING=True'
             )
-        DBSession = sessionmaker(bind=self.engine)
+        DBSession = self.DBSession
         session = DBSession()
         try:
             session.query(Message).delete()
@@ -219,7 +537,7 @@ class PostgresRepo:
             session.close()
 
     def is_empty(self):
-        DBSession = sessionmaker(bind=self.engine)
+        DBSession = self.DBSession
         session = DBSession()
         count = None
         try:
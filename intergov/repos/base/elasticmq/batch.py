@@ -0,0 +1,132 @@
+import json
+
+from intergov.domain.wire_protocols.generic_discrete import Message
+from intergov.loggers import logging
+
+logger = logging.getLogger(__name__)
+
+# SQS (and ElasticMQ) hard limit for ReceiveMessage and *Batch calls
+SQS_MAX_BATCH_SIZE = 10
+# SQS limit for the total size of SendMessageBatch message bodies
+SQS_MAX_BATCH_BYTES = 256 * 1024
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _sized_chunks(items, bodies, size, max_bytes):
+    """
+    Chunks of up to size (item, body) pairs with the bodies
+    of no more than max_bytes in total (unless the single body is bigger)
+    """
+    chunk = []
+    chunk_bytes = 0
+    for item, body in zip(items, bodies):
+        body_bytes = len(body.encode('utf-8'))
+        if chunk and (len(chunk) >= size or chunk_bytes + body_bytes > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append((item, body))
+        chunk_bytes += body_bytes
+    if chunk:
+        yield chunk
+
+
+class BatchElasticMQRepoMixin:
+    """
+    Batch operations for the ElasticMQRepo based repos.
+
+    The base repo works with one message per request, which is fine
+    for the light queues but too slow for the busy ones.
+    These methods do the same things for up to N messages, splitting
+    them to the chunks of 10 (the SQS limit) under the hood.
+
+    Must be mixed before the ElasticMQRepo class, so `self.client` and
+    `self.queue_url` are available.
+    """
+
+    def get_many(self, max_messages=SQS_MAX_BATCH_SIZE, wait_time_seconds=0):
+        """
+        Returns list of (queue_message_id, Message) tuples (may be empty)
+        """
+        return [
+            (msg_id, Message.from_dict(body))
+            for msg_id, body in self.get_jobs(max_messages, wait_time_seconds)
+        ]
+
+    def get_jobs(self, max_messages=SQS_MAX_BATCH_SIZE, wait_time_seconds=0):
+        """
+        Returns list of (queue_message_id, job_dict) tuples (may be empty)
+
+        Only the first receive call waits (long polling), the following ones
+        just pick up what is already in the queue.
+        """
+        result = []
+        while len(result) < max_messages:
+            resp = self.client.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=min(max_messages - len(result), SQS_MAX_BATCH_SIZE),
+                WaitTimeSeconds=wait_time_seconds if not result else 0,
+            )
+            received = resp.get('Messages') or []
+            for msg in received:
+                try:
+                    body = json.loads(msg['Body'])
+                except Exception as e:
+                    # leave it in the queue, it will get to the DLQ eventually
+                    logger.exception(e)
+                    continue
+                result.append((msg['ReceiptHandle'], body))
+            if len(received) < SQS_MAX_BATCH_SIZE:
+                # the queue is (most likely) drained
+                break
+        return result
+
+    def delete_many(self, msg_ids):
+        """
+        Deletes the messages by their queue ids
+        Returns list of ids which were failed to be deleted
+        """
+        failed = []
+        for chunk in _chunks(list(msg_ids), SQS_MAX_BATCH_SIZE):
+            resp = self.client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {'Id': str(i), 'ReceiptHandle': msg_id}
+                    for i, msg_id in enumerate(chunk)
+                ]
+            )
+            for entry in resp.get('Failed') or []:
+                failed.append(chunk[int(entry['Id'])])
+        if failed:
+            logger.warning("Unable to delete %s messages from %s", len(failed), self.queue_url)
+        return failed
+
+    def post_jobs(self, jobs, delay_seconds=0):
+        """
+        Posts the jobs (dicts) to the queue
+        Returns list of jobs which were failed to be posted
+        """
+        jobs = list(jobs)
+        failed = []
+        bodies = [json.dumps(job) for job in jobs]
+        for chunk in _sized_chunks(jobs, bodies, SQS_MAX_BATCH_SIZE, SQS_MAX_BATCH_BYTES):
+            resp = self.client.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {
+                        'Id': str(i),
+                        'MessageBody': body,
+                        'DelaySeconds': delay_seconds,
+                    }
+                    for i, (job, body) in enumerate(chunk)
+                ]
+            )
+            for entry in resp.get('Failed') or []:
+                failed.append(chunk[int(entry['Id'])][0])
+        if failed:
+            logger.warning("Unable to post %s jobs to %s", len(failed), self.queue_url)
+        return failed
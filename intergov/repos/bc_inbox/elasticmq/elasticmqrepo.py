@@ -1,6 +1,8 @@
 from libtrustbridge.repos.elasticmqrepo import ElasticMQRepo
 
+from intergov.repos.base.elasticmq.batch import BatchElasticMQRepoMixin
 
-class BCInboxRepo(ElasticMQRepo):
+
+class BCInboxRepo(BatchElasticMQRepoMixin, ElasticMQRepo):
     def _get_queue_name(self):
         return 'bc-inbox'
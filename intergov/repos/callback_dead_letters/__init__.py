@@ -0,0 +1,3 @@
+from intergov.repos.callback_dead_letters.minio.miniorepo import (  # NOQA
+    CallbackDeadLetterRepo
+)
@@ -0,0 +1,90 @@
+import datetime
+import json
+import uuid
+from urllib.parse import urlparse
+
+from libtrustbridge.repos import miniorepo
+
+from intergov.loggers import logging
+
+logger = logging.getLogger(__name__)
+
+# S3 limit for ListObjectsV2 and DeleteObjects
+MAX_KEYS = 1000
+
+
+class CallbackDeadLetterRepo(miniorepo.MinioRepo):
+    """
+    Callback delivery jobs dropped after MAX_RETRIES, so they may be
+    replayed when the subscriber is back.
+
+    Stored as {callback host}/{date}/{time}-{uuid}.json objects, so
+    the jobs of the single subscriber host may be listed (and replayed)
+    in the order they were dropped.
+    """
+
+    DEFAULT_BUCKET = 'callback-dead-letters'
+
+    @staticmethod
+    def host_prefix(host):
+        return "{}/".format(host)
+
+    def post(self, job, reason=None):
+        """
+        Returns the key of the stored job
+        """
+        now = datetime.datetime.utcnow()
+        key = "{}{}/{}-{}.json".format(
+            self.host_prefix(urlparse(job['s']).netloc),
+            now.strftime('%Y-%m-%d'),
+            now.strftime('%H%M%S%f'),
+            uuid.uuid4()
+        )
+        self.put_object(
+            clean_path=key,
+            content_body=json.dumps({
+                'job': job,
+                'reason': reason,
+                'dropped_at': now.isoformat(),
+            })
+        )
+        return key
+
+    def list_keys(self, prefix='', start_after=None, limit=MAX_KEYS):
+        """
+        Keys in the alphabetical order (so by host, then by the drop time)
+        """
+        kwargs = {
+            'Bucket': self.bucket,
+            'Prefix': prefix,
+            'MaxKeys': min(limit, MAX_KEYS),
+        }
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        resp = self.client.list_objects_v2(**kwargs)
+        return [obj['Key'] for obj in resp.get('Contents') or []]
+
+    def get(self, key):
+        """
+        Returns the stored document: {"job": ..., "reason": ..., "dropped_at": ...}
+        """
+        return json.loads(self.get_object_content(key))
+
+    def delete_many(self, keys):
+        """
+        Returns list of keys which were failed to be deleted
+        """
+        keys = list(keys)
+        failed = []
+        for i in range(0, len(keys), MAX_KEYS):
+            resp = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={
+                    'Objects': [{'Key': key} for key in keys[i:i + MAX_KEYS]],
+                    'Quiet': True,
+                }
+            )
+            failed += [error['Key'] for error in resp.get('Errors') or []]
+        if failed:
+            logger.warning("Unable to delete %s dead letters", len(failed))
+        return failed
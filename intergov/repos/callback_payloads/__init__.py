@@ -0,0 +1,3 @@
+from intergov.repos.callback_payloads.minio.miniorepo import (  # NOQA
+    CallbackPayloadRepo
+)
@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+from libtrustbridge.repos import miniorepo
+
+
+class CallbackPayloadRepo(miniorepo.MinioRepo):
+    """
+    Callback payloads shared by the delivery jobs of all the subscribers,
+    so the big message is stored once instead of being copied to each job.
+
+    Keys are the payload hashes, so posting the same payload again
+    just refreshes the object. Payloads are never deleted by the workers
+    (any job, including the retried and the dead letter ones, may still
+    need them) and should be expired by the bucket lifecycle rule,
+    longer than the dead letters are kept.
+    """
+
+    DEFAULT_BUCKET = 'callback-payloads'
+
+    @staticmethod
+    def serialize(payload):
+        return json.dumps(payload)
+
+    def post(self, payload, content=None):
+        """
+        Returns the key of the stored payload;
+        content is the already serialized payload, if any
+        """
+        if content is None:
+            content = self.serialize(payload)
+        key = "{}.json".format(hashlib.sha256(content.encode('utf-8')).hexdigest())
+        self.put_object(clean_path=key, content_body=content)
+        return key
+
+    def get(self, key):
+        return json.loads(self.get_object_content(key))
@@ -1,6 +1,8 @@
 from libtrustbridge.repos.elasticmqrepo import ElasticMQRepo
 
+from intergov.repos.base.elasticmq.batch import BatchElasticMQRepoMixin
 
-class DeliveryOutboxRepo(ElasticMQRepo):
+
+class DeliveryOutboxRepo(BatchElasticMQRepoMixin, ElasticMQRepo):
     def _get_queue_name(self):
         return 'delivery-outbox'
@@ -1,3 +1,7 @@
 from intergov.repos.message_lake.minio.miniorepo import (  # NOQA
     MessageLakeMinioRepo as MessageLakeRepo
 )
+from intergov.repos.message_lake.cache import (  # NOQA
+    CachedMessageLakeRepo,
+    MessageLakeCache
+)
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+from intergov.domain.wire_protocols.generic_discrete import FINAL_STATUSES
+from intergov.monitoring import increase_counter
+
+
+class MessageLakeCache:
+    """
+    Bounded in-process LRU cache of the message lake messages.
+
+    Messages with the final status never change, so they stay in the cache
+    until pushed out by the newer ones; the others are kept for ttl seconds
+    only, because they are updated by the other processes.
+    Thread-safe, so may be shared by the API app threads.
+    """
+
+    def __init__(self, max_size=1000, ttl=2):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sender, sender_ref):
+        """
+        Returns the cached message or None
+        """
+        key = (str(sender), str(sender_ref))
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            msg, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return msg
+
+    def put(self, sender, sender_ref, msg):
+        if self.max_size <= 0:
+            return
+        if getattr(msg, 'status', None) in FINAL_STATUSES:
+            expires_at = None
+        else:
+            expires_at = time.monotonic() + self.ttl
+        key = (str(sender), str(sender_ref))
+        with self._lock:
+            self._items[key] = (msg, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, sender, sender_ref):
+        with self._lock:
+            self._items.pop((str(sender), str(sender_ref)), None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class CachedMessageLakeRepo:
+    """
+    Read-through cache in front of the message lake repo.
+    Writes go to the repo and invalidate the cached message,
+    everything else is just passed to the repo.
+    """
+
+    def __init__(self, repo, cache):
+        self.repo = repo
+        self.cache = cache
+
+    def get(self, sender, sender_ref):
+        msg = self.cache.get(sender, sender_ref)
+        if msg is not None:
+            increase_counter("repos.message_lake.cache.hit")
+            return msg
+        increase_counter("repos.message_lake.cache.miss")
+        msg = self.repo.get(sender, sender_ref)
+        if msg:
+            self.cache.put(sender, sender_ref, msg)
+        return msg
+
+    def post(self, msg):
+        self.cache.invalidate(msg.sender, msg.sender_ref)
+        return self.repo.post(msg)
+
+    def update_metadata(self, sender, sender_ref, updates):
+        self.cache.invalidate(sender, sender_ref)
+        try:
+            return self.repo.update_metadata(sender, sender_ref, updates)
+        finally:
+            # the message could be read in the meantime
+            self.cache.invalidate(sender, sender_ref)
+
+    def __getattr__(self, name):
+        return getattr(self.repo, name)
@@ -1,4 +1,9 @@
 import json
+import os
+import random
+import threading
+import time
+
 from botocore.client import ClientError
 from libtrustbridge.repos import miniorepo
 
@@ -8,21 +13,141 @@ from intergov.loggers import logging  # NOQA
 
 logger = logging.getLogger(__name__)
 
+# content.json and metadata.json objects - the original one
+LAYOUT_SEPARATE = 'separate'
+# single message.json object with both content and metadata
+LAYOUT_COMBINED = 'combined'
+
+DEFAULT_LAYOUT = os.environ.get('IGL_MESSAGE_LAKE_LAYOUT') or LAYOUT_SEPARATE
+
+# the conditional write has failed because somebody else has written first
+CONFLICT_ERROR_CODES = ('PreconditionFailed', 'ConditionalRequestConflict')
+
+
+def merge_metadata(current, updates):
+    """
+    Applies the updates to the current (freshly read) metadata.
+    Only the updated keys are changed, so concurrent patches of different
+    fields (say status and channel_id) both survive.
+    """
+    merged = dict(current or {})
+    merged.update(updates)
+    return merged
+
 
 class MessageLakeMinioRepo(miniorepo.MinioRepo):
+    """
+    Messages are stored either as two objects (content and metadata)
+    or as a single one containing both, which takes half of the requests.
+    The layout is picked by the 'layout' connection data key
+    (or IGL_MESSAGE_LAKE_LAYOUT env variable) and is used for writes;
+    reads understand both of them, so the layout may be changed
+    for the existing lake.
+    """
 
     DEFAULT_BUCKET = 'messagelake'
+    JOURNAL_REL_PATH = "/journal.json"
+
+    # metadata update attempts before giving up on the write conflicts
+    UPDATE_MAX_ATTEMPTS = 5
+    UPDATE_RETRY_BASE_SECONDS = 0.05
+    UPDATE_RETRY_MAX_SECONDS = 1
+
+    def __init__(self, connection_data, *args, **kwargs):
+        connection_data = dict(connection_data)
+        self.layout = connection_data.pop('layout', None) or DEFAULT_LAYOUT
+        assert self.layout in (LAYOUT_SEPARATE, LAYOUT_COMBINED), self.layout
+        super().__init__(connection_data, *args, **kwargs)
+        # boto3 we use doesn't know about conditional PutObject,
+        # so the header is added to the request directly
+        self._if_match = threading.local()
+        self.client.meta.events.register(
+            'before-call.s3.PutObject',
+            self._add_if_match_header
+        )
+
+    def _add_if_match_header(self, params, **kwargs):
+        etag = getattr(self._if_match, 'etag', None)
+        if etag:
+            params.setdefault('headers', {})['If-Match'] = etag
+
+    def _path(self, sender, sender_ref, filename):
+        return "{}/{}/{}".format(
+            sender,
+            miniorepo.slash_chunk(sender_ref),
+            filename
+        )
+
+    def _get_json(self, path):
+        """
+        Returns de-serialised object or None if there is no such key
+        """
+        try:
+            return json.loads(self.get_object_content(path))
+        except ClientError as ex:
+            if ex.response['Error']['Code'] == 'NoSuchKey':
+                return None
+            else:
+                raise
+
+    def _read_json_with_etag(self, path):
+        """
+        Returns (de-serialised object, etag) tuple
+        """
+        resp = self.client.get_object(
+            Bucket=self.bucket_name,
+            Key=path
+        )
+        return json.loads(resp['Body'].read().decode('utf-8')), resp.get('ETag')
+
+    def _get_json_with_etag(self, path):
+        """
+        Same as _read_json_with_etag, but (None, None) if there is no such key
+        """
+        try:
+            return self._read_json_with_etag(path)
+        except ClientError as ex:
+            if ex.response['Error']['Code'] == 'NoSuchKey':
+                return None, None
+            else:
+                raise
+
+    def _put_message_related_object_if_match(self, etag, **kwargs):
+        """
+        put_message_related_object which fails if the object
+        has been changed since it was read with the given etag
+        """
+        self._if_match.etag = etag
+        try:
+            return self.put_message_related_object(**kwargs)
+        finally:
+            self._if_match.etag = None
 
     def post(self, msg):
         """
         Save message to the lake. Message must have sender and sender_ref fields
-        to be searchable. Also the metadata is saved separately.
+        to be searchable. Also the metadata is saved separately
+        (or in the same object for the combined layout).
         """
         assert msg.sender_ref, "sender_ref is required for message to be written"
-        content_rendered = json.dumps(msg, cls=ser.MessageJSONEncoder)
-        metadata_rendered = json.dumps({
+        metadata = {
             message.STATUS_KEY: msg.status
-        })
+        }
+
+        if self.layout == LAYOUT_COMBINED:
+            self.put_message_related_object(
+                sender=str(msg.sender),
+                sender_ref=msg.sender_ref,
+                rel_path="/message.json",
+                content_body=json.dumps(
+                    {"content": msg, "metadata": metadata},
+                    cls=ser.MessageJSONEncoder
+                )
+            )
+            return True
+
+        content_rendered = json.dumps(msg, cls=ser.MessageJSONEncoder)
+        metadata_rendered = json.dumps(metadata)
         # logging.info(
         #     "Message to be put into the message lake: %s, metadata %s",
         #     content_rendered, metadata_rendered
@@ -45,38 +170,25 @@ class MessageLakeMinioRepo(miniorepo.MinioRepo):
 
     def get(self, sender, sender_ref):
         # try getting /{sender}/{sender_ref}/content.json
+        # (or message.json for the combined layout)
         # de-serialise it and return it as native message object
         assert sender and sender_ref
         # logger.info("Retrieving message %s@%s from the message lake", sender, sender_ref)
 
-        content_path = "{}/{}/content.json".format(
-            sender,
-            miniorepo.slash_chunk(sender_ref)
-        )
-        metadata_path = "{}/{}/metadata.json".format(
-            sender,
-            miniorepo.slash_chunk(sender_ref)
-        )
-
-        try:
-            msg_content = json.loads(
-                self.get_object_content(content_path)
-            )
-        except ClientError as ex:
-            if ex.response['Error']['Code'] == 'NoSuchKey':
-                logger.error("Retrieve message at %s: no such key", content_path)
-                return None
-            else:
-                raise
-
-        try:
-            metadata = json.loads(self.get_object_content(metadata_path))
-        except ClientError as ex:
-            if ex.response['Error']['Code'] == 'NoSuchKey':
-                logger.error("Retrieve message metadata at %s: no such key", metadata_path)
-                metadata = None
-            else:
-                raise
+        # the configured layout is tried first, so only messages
+        # written before the layout change cost an extra request
+        if self.layout == LAYOUT_COMBINED:
+            loaders = [self._get_combined, self._get_separate]
+        else:
+            loaders = [self._get_separate, self._get_combined]
+        for loader in loaders:
+            found = loader(sender, sender_ref)
+            if found is not None:
+                msg_content, metadata = found
+                break
+        else:
+            logger.error("Retrieve message %s/%s: no such key", sender, sender_ref)
+            return None
 
         if metadata:
             for key in [
@@ -92,24 +204,135 @@ class MessageLakeMinioRepo(miniorepo.MinioRepo):
 
         return message.Message.from_dict(msg_content)
 
+    def _get_combined(self, sender, sender_ref):
+        """
+        Returns (content, metadata) tuple or None if there is no such message
+        """
+        combined = self._get_json(self._path(sender, sender_ref, "message.json"))
+        if combined is None:
+            return None
+        return combined["content"], combined.get("metadata")
+
+    def _get_separate(self, sender, sender_ref):
+        """
+        Returns (content, metadata) tuple or None if there is no such message
+        """
+        msg_content = self._get_json(self._path(sender, sender_ref, "content.json"))
+        if msg_content is None:
+            return None
+        metadata_path = self._path(sender, sender_ref, "metadata.json")
+        metadata = self._get_json(metadata_path)
+        if metadata is None:
+            logger.error("Retrieve message metadata at %s: no such key", metadata_path)
+        return msg_content, metadata
+
     def update_metadata(self, sender, sender_ref, updates):
         """
         Accepts message details and new metadata fields
         Updates the metadata in the repo
-        There is no locking here, so last requester wins due to the storage nature
+
+        Optimistic locking is used: the object is written only if it has not
+        been changed since it was read (ETag), otherwise it's read again,
+        the updates are merged and the write is retried after a short pause.
         """
-        metadata_path = "{}/{}/metadata.json".format(
-            sender,
-            miniorepo.slash_chunk(sender_ref)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self._update_metadata_once(sender, sender_ref, updates)
+            except ClientError as ex:
+                if ex.response['Error']['Code'] not in CONFLICT_ERROR_CODES:
+                    raise
+                if attempt >= self.UPDATE_MAX_ATTEMPTS:
+                    logger.error(
+                        "Metadata update of %s/%s has failed after %s attempts",
+                        sender, sender_ref, attempt
+                    )
+                    raise
+                logger.info(
+                    "Metadata of %s/%s has been changed concurrently, retrying",
+                    sender, sender_ref
+                )
+                time.sleep(self._get_update_retry_time(attempt))
+
+    def _get_update_retry_time(self, attempt):
+        """exponential back off with jitter"""
+        delay = min(
+            self.UPDATE_RETRY_BASE_SECONDS * 2 ** attempt,
+            self.UPDATE_RETRY_MAX_SECONDS
         )
+        return delay / 2 + random.uniform(0, delay / 2)
 
-        metadata = json.loads(self.get_object_content(metadata_path))
-        metadata.update(updates)
-        metadata_rendered = json.dumps(metadata)
+    def _update_metadata_once(self, sender, sender_ref, updates):
+        # the configured layout is tried first, as get does, so messages
+        # written before the layout change (either way) are updated too
+        if self.layout == LAYOUT_COMBINED:
+            updaters = [self._update_combined_metadata, self._update_separate_metadata]
+        else:
+            updaters = [self._update_separate_metadata, self._update_combined_metadata]
+        for updater in updaters:
+            updated = updater(sender, sender_ref, updates)
+            if updated is not None:
+                return updated
+        raise ClientError(
+            {'Error': {'Code': 'NoSuchKey', 'Message': 'No message {}/{}'.format(sender, sender_ref)}},
+            'GetObject'
+        )
 
-        return self.put_message_related_object(
+    def _update_combined_metadata(self, sender, sender_ref, updates):
+        """
+        Returns None if there is no such message in the combined layout
+        """
+        combined, etag = self._get_json_with_etag(
+            self._path(sender, sender_ref, "message.json")
+        )
+        if combined is None:
+            return None
+        combined["metadata"] = merge_metadata(combined.get("metadata"), updates)
+        return self._put_message_related_object_if_match(
+            etag,
+            sender=sender,
+            sender_ref=sender_ref,
+            rel_path="/message.json",
+            content_body=json.dumps(combined)
+        )
+
+    def _update_separate_metadata(self, sender, sender_ref, updates):
+        """
+        Returns None if there is no such message in the separate layout
+        """
+        metadata, etag = self._get_json_with_etag(
+            self._path(sender, sender_ref, "metadata.json")
+        )
+        if metadata is None:
+            return None
+        metadata_rendered = json.dumps(merge_metadata(metadata, updates))
+
+        return self._put_message_related_object_if_match(
+            etag,
             sender=sender,
             sender_ref=sender_ref,
             rel_path="/metadata.json",
             content_body=metadata_rendered
         )
+
+    def get_journal(self, sender, sender_ref):
+        """
+        Returns the processing journal of the message,
+        which is {status: [names of the completed steps]} dict,
+        or an empty dict if there is nothing yet
+        """
+        return self._get_json(
+            self._path(sender, sender_ref, self.JOURNAL_REL_PATH.lstrip('/'))
+        ) or {}
+
+    def put_journal(self, sender, sender_ref, journal):
+        """
+        Saves the processing journal next to the message content and metadata
+        """
+        return self.put_message_related_object(
+            sender=sender,
+            sender_ref=sender_ref,
+            rel_path=self.JOURNAL_REL_PATH,
+            content_body=json.dumps(journal)
+        )
@@ -0,0 +1,4 @@
+from intergov.repos.subscriptions.minio.miniorepo import (  # NOQA
+    SubscriptionsChangesRepo
+)
+from intergov.repos.subscriptions.index import SubscriptionsIndex  # NOQA
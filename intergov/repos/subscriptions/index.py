@@ -0,0 +1,190 @@
+import datetime
+import threading
+import time
+
+from libtrustbridge.websub.domain import Pattern
+
+from intergov.loggers import logging
+from intergov.monitoring import increase_counter
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = '*'
+
+# predicates under these first segments are unique per message
+# ("message.<sender_ref>.received" light pings), caching them is pointless
+UNCACHED_ROOTS = ('message',)
+
+
+def _segments(predicate):
+    segments = [segment for segment in str(predicate).split('.') if segment]
+    if segments and segments[-1] == WILDCARD:
+        segments.pop()
+    return segments
+
+
+class _Node:
+    __slots__ = ('children', 'subscribers')
+
+    def __init__(self):
+        self.children = {}
+        # None means "not loaded yet"
+        self.subscribers = None
+
+    def size(self):
+        return 1 + sum(child.size() for child in self.children.values())
+
+
+class SubscriptionsIndex:
+    """
+    In-process index of the subscribers by the message predicate.
+
+    Looking up the subscribers in the subscriptions repo takes several
+    S3 list and get requests, but subscriptions change rarely, so the
+    result is kept in the trie of the predicate segments
+    ("UN.CEFACT.Trade.created" -> UN -> CEFACT -> Trade -> created).
+
+    Subscription to "UN.CEFACT.*" changes the subscribers of every
+    predicate under UN.CEFACT, so when the changes repo reports it
+    (checked at most once per check_interval seconds) just that subtree
+    is dropped. Everything is dropped every ttl seconds anyway,
+    so the subscriptions expired since then and the changes missed
+    (or made without the changes repo) are picked up eventually.
+
+    Per-message predicates (see UNCACHED_ROOTS) are always looked up
+    in the repo. The trie is dropped as a whole if it grows over
+    max_nodes, so unexpected unique predicates can't eat the memory.
+    """
+
+    def __init__(
+        self,
+        subscriptions_repo,
+        changes_repo=None,
+        ttl=30,
+        check_interval=5,
+        max_nodes=10000,
+        uncached_roots=UNCACHED_ROOTS
+    ):
+        self.subscriptions = subscriptions_repo
+        self.changes = changes_repo
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.max_nodes = max_nodes
+        self.uncached_roots = set(root.upper() for root in uncached_roots)
+        self._lock = threading.Lock()
+        self._root = _Node()
+        # number of nodes except the root one
+        self._size = 0
+        # increased by every invalidation, so the lookups started before it
+        # don't cache their (possibly outdated) results
+        self._generation = 0
+        self._loaded_at = time.monotonic()
+        self._checked_at = self._loaded_at
+        # changes made before the index is created are irrelevant
+        self._last_change_key = None
+        if changes_repo is not None:
+            self._last_change_key = changes_repo.key_at(datetime.datetime.utcnow())
+
+    def get_subscribers(self, predicate):
+        self._refresh()
+        segments = _segments(predicate)
+        if segments and segments[0].upper() in self.uncached_roots:
+            increase_counter("repos.subscriptions.index.uncached")
+            return self.subscriptions.get_subscriptions_by_pattern(Pattern(predicate))
+        with self._lock:
+            node = self._find(segments)
+            subscribers = node.subscribers if node is not None else None
+            generation = self._generation
+        if subscribers is not None:
+            increase_counter("repos.subscriptions.index.hit")
+            return subscribers
+        increase_counter("repos.subscriptions.index.miss")
+        subscribers = self.subscriptions.get_subscriptions_by_pattern(Pattern(predicate))
+        with self._lock:
+            if generation == self._generation:
+                self._store(segments, subscribers)
+        return subscribers
+
+    def _store(self, segments, subscribers):
+        missing = 0
+        node = self._root
+        for depth, segment in enumerate(segments):
+            node = node.children.get(segment)
+            if node is None:
+                missing = len(segments) - depth
+                break
+        if self._size + missing > self.max_nodes:
+            logger.info("Subscriptions index is too big, dropping it")
+            increase_counter("repos.subscriptions.index.overflow")
+            self._reset()
+        node = self._root
+        for segment in segments:
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _Node()
+                self._size += 1
+            node = child
+        node.subscribers = subscribers
+
+    def _reset(self):
+        self._root = _Node()
+        self._size = 0
+        self._generation += 1
+
+    def invalidate(self, predicate=None):
+        """
+        Drops the subscribers of all the predicates starting with the given one
+        (of everything if None)
+        """
+        with self._lock:
+            if predicate is None:
+                self._reset()
+                return
+            segments = _segments(predicate)
+            if not segments:
+                self._reset()
+                return
+            self._generation += 1
+            # repo may be case insensitive, so let's be on the safe side
+            nodes = [self._root]
+            for segment in segments[:-1]:
+                nodes = [
+                    child
+                    for node in nodes
+                    for name, child in node.children.items()
+                    if name.upper() == segment.upper()
+                ]
+            for node in nodes:
+                # subscribers of the parent predicates don't change,
+                # the subscription is for the predicate and everything under it
+                for name in list(node.children):
+                    if name.upper() == segments[-1].upper():
+                        self._size -= node.children.pop(name).size()
+
+    def _find(self, segments):
+        node = self._root
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._loaded_at >= self.ttl:
+            self._loaded_at = now
+            self.invalidate()
+        if self.changes is None or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            changes = self.changes.list_changes(start_after=self._last_change_key)
+        except Exception as e:
+            logger.error("Unable to get the subscription changes, dropping the whole index")
+            logger.exception(e)
+            self.invalidate()
+            return
+        for key, predicate in changes:
+            logger.info("Subscriptions to %s have changed", predicate)
+            self.invalidate(predicate)
+            self._last_change_key = key
@@ -0,0 +1,61 @@
+import datetime
+import uuid
+
+from libtrustbridge.repos import miniorepo
+
+# S3 limit for ListObjectsV2
+MAX_KEYS = 1000
+
+
+class SubscriptionsChangesRepo(miniorepo.MinioRepo):
+    """
+    Log of the subscription changes (predicates subscribed or unsubscribed),
+    so the subscriptions index of each callbacks spreader may drop just
+    the affected part instead of waiting for its TTL.
+
+    Each change is an empty object {PREFIX}{time}.{uuid}/{predicate},
+    so new changes are found by a single list request
+    starting after the last key seen.
+    Old changes are not needed and may be removed by the bucket lifecycle rule.
+    """
+
+    DEFAULT_BUCKET = 'subscriptions-changes'
+    PREFIX = 'changes/'
+
+    @classmethod
+    def key_at(cls, moment):
+        """
+        Key right before all the changes made at or after the moment
+        """
+        return "{}{}".format(cls.PREFIX, moment.strftime('%Y%m%dT%H%M%S%f'))
+
+    def post(self, predicate):
+        key = "{}.{}/{}".format(
+            self.key_at(datetime.datetime.utcnow()),
+            uuid.uuid4().hex,
+            predicate
+        )
+        self.put_object(clean_path=key, content_body="")
+        return key
+
+    def list_changes(self, start_after=None):
+        """
+        Returns list of (key, predicate) of the changes after the key
+        (all of them if None), oldest first
+        """
+        changes = []
+        kwargs = {
+            'Bucket': self.bucket,
+            'Prefix': self.PREFIX,
+            'MaxKeys': MAX_KEYS,
+        }
+        while True:
+            if start_after:
+                kwargs['StartAfter'] = start_after
+            resp = self.client.list_objects_v2(**kwargs)
+            keys = [obj['Key'] for obj in resp.get('Contents') or []]
+            for key in keys:
+                changes.append((key, key[len(self.PREFIX):].split('/', 1)[-1]))
+            if not keys or not resp.get('IsTruncated'):
+                return changes
+            start_after = keys[-1]
@@ -9,14 +9,10 @@ class GenericMemoryTransport:
             self.data = []
 
     def get_messages(self, channel_filter=None):
-        out = []
-        for adict in self.data:
-            msg = gd.Message.from_dict(adict)
-            if channel_filter:
-                if not channel_filter.screen_message(msg):
-                    out.append(msg)
-            else:
-                out.append(msg)
+        out = [gd.Message.from_dict(adict) for adict in self.data]
+        if channel_filter:
+            mask = channel_filter.screen_messages(out)
+            out = [msg for msg, blocked in zip(out, mask) if not blocked]
         return out
 
     def post_message(self, msg, channel_filter=None):
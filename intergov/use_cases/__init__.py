@@ -2,6 +2,7 @@
 # everything is imported instead of just UC class)
 # to dramatically simplify imports of the use cases
 
+from intergov.use_cases.archive_outbox_messages import ArchiveOutboxMessagesUseCase  # NOQA
 from intergov.use_cases.authenticated_object_access import AuthenticatedObjectAccessUseCase  # NOQA
 
 from intergov.use_cases.deliver_callback import DeliverCallbackUseCase  # NOQA
@@ -17,6 +18,7 @@ from intergov.use_cases.store_object import StoreObjectUseCase  # NOQA
 from intergov.use_cases.subscription_deregister import SubscriptionDeregisterUseCase  # NOQA
 from intergov.use_cases.subscription_register import SubscriptionRegisterUseCase  # NOQA
 from intergov.use_cases.reject_pending_message import RejectPendingMessageUseCase  # NOQA
+from intergov.use_cases.replay_callback_dead_letters import ReplayCallbackDeadLettersUseCase  # NOQA
 
 from .retrieve_and_store_foreign_documents import RetrieveAndStoreForeignDocumentsUseCase  # NOQA
 from .request_channel_api import RequestChannelAPIUseCase  # NOQA
@@ -0,0 +1,28 @@
+from intergov.monitoring import increase_counter, statsd_timer
+from intergov.use_cases.common import BaseUseCase
+
+
+class ArchiveOutboxMessagesUseCase(BaseUseCase):
+    """
+    Moves the old accepted and rejected messages
+    from the api outbox to its archive table, batch by batch.
+
+    Returns number of messages archived, so 0 means
+    there is nothing to archive at the moment.
+    """
+
+    def __init__(self, outbox_repo, older_than_seconds, batch_size):
+        self.outbox = outbox_repo
+        self.older_than_seconds = older_than_seconds
+        self.batch_size = batch_size
+
+    @statsd_timer("usecase.ArchiveOutboxMessagesUseCase.execute")
+    def execute(self):
+        super().execute()
+        archived = self.outbox.archive_final(
+            self.older_than_seconds,
+            batch_size=self.batch_size
+        )
+        if archived:
+            increase_counter("usecase.ArchiveOutboxMessagesUseCase.archived", archived)
+        return archived
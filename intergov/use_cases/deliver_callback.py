@@ -1,14 +1,32 @@
-import random
-import requests
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 from libtrustbridge.websub import repos
 
+from intergov import http_client
 from intergov.loggers import logging
-from intergov.monitoring import statsd_timer
+from intergov.monitoring import increase_counter, statsd_timer
+from intergov.rate_limiter import CallbackRateLimiter, parse_retry_after, queue_delay
 from intergov.use_cases.common import BaseUseCase
 
 logger = logging.getLogger(__name__)
 
 
+def callback_job(job, retry):
+    """
+    Copy of the delivery job (with the payload or the key of the stored one)
+    with the given retries count
+    """
+    new_job = {'s': job['s'], 'retry': retry}
+    if 'payload_key' in job:
+        new_job['payload_key'] = job['payload_key']
+    else:
+        new_job['payload'] = job.get('payload')
+    return new_job
+
+
 class DeliverCallbackUseCase(BaseUseCase):
     """
     Is used by a callback deliverer worker
@@ -20,13 +38,52 @@ class DeliverCallbackUseCase(BaseUseCase):
     or, in case of any error, not to be deleted and to be tried again
     (up to MAX_RETRIES times)
 
-    TODO: rate limits, no more than 100 messages to a single url per 10 seconds?
+    Callbacks are rate limited per host (see CallbackRateLimiter):
+    the job for the host over its limit (or blocked by Retry-After)
+    is put back to the queue with the delay and the same retries count.
+    Failed ones are re-scheduled with the exponential backoff.
+    Jobs dropped after MAX_RETRIES are saved to the dead letter repo
+    (if configured), see ReplayCallbackDeadLettersUseCase.
+
+    Jobs with "payload_key" instead of "payload" are for the payloads
+    stored to the payload repo by DispatchMessageToSubscribersUseCase;
+    recently used ones are kept in memory, as most jobs of the batch
+    are usually about the same message.
     """
 
     MAX_RETRIES = 2
 
-    def __init__(self, delivery_outbox_repo: repos.DeliveryOutboxRepo):
+    # HTTP statuses the Retry-After header is respected for
+    RETRY_AFTER_STATUSES = (429, 503)
+
+    # number of the stored payloads kept in memory
+    PAYLOAD_CACHE_SIZE = 32
+
+    def __init__(
+        self,
+        delivery_outbox_repo: repos.DeliveryOutboxRepo,
+        workers=0,
+        per_host_limit=4,
+        rate_limiter=None,
+        dead_letter_repo=None,
+        payload_repo=None
+    ):
         self.delivery_outbox = delivery_outbox_repo
+        self.payload_repo = payload_repo
+        self._payloads = OrderedDict()
+        self._payloads_lock = threading.Lock()
+        # jobs dropped after MAX_RETRIES are saved there, if configured
+        self.dead_letter_repo = dead_letter_repo
+        self.rate_limiter = rate_limiter or CallbackRateLimiter()
+        # no more than per_host_limit callbacks to the same host at once,
+        # so one slow subscriber can't take all the workers
+        self.per_host_limit = max(1, per_host_limit)
+        self.executor = None
+        if workers and workers > 1:
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="deliver-callback"
+            )
 
     def execute(self):
         deliverable = self.delivery_outbox.get_job()
@@ -36,31 +93,216 @@ class DeliverCallbackUseCase(BaseUseCase):
         (queue_msg_id, job) = deliverable
         return self.process(queue_msg_id, job)
 
+    def execute_batch(self, max_jobs, wait_time_seconds=0):
+        """
+        Same as execute() but for up to max_jobs at once, delivered
+        concurrently (if the workers are configured). The delivery outbox
+        repo must support the batch operations (get_jobs, delete_many, post_jobs).
+
+        Returns None if there were no jobs, True if all of them
+        were delivered and False otherwise.
+        """
+        fetched = self.delivery_outbox.get_jobs(max_jobs, wait_time_seconds)
+        if not fetched:
+            return None
+        super().execute()
+        return self.process_batch(fetched)
+
+    @statsd_timer("usecase.DeliverCallbackUseCase.process_batch")
+    def process_batch(self, fetched):
+        to_deliver = []
+        throttled = []
+        for queue_msg_id, job in fetched:
+            if int(job.get('retry', 0)) > self.MAX_RETRIES:
+                self._drop(job)
+                continue
+            wait = self.rate_limiter.acquire(job['s'])
+            if wait:
+                throttled.append((queue_msg_id, job, wait))
+            else:
+                to_deliver.append((queue_msg_id, job))
+
+        delivered = self._deliver_many([job for queue_msg_id, job in to_deliver])
+
+        # failed ones are re-posted with retries count increased,
+        # before the originals are deleted, so nothing is lost
+        # (queue_msg_id, job, delay seconds)
+        to_post = []
+        for queue_msg_id, job, wait in throttled:
+            # not an attempt, so the retries count is kept
+            to_post.append((queue_msg_id, job, wait))
+        for (queue_msg_id, job), is_delivered in zip(to_deliver, delivered):
+            if is_delivered:
+                continue
+            delay = self.rate_limiter.record_failure(job['s'])
+            retry_number = int(job.get('retry', 0))
+            if retry_number + 1 > self.MAX_RETRIES:
+                self._drop(job)
+                continue
+            to_post.append((queue_msg_id, callback_job(job, retry_number + 1), delay))
+        not_posted = set()
+        if to_post:
+            logger.info(
+                "%s notifications are failed or throttled, re-schedule them",
+                len(to_post)
+            )
+            not_posted = self._post_delayed(to_post)
+
+        # the ones failed to be re-posted are left in the queue to be received again
+        not_deleted = set(self.delivery_outbox.delete_many(
+            [queue_msg_id for queue_msg_id, job in fetched if queue_msg_id not in not_posted]
+        ))
+        for queue_msg_id in not_deleted:
+            # will be received again, so may be delivered twice
+            logger.error(
+                "Unable to delete message %s from the delivery_outbox",
+                queue_msg_id
+            )
+
+        increase_counter("usecase.DeliverCallbackUseCase.throttled", len(throttled))
+        delivered_count = sum(1 for is_delivered in delivered if is_delivered)
+        increase_counter("usecase.DeliverCallbackUseCase.delivered", delivered_count)
+        return delivered_count == len(fetched) and not not_deleted and not not_posted
+
+    def _drop(self, job):
+        logger.error(
+            "Dropping notification %s about %s due to max retries reached",
+            job['s'],
+            job.get('payload_key', job.get('payload'))
+        )
+        increase_counter("usecase.DeliverCallbackUseCase.dropped")
+        if self.dead_letter_repo is None:
+            return
+        try:
+            self.dead_letter_repo.post(job, reason="max retries reached")
+        except Exception as e:
+            logger.error("Unable to save the dropped notification to the dead letter repo")
+            logger.exception(e)
+
+    def _post_delayed(self, jobs_with_delays):
+        """
+        Accepts list of (queue_msg_id, job, delay seconds),
+        returns set of queue_msg_ids of the jobs failed to be posted
+        """
+        by_delay = {}
+        for queue_msg_id, job, delay in jobs_with_delays:
+            by_delay.setdefault(queue_delay(delay), []).append((queue_msg_id, job))
+        not_posted = set()
+        for delay_seconds, items in by_delay.items():
+            failed = self.delivery_outbox.post_jobs(
+                [job for queue_msg_id, job in items],
+                delay_seconds=delay_seconds
+            )
+            failed_ids = set(id(job) for job in failed or [])
+            not_posted.update(
+                queue_msg_id for queue_msg_id, job in items if id(job) in failed_ids
+            )
+        if not_posted:
+            logger.error(
+                "Unable to re-schedule %s notifications, they are left in the delivery_outbox",
+                len(not_posted)
+            )
+            increase_counter("usecase.DeliverCallbackUseCase.not_rescheduled", len(not_posted))
+        return not_posted
+
+    def _deliver_many(self, jobs):
+        """
+        Returns list of booleans, True for each delivered job
+
+        Jobs are grouped by the callback host, each host gets up to
+        per_host_limit lanes, jobs of the lane are delivered one by one.
+        """
+        by_host = {}
+        for i, job in enumerate(jobs):
+            by_host.setdefault(urlparse(job['s']).netloc, []).append(i)
+        lanes = []
+        for indexes in by_host.values():
+            for lane_number in range(min(self.per_host_limit, len(indexes))):
+                lanes.append(indexes[lane_number::self.per_host_limit])
+
+        delivered = [False] * len(jobs)
+
+        def deliver_lane(lane):
+            for i in lane:
+                delivered[i] = self._safe_deliver(jobs[i])
+
+        if self.executor is None:
+            for lane in lanes:
+                deliver_lane(lane)
+        else:
+            for future in [self.executor.submit(deliver_lane, lane) for lane in lanes]:
+                future.result()
+        return delivered
+
+    def _get_payload(self, job):
+        if 'payload_key' not in job:
+            return job.get('payload')
+        key = job['payload_key']
+        with self._payloads_lock:
+            if key in self._payloads:
+                self._payloads.move_to_end(key)
+                return self._payloads[key]
+        if self.payload_repo is None:
+            raise ValueError("The job has payload_key {} but no payload repo is configured".format(key))
+        payload = self.payload_repo.get(key)
+        with self._payloads_lock:
+            self._payloads[key] = payload
+            while len(self._payloads) > self.PAYLOAD_CACHE_SIZE:
+                self._payloads.popitem(last=False)
+        return payload
+
+    def _safe_deliver(self, job):
+        try:
+            is_delivered = self._deliver_notification(job['s'], self._get_payload(job))
+        except Exception as e:
+            logger.exception(e)
+            return False
+        if is_delivered:
+            self.rate_limiter.record_success(job['s'])
+        return is_delivered
+
     @statsd_timer("usecase.DeliverCallbackUseCase.process")
     def process(self, queue_msg_id, job):
         # TODO: test to ensure this message has a callback_url
         subscribe_url = job['s']
-        payload = job.get('payload')
 
         retry_number = int(job.get('retry', 0))
         # second line of defence. Just in case
 
         if retry_number > self.MAX_RETRIES:
-            logger.error(
-                "Dropping notification %s about %s due to max retries reached",
-                subscribe_url,
-                payload
-            )
+            self._drop(job)
             self.delivery_outbox.delete(queue_msg_id)
             return False
 
-        try:
-            is_delivered = self._deliver_notification(
-                subscribe_url, payload
-            )
-        except Exception as e:
-            logger.exception(e)
-            is_delivered = False
+        wait = self.rate_limiter.acquire(subscribe_url)
+        if wait:
+            increase_counter("usecase.DeliverCallbackUseCase.throttled")
+            # not an attempt, so the retries count is kept;
+            # re-posted before the deletion, so nothing is lost
+            try:
+                posted = self.delivery_outbox.post_job(job, delay_seconds=queue_delay(wait))
+            except Exception as e:
+                logger.exception(e)
+                posted = False
+            if not posted:
+                # left in the queue, will be received again after the visibility timeout
+                logger.error(
+                    "Unable to re-schedule throttled message %s, it's left in the delivery_outbox",
+                    queue_msg_id
+                )
+                increase_counter("usecase.DeliverCallbackUseCase.not_rescheduled")
+                return False
+            if not self.delivery_outbox.delete(queue_msg_id):
+                # will be received again, so may be delivered twice
+                logger.error(
+                    "Unable to delete message %s from the delivery_outbox",
+                    queue_msg_id
+                )
+            return False
+
+        is_delivered = self._safe_deliver(job)
+        if not is_delivered:
+            retry_delay = self.rate_limiter.record_failure(subscribe_url)
 
         # we always delete a message, because we want to re-send it with
         # retries count increased
@@ -78,23 +320,13 @@ class DeliverCallbackUseCase(BaseUseCase):
         if not is_delivered:
             # @Neketek: I think it's better to not post the job at all instead of filtering it
             if retry_number + 1 > self.MAX_RETRIES:
-                logger.error(
-                    "Dropping notification %s about %s due to max retries reached",
-                    subscribe_url,
-                    payload
-                )
+                self._drop(job)
                 return False
             logger.info("Delivery failed, re-schedule it")
             self.delivery_outbox.post_job(
-                {
-                    's': subscribe_url,
-                    'payload': payload,
-                    'retry': retry_number + 1
-                },
-                # put it to the end of queue and with some nice delay
-                # TODO: delay = retry_number * 30 + random.randint(0, 100)
-                # for real cases (it's too slow for development)
-                delay_seconds=random.randint(1, 10)
+                callback_job(job, retry_number + 1),
+                # put it to the end of queue with the backoff delay
+                delay_seconds=queue_delay(retry_delay)
             )
             return False
 
@@ -103,7 +335,6 @@ class DeliverCallbackUseCase(BaseUseCase):
     def _deliver_notification(self, url, payload):
         # https://indieweb.org/How_to_publish_and_consume_WebSub
         # https://www.w3.org/TR/websub/#x7-content-distribution
-        # TODO: respect Retry-After header from the receiver
         # TODO: move to env variable, is unlikely to be used anyway
         hub_url = "127.0.0.1:5102"
 
@@ -111,7 +342,7 @@ class DeliverCallbackUseCase(BaseUseCase):
             "Sending WebSub payload \n    %s to callback URL \n    %s",
             payload, url
         )
-        resp = requests.post(
+        resp = http_client.post(
             url,
             json=payload,
             headers={
@@ -125,6 +356,11 @@ class DeliverCallbackUseCase(BaseUseCase):
         if str(resp.status_code).startswith('2'):
             return True
         else:
+            if resp.status_code in self.RETRY_AFTER_STATUSES:
+                retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+                if retry_after is not None:
+                    logger.info("Callback host of %s asks to retry after %s seconds", url, retry_after)
+                    self.rate_limiter.block(url, retry_after)
             logger.error(
                 "Subscription url %s seems to be invalid, returns %s",
                 url,
@@ -3,7 +3,8 @@ import json
 from libtrustbridge.websub import repos
 
 from intergov.loggers import logging
-from intergov.monitoring import statsd_timer
+from intergov.monitoring import increase_counter, statsd_timer
+from intergov.repos.base.elasticmq.batch import BatchElasticMQRepoMixin
 from intergov.serializers import generic_discrete_message as ser
 from intergov.use_cases.common import BaseUseCase
 
@@ -30,15 +31,29 @@ class DispatchMessageToSubscribersUseCase(BaseUseCase):
     Note: In this application
     the subscription signature
     is based on the message predicate.
+
+    If the subscriptions index is given, subscribers are looked up
+    there instead of the subscriptions repo (see SubscriptionsIndex).
+
+    Jobs are posted using the batch calls if the delivery outbox repo
+    supports them. If the payload repo is given, payloads bigger than
+    payload_size_limit bytes are stored there once, and the jobs
+    have just the key ("payload_key" instead of "payload").
     """
 
     def __init__(
             self, notifications_repo: repos.NotificationsRepo,
             delivery_outbox_repo: repos.DeliveryOutboxRepo,
-            subscriptions_repo: repos.SubscriptionsRepo):
+            subscriptions_repo: repos.SubscriptionsRepo,
+            subscriptions_index=None,
+            payload_repo=None,
+            payload_size_limit=16 * 1024):
         self.notifications = notifications_repo
         self.delivery_outbox = delivery_outbox_repo
         self.subscriptions = subscriptions_repo
+        self.subscriptions_index = subscriptions_index
+        self.payload_repo = payload_repo
+        self.payload_size_limit = payload_size_limit
 
     def execute(self):
         fetched_publish = self.notifications.get_job()
@@ -75,17 +90,22 @@ class DispatchMessageToSubscribersUseCase(BaseUseCase):
         else:
             payload = message_job
 
-        for s in subscribers:
-            if not s.is_valid:
-                continue
-            job = {
-                's': s.callback_url,  # subscribed callback url
-                'payload': payload  # the payload to be sent to the callback
-            }
-            logger.info("Scheduling notification of \n[%s] with payload \n%s", s.callback_url, payload)
-            status = self.delivery_outbox.post_job(job)
-            if not status:
-                all_OK = False
+        callback_urls = [s.callback_url for s in subscribers if s.is_valid]
+        if callback_urls:
+            logger.info("Scheduling notification of \n%s with payload \n%s", callback_urls, payload)
+            job_payload = self._get_job_payload(payload)
+            jobs = [
+                dict(job_payload, s=callback_url)  # subscribed callback url
+                for callback_url in callback_urls
+            ]
+            if isinstance(self.delivery_outbox, BatchElasticMQRepoMixin):
+                if self.delivery_outbox.post_jobs(jobs):
+                    all_OK = False
+            else:
+                for job in jobs:
+                    status = self.delivery_outbox.post_job(job)
+                    if not status:
+                        all_OK = False
 
         if all_OK:
             self.notifications.delete(publish_msg_id)
@@ -93,9 +113,32 @@ class DispatchMessageToSubscribersUseCase(BaseUseCase):
         else:
             return False
 
+    def _get_job_payload(self, payload):
+        """
+        Payload part of the job, the same for all the subscribers:
+        {"payload": ...} or {"payload_key": ...} for the big one
+        """
+        if self.payload_repo is None:
+            return {'payload': payload}
+        content = self.payload_repo.serialize(payload)
+        if len(content.encode('utf-8')) <= self.payload_size_limit:
+            return {'payload': payload}
+        try:
+            key = self.payload_repo.post(payload, content=content)
+        except Exception as e:
+            # the queue may still take it, just less efficiently
+            logger.error("Unable to store the callback payload, it's sent inline")
+            logger.exception(e)
+            return {'payload': payload}
+        increase_counter("usecase.DispatchMessageToSubscribersUseCase.payload_stored")
+        return {'payload_key': key}
+
     def _get_subscribers(self, predicate):
-        pattern = repos.Pattern(predicate)
-        subscribers = self.subscriptions.get_subscriptions_by_pattern(pattern)
+        if self.subscriptions_index is not None:
+            subscribers = self.subscriptions_index.get_subscribers(predicate)
+        else:
+            pattern = repos.Pattern(predicate)
+            subscribers = self.subscriptions.get_subscriptions_by_pattern(pattern)
         if not subscribers:
             logger.info("Nobody to notify about the message %s", predicate)
         return subscribers
@@ -1,8 +1,7 @@
 import base64
 import datetime
 
-import requests
-
+from intergov import http_client
 from intergov.loggers import logging
 from intergov.use_cases.common import BaseUseCase
 
@@ -52,7 +51,7 @@ class GetCognitoAuthUseCase(BaseUseCase):
         headers = {
             'Authorization': f'Basic {cognito_auth}',
         }
-        token_resp = requests.post(self.token_endpoint, data=data, headers=headers)
+        token_resp = http_client.post(self.token_endpoint, data=data, headers=headers)
 
         token_resp.raise_for_status()
         json_resp = token_resp.json()
@@ -1,6 +1,7 @@
 import random
 import uuid
 
+from intergov.channels.routing import RoutingIndex
 from intergov.domain.wire_protocols.generic_discrete import Message
 from intergov.loggers import logging
 from intergov.monitoring import increase_counter
@@ -62,6 +63,8 @@ class ProcessChannelNotificationUseCase(ChannelNotificationUseCase):
 
     def __init__(self, channel_notification_repo: ChannelNotificationRepo, bc_inbox_repo: BCInboxRepo, routing_table):
         super().__init__(channel_notification_repo)
+        if not isinstance(routing_table, RoutingIndex):
+            routing_table = RoutingIndex(routing_table)
         self.routing_table = routing_table
         self.enqueue_message_use_case = EnqueueMessageUseCase(bc_inbox_repo)
 
@@ -1,8 +1,9 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from intergov.domain.wire_protocols.generic_discrete import Message
 from intergov.loggers import logging  # NOQA
-from intergov.monitoring import statsd_timer
+from intergov.monitoring import increase_counter, statsd_timer
 from intergov.use_cases.common import BaseUseCase
 
 logger = logging.getLogger(__name__)
@@ -16,8 +17,8 @@ class ProcessMessageUseCase(BaseUseCase):
     """
     Used by the message processing background worker.
 
-    Gets one message from the channel inbox
-    and does number of things with it.
+    Gets one message (or a batch of them, see execute_batch)
+    from the channel inbox and does number of things with it.
 
     * dispatch document retrieval job
       (if the message is from a foreign source)
@@ -36,8 +37,24 @@ class ProcessMessageUseCase(BaseUseCase):
     to get the logic right
     (that is why it takes a jurisdiction parameter
     when it is instantiated).
+
+    If side_effects_workers is greater than 1 then independent side effects
+    (message lake, ACL and outbox/retrieval posts) are done concurrently
+    using a thread pool of that size. Notifications are posted only
+    after the message is in the message lake (see STEP_DEPENDENCIES).
+
+    If step_journal_repo is given then completed steps are recorded
+    there (per message and status), so when the message is redelivered
+    after a partial failure only the failed steps are done again.
     """
 
+    # steps which must not start until the others have succeeded:
+    # subscribers may fetch the message from the lake once notified
+    STEP_DEPENDENCIES = {
+        "notification": ("message_lake",),
+        "notification_job": ("message_lake",),
+    }
+
     def __init__(
             self,
             jurisdiction,
@@ -46,7 +63,9 @@ class ProcessMessageUseCase(BaseUseCase):
             object_acl_repo,
             object_retreval_repo,
             notifications_repo,
-            blockchain_outbox_repo):
+            blockchain_outbox_repo,
+            side_effects_workers=None,
+            step_journal_repo=None):
         self.jurisdiction = jurisdiction
         self.bc_inbox_repo = bc_inbox_repo
         self.message_lake_repo = message_lake_repo
@@ -54,6 +73,16 @@ class ProcessMessageUseCase(BaseUseCase):
         self.object_retreval_repo = object_retreval_repo
         self.notifications_repo = notifications_repo
         self.blockchain_outbox_repo = blockchain_outbox_repo
+        self.step_journal_repo = step_journal_repo
+        # each side effect is a network round trip to different services,
+        # so doing them in parallel makes message latency
+        # close to the slowest one instead of the sum of them
+        self.executor = None
+        if side_effects_workers and side_effects_workers > 1:
+            self.executor = ThreadPoolExecutor(
+                max_workers=side_effects_workers,
+                thread_name_prefix="process-message"
+            )
 
     def execute(self):
         # Get the message from the bc_inbox_repo (which is a events queue)
@@ -64,59 +93,95 @@ class ProcessMessageUseCase(BaseUseCase):
         (queue_message_id, message) = fetched_bc_inbox
         return self.process(queue_message_id, message)
 
-    @statsd_timer("usecase.ProcessMessageUseCase.process")
-    def process(self, queue_message_id, message):
-        # let it be procssed
-        logger.info("Received message to process: %s", message)
+    def execute_batch(self, max_messages, wait_time_seconds=0):
+        """
+        Same as execute() but for up to max_messages at once.
 
-        # TODO: if something is fine and something is failed then first
-        # steps will be done again
-        # fine for object storage but not for queues
-        try:
-            ml_OK = self.message_lake_repo.post(message)
-        except Exception as e:
-            logger.exception(e)
-            ml_OK = False
-        try:
-            acl_OK = self.object_acl_repo.post(message)
-        except Exception as e:
-            logger.exception(e)
-            acl_OK = False
+        Returns None if there were no messages, True if all of them
+        were processed and False if at least one has failed (failed ones
+        stay in the queue and will be retried after visibility timeout).
+        """
+        fetched = self.bc_inbox_repo.get_many(max_messages, wait_time_seconds)
+        if not fetched:
+            return None
+        super().execute()
+        return self.process_batch(fetched)
+
+    @statsd_timer("usecase.ProcessMessageUseCase.process_batch")
+    def process_batch(self, fetched):
+        posted_to_outbox = self._post_batch_to_outbox(
+            [message for queue_message_id, message in fetched]
+        )
+        processed_ids = []
+        for queue_message_id, message in fetched:
+            try:
+                is_processed = self._process_message(
+                    message,
+                    done_steps=["outbox"] if id(message) in posted_to_outbox else []
+                )
+            except Exception as e:
+                logger.exception(e)
+                is_processed = False
+            if is_processed:
+                processed_ids.append(queue_message_id)
+        if processed_ids:
+            # one batch call instead of one call per message
+            self.bc_inbox_repo.delete_many(processed_ids)
+        increase_counter("usecase.ProcessMessageUseCase.batch_processed", len(processed_ids))
+        return len(processed_ids) == len(fetched)
 
+    def _post_batch_to_outbox(self, messages):
+        """
+        Posts all outgoing messages of the batch to the outbox
+        using a single statement if the repo supports it.
+        Returns set of id() of the posted messages, the rest are posted
+        one by one by the usual outbox step.
+        """
+        post_many = getattr(self.blockchain_outbox_repo, "post_many", None)
+        outgoing = [m for m in messages if self._is_outgoing(m)]
+        if not post_many or not outgoing:
+            return set()
         try:
-            # we delay it a little to make sure the message has got to the repo
-            # and remove status because notifications don't need it
-            message_without_status = Message.from_dict(
-                message.to_dict(exclude=['status'])
-            )
-            # fat ping for ones who understand
-            pub_OK = self.notifications_repo.post(
-                message_without_status,
-                delay_seconds=3
-            )
-            # light ping for ones who want everything
-            self.notifications_repo.post_job(
-                {
-                    "predicate": f'message.{message.sender_ref}.received',
-                    "sender_ref": f"{message.sender}:{message.sender_ref}"
-                }
-            )
+            results = post_many(outgoing)
         except Exception as e:
             logger.exception(e)
-            pub_OK = False
+            return set()
+        return {
+            id(message)
+            for message, result in zip(outgoing, results)
+            if result
+        }
+
+    def _is_outgoing(self, message):
+        # our jurisdiction -> remote
+        return str(message.sender) == str(self.jurisdiction) and message.status == 'pending'
+
+    def process(self, queue_message_id, message):
+        if not self._process_message(message):
+            return False
+        self.bc_inbox_repo.delete(queue_message_id)
+        return True
+
+    @statsd_timer("usecase.ProcessMessageUseCase.process")
+    def _process_message(self, message, done_steps=()):
+        # let it be procssed
+        logger.info("Received message to process: %s", message)
+
+        # if something is fine and something is failed then first
+        # steps will be done again unless we have the step journal
+        steps = [
+            ("message_lake", self._post_to_message_lake),
+            ("object_acl", self._post_to_object_acl),
+            ("notification", self._post_notification),
+            ("notification_job", self._post_notification_job),
+        ]
 
         # blockchain part - pass the message to the blockchain worker
         # so it can be shared to the foreign parties
-        outbox_OK = True
-        ret_OK = True
-        if str(message.sender) == str(self.jurisdiction) and message.status == 'pending':
-            # our jurisdiction -> remote
+        is_strange = False
+        if self._is_outgoing(message):
             logger.info("Sending message to the channels: %s", message.subject)
-            try:
-                outbox_OK = self.blockchain_outbox_repo.post(message)
-            except Exception as e:
-                logger.exception(e)
-                outbox_OK = False
+            steps.append(("outbox", self._post_to_outbox))
         elif str(message.sender) != str(self.jurisdiction) and message.status == 'received':
             # Incoming message from remote juridsiction
             # might need to download remote documents using the
@@ -129,15 +194,7 @@ class ProcessMessageUseCase(BaseUseCase):
             logger.info(
                 "Scheduling download remote documents for: %s", message.subject
             )
-            try:
-                ret_OK = self.object_retreval_repo.post_job({
-                    "action": "download-object",
-                    "sender": message.sender,
-                    "object": message.obj
-                })
-            except Exception as e:
-                logger.exception(e)
-                ret_OK = False
+            steps.append(("object_retrieval", self._post_retrieval_job))
         else:
             # strange situation
             logger.warning(
@@ -146,18 +203,162 @@ class ProcessMessageUseCase(BaseUseCase):
                 self.jurisdiction,
                 message.status
             )
+            is_strange = True
+
+        # done in advance (batch mode) or during the previous attempts
+        journal = self._get_journal(message)
+        done_steps = list(done_steps) + [
+            name for name in (journal or {}).get(str(message.status)) or []
+            if name not in done_steps
+        ]
+        if done_steps:
+            logger.info(
+                "[%s] Steps %s are already done, skipping them",
+                message.sender_ref, done_steps
+            )
+            steps = [(name, func) for name, func in steps if name not in done_steps]
+        results = self._run_steps(steps, message, done_steps)
+        newly_done_steps = [name for (name, func), ok in zip(steps, results) if ok]
+        if newly_done_steps:
+            self._save_done_steps(message, done_steps + newly_done_steps, journal)
+        if is_strange:
             return False
 
-        if ml_OK and acl_OK and ret_OK and pub_OK and outbox_OK:
-            self.bc_inbox_repo.delete(queue_message_id)
+        if all(results):
             return True
         else:
             logger.error("Task processing failed, will try again later")
-            # what TODO with the failed ones?
-            # the problem is the fact that we have submitted message
-            # to some repos and some other failed,
-            # which means we must retry just failed submissions
+            # we have submitted message to some repos and some other failed,
             # and it may introduce a tricky state when some external message
             # processors will get info from the one source and won't get it
             # from the another. They should wait then.
             return False
+
+    def _get_journal(self, message):
+        """
+        Returns the step journal of the message ({} if there is nothing yet)
+        or None if it can't be read
+        """
+        if self.step_journal_repo is None:
+            return None
+        try:
+            return self.step_journal_repo.get_journal(
+                str(message.sender), message.sender_ref
+            )
+        except Exception as e:
+            # nothing bad, just all steps will be done
+            logger.exception(e)
+            return None
+
+    def _save_done_steps(self, message, done_steps, journal):
+        """
+        Updates the steps of the message status in the journal,
+        the steps done for the other statuses are kept
+        """
+        if self.step_journal_repo is None:
+            return
+        if journal is None:
+            # saving would erase the steps of the other statuses
+            logger.warning(
+                "[%s] Step journal hasn't been read, done steps are not recorded",
+                message.sender_ref
+            )
+            return
+        try:
+            journal = dict(journal)
+            journal[str(message.status)] = done_steps
+            self.step_journal_repo.put_journal(
+                str(message.sender), message.sender_ref, journal
+            )
+        except Exception as e:
+            logger.exception(e)
+
+    def _run_steps(self, steps, message, done_steps=()):
+        """
+        Steps are done in waves: each wave has all the steps
+        whose dependencies (STEP_DEPENDENCIES) are done, the steps
+        depending on the failed ones are not done at all.
+        If we have the executor the steps of the wave are done concurrently;
+        the result is the list of booleans in the same order as steps
+        """
+        results = {}
+        left = list(steps)
+        while left:
+            wave = []
+            waiting = []
+            for name, func in left:
+                dependencies = self.STEP_DEPENDENCIES.get(name, ())
+                if any(results.get(dep) is False for dep in dependencies):
+                    logger.warning(
+                        "[%s] Step %s is skipped, it depends on the failed %s",
+                        message.sender_ref, name, dependencies
+                    )
+                    results[name] = False
+                elif all(dep in done_steps or results.get(dep) for dep in dependencies):
+                    wave.append((name, func))
+                else:
+                    waiting.append((name, func))
+            if not wave:
+                # nothing to wait for, steps depend on the missing ones
+                for name, func in waiting:
+                    results[name] = False
+                break
+            for (name, func), ok in zip(wave, self._run_wave(wave, message)):
+                results[name] = ok
+            left = waiting
+        return [results[name] for name, func in steps]
+
+    def _run_wave(self, steps, message):
+        if self.executor is None:
+            return [self._run_step(name, func, message) for name, func in steps]
+        futures = [
+            self.executor.submit(self._run_step, name, func, message)
+            for name, func in steps
+        ]
+        return [f.result() for f in futures]
+
+    def _run_step(self, name, func, message):
+        try:
+            return bool(func(message))
+        except Exception as e:
+            logger.error("[%s] Step %s has failed", message.sender_ref, name)
+            logger.exception(e)
+            return False
+
+    def _post_to_message_lake(self, message):
+        return self.message_lake_repo.post(message)
+
+    def _post_to_object_acl(self, message):
+        return self.object_acl_repo.post(message)
+
+    def _post_notification(self, message):
+        # we delay it a little to make sure the message has got to the repo
+        # and remove status because notifications don't need it
+        message_without_status = Message.from_dict(
+            message.to_dict(exclude=['status'])
+        )
+        # fat ping for ones who understand
+        return self.notifications_repo.post(
+            message_without_status,
+            delay_seconds=3
+        )
+
+    def _post_notification_job(self, message):
+        # light ping for ones who want everything
+        self.notifications_repo.post_job(
+            {
+                "predicate": f'message.{message.sender_ref}.received',
+                "sender_ref": f"{message.sender}:{message.sender_ref}"
+            }
+        )
+        return True
+
+    def _post_to_outbox(self, message):
+        return self.blockchain_outbox_repo.post(message)
+
+    def _post_retrieval_job(self, message):
+        return self.object_retreval_repo.post_job({
+            "action": "download-object",
+            "sender": message.sender,
+            "object": message.obj
+        })
@@ -0,0 +1,59 @@
+from intergov.loggers import logging
+from intergov.monitoring import increase_counter, statsd_timer
+from intergov.use_cases.common import BaseUseCase
+from intergov.use_cases.deliver_callback import callback_job
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayCallbackDeadLettersUseCase(BaseUseCase):
+    """
+    Puts the dropped callback delivery jobs from the dead letter repo
+    back to the delivery outbox, batch by batch, with the retries count
+    reset. Replayed ones are deleted from the dead letter repo.
+
+    host limits the replay to the single subscriber host.
+
+    Returns number of jobs replayed, so 0 means there is nothing
+    (left) to replay. Broken or failed to post jobs are skipped
+    and stay in the dead letter repo.
+    """
+
+    def __init__(self, dead_letter_repo, delivery_outbox_repo, host=None, batch_size=100):
+        self.dead_letters = dead_letter_repo
+        self.delivery_outbox = delivery_outbox_repo
+        self.prefix = dead_letter_repo.host_prefix(host) if host else ''
+        self.batch_size = batch_size
+        # the last key seen, so the skipped ones are not read again
+        self._start_after = None
+
+    @statsd_timer("usecase.ReplayCallbackDeadLettersUseCase.execute")
+    def execute(self):
+        keys = self.dead_letters.list_keys(
+            prefix=self.prefix,
+            start_after=self._start_after,
+            limit=self.batch_size
+        )
+        if not keys:
+            return 0
+        super().execute()
+        self._start_after = keys[-1]
+
+        jobs = []
+        job_keys = []
+        for key in keys:
+            try:
+                job = self.dead_letters.get(key)['job']
+                jobs.append(callback_job(job, 0))
+            except Exception as e:
+                logger.error("Unable to read the dead letter %s", key)
+                logger.exception(e)
+                continue
+            job_keys.append(key)
+
+        failed = set(id(job) for job in self.delivery_outbox.post_jobs(jobs))
+        replayed = [key for key, job in zip(job_keys, jobs) if id(job) not in failed]
+        if replayed:
+            self.dead_letters.delete_many(replayed)
+        increase_counter("usecase.ReplayCallbackDeadLettersUseCase.replayed", len(replayed))
+        return len(replayed)
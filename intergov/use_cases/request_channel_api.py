@@ -1,7 +1,6 @@
 from urllib.parse import urljoin
 
-import requests
-
+from intergov import http_client
 from intergov.loggers import logging
 from intergov.use_cases.common import BaseUseCase
 from intergov.use_cases.get_cognito_auth import GetCognitoAuthUseCase
@@ -58,12 +57,12 @@ class RequestChannelAPIUseCase(BaseUseCase):
 
     def get(self, endpoint):
         url = self.get_url(endpoint)
-        return requests.get(url, headers=self.get_headers())
+        return http_client.get(url, headers=self.get_headers())
 
     def post(self, endpoint, data=None, json=None):
         url = self.get_url(endpoint)
         logger.debug('Sending POST to %s, data: %r, json: %s', url, data, json)
-        return requests.post(url, data=data, json=json, headers=self.get_headers())
+        return http_client.post(url, data=data, json=json, headers=self.get_headers())
 
     def get_headers(self):
         headers = {}
@@ -2,8 +2,7 @@ import json
 from io import BytesIO
 from urllib.parse import urljoin
 
-import requests
-
+from intergov import http_client
 from intergov.apis.common.interapi_auth import AuthMixin
 from intergov.conf import env_json
 from intergov.domain.jurisdiction import Jurisdiction
@@ -134,7 +133,7 @@ class RetrieveAndStoreForeignDocumentsUseCase(BaseUseCase, AuthMixin):
         remote_doc_api_url = sender.object_api_base_url()
         url = urljoin(remote_doc_api_url, multihash)
 
-        doc_resp = requests.get(
+        doc_resp = http_client.get(
             url,
             {
                 "as_jurisdiction": self.jurisdiction.name,
@@ -1,10 +1,33 @@
+import threading
+from collections import OrderedDict
+
+from intergov.channels.circuit_breaker import CircuitBreaker
+from intergov.channels.routing import RoutingIndex
 from intergov.loggers import logging
-from intergov.monitoring import statsd_timer
+from intergov.monitoring import increase_counter, statsd_timer
 from intergov.use_cases.common import BaseUseCase
 
 logger = logging.getLogger(__name__)
 
 
+class _CircuitOpen:
+    """
+    Result of the message not sent because the suitable channels
+    that haven't rejected it are skipped by their circuit breakers.
+    False-y, like the "not sent" result, but the message shouldn't be
+    rejected - it may be sent once the circuit is closed.
+    """
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'CIRCUIT_OPEN'
+
+
+CIRCUIT_OPEN = _CircuitOpen()
+
+
 class RouteToChannelUseCase(BaseUseCase):
     """
     This code makes a routing decision.
@@ -21,6 +44,10 @@ class RouteToChannelUseCase(BaseUseCase):
     that does not "screen" the message,
     and uses that channel to deliver the message.
 
+    If no channel has accepted the message and some of them
+    have been skipped because of their open circuits,
+    the result is CIRCUIT_OPEN instead of False.
+
     The channel config is a prototype,
     with hardcoded logic.
     Post POC versions will need a version
@@ -28,8 +55,61 @@ class RouteToChannelUseCase(BaseUseCase):
     that is more friendly to administrators.
     """
 
-    def __init__(self, routing_table):
+    def __init__(self, routing_table, circuit_breaker_conf=None):
+        if not isinstance(routing_table, RoutingIndex):
+            routing_table = RoutingIndex(routing_table)
         self.ROUTING_TABLE = routing_table
+        # CircuitBreaker parameters, the same for all channels
+        self.circuit_breaker_conf = circuit_breaker_conf or {}
+        # {channel key: CircuitBreaker}, see _breaker_key
+        self._breakers = {}
+        # routing table version the breakers are for
+        self._breakers_version = None
+        self._breakers_lock = threading.Lock()
+
+    @staticmethod
+    def _breaker_key(routing_rule):
+        """
+        Channel instances are re-created when the routing table is reloaded,
+        so the breakers are kept by the rule Id (or URL) instead,
+        and the channel state survives the reload
+        """
+        return (
+            routing_rule.get("Id")
+            or routing_rule.get("ChannelUrl")
+            or routing_rule.get("Name")
+            or str(routing_rule["ChannelInstance"])
+        )
+
+    def _get_breaker(self, routing_rule):
+        self._drop_stale_breakers()
+        key = self._breaker_key(routing_rule)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = CircuitBreaker(key, **self.circuit_breaker_conf)
+                    self._breakers[key] = breaker
+        return breaker
+
+    def _drop_stale_breakers(self):
+        """
+        Forgets the breakers of the channels removed from the routing table
+        """
+        version = self.ROUTING_TABLE.version
+        if version == self._breakers_version:
+            return
+        with self._breakers_lock:
+            if version == self._breakers_version:
+                return
+            keys = set(self._breaker_key(rule) for rule in self.ROUTING_TABLE)
+            self._breakers = {
+                key: breaker
+                for key, breaker in self._breakers.items()
+                if key in keys
+            }
+            self._breakers_version = version
 
     @statsd_timer("usecase.RouteToChannelUseCase.execute")
     def execute(self, message):
@@ -41,49 +121,157 @@ class RouteToChannelUseCase(BaseUseCase):
         # we return message ID if at least one channel accepted the message and False otherwise
         result = False
 
+        skipped = False
+
         if not self.ROUTING_TABLE:
             logger.warning("Empty routing table provided!")
-        for routing_rule in self.ROUTING_TABLE:
-            # for all channels we find one which could accept that message
-            # based on receiver
-            receiver = str(message.receiver)
-            if routing_rule["Jurisdiction"] == receiver:
-                # this one fits
-                channel_instance = routing_rule["ChannelInstance"]
-                if channel_instance.screen_message(message):
-                    logger.warning(
-                        "[%s] Channel %s screens the message",
-                        message.sender_ref,
-                        routing_rule,
-                    )
-                    continue
+        for channel_instance, breaker in self._get_channels(message):
+            if not self._allow(breaker, channel_instance):
+                skipped = True
+                continue
+            logger.info(
+                "[%s] Message will be sent to channel %s",
+                message.sender_ref,
+                str(channel_instance),
+            )
+            try:
+                channel_result = channel_instance.post_message(message)
+            except Exception as e:
+                # other channels may still accept it
+                logger.exception(e)
+                channel_result = False
+            if channel_result:
+                # seems to be a success
+                breaker.record_success()
                 logger.info(
-                    "[%s] Message will be sent to channel %s",
+                    "[%s] Message has been sent to the channel %s with result %s",
+                    message.sender_ref,
+                    str(channel_instance),
+                    channel_result
+                )
+                result = (str(channel_instance), channel_result)
+                break  # don't try to use other channels while at least one succeeded
+            else:
+                breaker.record_failure()
+                logger.warning(
+                    "[%s] Channel %s didn't accept the message",
                     message.sender_ref,
                     str(channel_instance),
                 )
-                channel_result = channel_instance.post_message(message)
-                if channel_result:
-                    # seems to be a success
-                    logger.info(
-                        "[%s] Message has been sent to the channel %s with result %s",
-                        message.sender_ref,
-                        str(channel_instance),
-                        channel_result
-                    )
-                    result = (str(channel_instance), channel_result)
-                    break  # don't try to use other channels while at least one succeeded
-                else:
-                    logger.warning(
-                        "[%s] Channel %s didn't accept the message",
-                        message.sender_ref,
-                        str(channel_instance),
-                    )
 
+        if not result and skipped:
+            return CIRCUIT_OPEN
         return result
 
+    def _get_channels(self, message):
+        """
+        (channel, circuit breaker) pairs which may be used for the message,
+        in the order of preference
+        """
+        channels = []
+        # all channels which could accept that message
+        # based on receiver (and the rule match conditions)
+        for routing_rule in self.ROUTING_TABLE.for_message(message):
+            channel_instance = routing_rule["ChannelInstance"]
+            if channel_instance.screen_message(message):
+                logger.warning(
+                    "[%s] Channel %s screens the message",
+                    message.sender_ref,
+                    routing_rule,
+                )
+                continue
+            channels.append((channel_instance, self._get_breaker(routing_rule)))
+        return channels
+
+    @staticmethod
+    def _allow(breaker, channel_instance):
+        if breaker.allow():
+            return True
+        # the channel has been failing recently, don't waste time on it
+        logger.warning("Channel %s is skipped, its circuit is %s", str(channel_instance), breaker.state)
+        increase_counter("usecase.RouteToChannelUseCase.channel_skipped")
+        return False
+
+    @staticmethod
+    def _post_messages(channel_instance, messages):
+        post_messages = getattr(channel_instance, 'post_messages', None)
+        if post_messages is None:
+            return [channel_instance.post_message(message) for message in messages]
+        return post_messages(messages)
+
+    @statsd_timer("usecase.RouteToChannelUseCase.execute_many")
+    def execute_many(self, messages):
+        """
+        Same as execute, but for many messages at once: messages going
+        to the same channel are sent by a single post_messages call
+        (if the channel supports it). Messages not accepted by the channel
+        are tried with the next suitable one, as execute does.
+
+        Returns list of the execute results in the same order as messages.
+        """
+        super().execute()
+        messages = list(messages)
+        results = [False] * len(messages)
+        # indexes of the messages which channels have been skipped
+        skipped = set()
+        if not self.ROUTING_TABLE:
+            logger.warning("Empty routing table provided!")
+        # indexes of the messages and the channels left to try for them
+        pending = [
+            (i, self._get_channels(message))
+            for i, message in enumerate(messages)
+        ]
+        while True:
+            # {(channel, breaker): [message indexes]}, in the routing table order
+            groups = OrderedDict()
+            left = []
+            for i, channels in pending:
+                if channels:
+                    groups.setdefault(channels[0], []).append(i)
+                    left.append((i, channels[1:]))
+            if not groups:
+                break
+            for (channel_instance, breaker), indexes in groups.items():
+                if not self._allow(breaker, channel_instance):
+                    skipped.update(indexes)
+                    continue
+                logger.info(
+                    "%s messages will be sent to channel %s",
+                    len(indexes),
+                    str(channel_instance),
+                )
+                try:
+                    channel_results = self._post_messages(
+                        channel_instance, [messages[i] for i in indexes]
+                    )
+                except Exception as e:
+                    logger.exception(e)
+                    channel_results = [False] * len(indexes)
+                # single request, so single result for the breaker
+                if any(channel_results):
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+                for i, channel_result in zip(indexes, channel_results):
+                    if channel_result:
+                        results[i] = (str(channel_instance), channel_result)
+                    else:
+                        logger.warning(
+                            "[%s] Channel %s didn't accept the message",
+                            messages[i].sender_ref,
+                            str(channel_instance),
+                        )
+            # don't try to use other channels while at least one succeeded
+            pending = [(i, channels) for i, channels in left if not results[i]]
+        for i in skipped:
+            if not results[i]:
+                results[i] = CIRCUIT_OPEN
+        return results
+
 
 def get_channel_by_id(channel_id, routing_table):
+    if isinstance(routing_table, RoutingIndex):
+        return routing_table.get_by_id(channel_id)
     for channel in routing_table:
         if channel['Id'] == channel_id:
             return channel
@@ -3,6 +3,7 @@ from libtrustbridge.websub.repos import SubscriptionsRepo
 
 from intergov.monitoring import statsd_timer
 from intergov.use_cases.common import BaseUseCase
+from intergov.use_cases.subscription_register import mark_changed
 
 
 class SubscriptionNotFound(Exception):
@@ -14,10 +15,12 @@ class SubscriptionDeregisterUseCase(BaseUseCase):
     Used by the subscription API
 
     on user's request removes the subscription to given url for given pattern
+    and records the change to the changes repo, if given
     """
 
-    def __init__(self, subscriptions_repo: SubscriptionsRepo):
+    def __init__(self, subscriptions_repo: SubscriptionsRepo, changes_repo=None):
         self.subscriptions_repo = subscriptions_repo
+        self.changes_repo = changes_repo
 
     @statsd_timer("usecase.SubscriptionDeregisterUseCase.execute")
     def execute(self, url, predicate):
@@ -28,3 +31,4 @@ class SubscriptionDeregisterUseCase(BaseUseCase):
         if not subscriptions_by_url:
             raise SubscriptionNotFound()
         self.subscriptions_repo.bulk_delete([pattern.to_key(url)])
+        mark_changed(self.changes_repo, predicate)
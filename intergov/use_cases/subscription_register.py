@@ -1,21 +1,41 @@
 from libtrustbridge.websub.domain import Pattern
 from libtrustbridge.websub.repos import SubscriptionsRepo
 
+from intergov.loggers import logging
 from intergov.monitoring import statsd_timer
 
 from intergov.use_cases.common import BaseUseCase
 
+logger = logging.getLogger(__name__)
+
+
+def mark_changed(changes_repo, predicate):
+    """
+    Lets the subscriptions indexes know the predicate subscribers have changed.
+    The subscription is saved already, so failure here is logged only -
+    the indexes pick up the change after their TTL anyway.
+    """
+    if changes_repo is None:
+        return
+    try:
+        changes_repo.post(predicate)
+    except Exception as e:
+        logger.error("Unable to record the subscriptions change for %s", predicate)
+        logger.exception(e)
+
 
 class SubscriptionRegisterUseCase(BaseUseCase):
     """
     Used by the subscription API
 
     Initialised with the subscription repo,
-    saves url, predicate(pattern), expiration to the storage.
+    saves url, predicate(pattern), expiration to the storage
+    and records the change to the changes repo, if given.
     """
 
-    def __init__(self, subscriptions_repo: SubscriptionsRepo):
+    def __init__(self, subscriptions_repo: SubscriptionsRepo, changes_repo=None):
         self.subscriptions_repo = subscriptions_repo
+        self.changes_repo = changes_repo
 
     @statsd_timer("usecase.SubscriptionRegisterUseCase.execute")
     def execute(self, url, predicate, expiration=None):
@@ -25,4 +45,5 @@ class SubscriptionRegisterUseCase(BaseUseCase):
         posted = self.subscriptions_repo.subscribe_by_pattern(Pattern(predicate), url,  expiration)
         if not posted:
             return None
+        mark_changed(self.changes_repo, predicate)
         return True
@@ -0,0 +1,39 @@
+from sqlalchemy import text
+
+from intergov.conf import env_postgres_config
+from intergov.repos.api_outbox import postgresrepo
+from intergov.domain.wire_protocols import generic_discrete as gd
+from tests.unit.domain.wire_protocols import test_generic_message as test_messages
+
+
+def test_repository_archive_final(
+        docker_setup, pg_session):
+    repo = postgresrepo.PostgresRepo(env_postgres_config('TEST'))
+    repo._unsafe_method__clear()
+    msg_ids = [
+        repo.post(gd.Message.from_dict(test_messages._generate_msg_dict()))
+        for i in range(4)
+    ]
+    repo.patch(msg_ids[0], {'status': 'accepted'})
+    repo.patch(msg_ids[1], {'status': 'rejected'})
+    repo.patch(msg_ids[2], {'status': 'sending'})
+
+    # too young
+    assert repo.archive_final(3600) == 0
+    # final ones only
+    assert repo.archive_final(0, batch_size=1) == 1
+    assert repo.archive_final(0) == 1
+    assert repo.archive_final(0) == 0
+    assert not repo.get(msg_ids[0])
+    assert not repo.get(msg_ids[1])
+    assert repo.get(msg_ids[2]).status == 'sending'
+    assert repo.get(msg_ids[3]).status == 'pending'
+
+    with repo.engine.connect() as conn:
+        archived = conn.execute(text(
+            "SELECT id, status FROM message_archive WHERE id IN :ids ORDER BY id"
+        ), ids=tuple(msg_ids)).fetchall()
+    assert [tuple(row) for row in archived] == [
+        (msg_ids[0], 'accepted'),
+        (msg_ids[1], 'rejected'),
+    ]
@@ -0,0 +1,31 @@
+from intergov.conf import env_postgres_config
+from intergov.repos.api_outbox import postgresrepo
+from intergov.domain.wire_protocols import generic_discrete as gd
+from tests.unit.domain.wire_protocols import test_generic_message as test_messages
+
+
+def test_repository_claim_next_pending(
+        docker_setup, pg_session):
+    repo = postgresrepo.PostgresRepo(env_postgres_config('TEST'))
+    repo._unsafe_method__clear()
+    msg_ids = [
+        repo.post(gd.Message.from_dict(test_messages._generate_msg_dict()))
+        for i in range(3)
+    ]
+
+    claimed = repo.claim_next_pending(2)
+    assert [m.id for m in claimed] == msg_ids[:2]
+    assert all(m.status == 'sending' and m.claimed_at for m in claimed)
+    assert repo.get(msg_ids[0]).status == 'sending'
+
+    # claimed ones are not given again until the lease expires
+    claimed = repo.claim_next_pending(2)
+    assert [m.id for m in claimed] == msg_ids[2:]
+    assert not repo.claim_next_pending(2)
+    claimed = repo.claim_next_pending(5, lease_seconds=0)
+    assert [m.id for m in claimed] == msg_ids
+
+    # final ones are never claimed
+    for msg_id in msg_ids:
+        repo.patch(msg_id, {'status': 'accepted'})
+    assert not repo.claim_next_pending(5, lease_seconds=0)
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from flask import Flask
+
+from intergov.apis.common.utils import repos
+
+CONF = {'test': 'conf'}
+
+
+def test_registry():
+    registry = repos.RepoRegistry()
+    RepoA = mock.Mock()
+    RepoA.side_effect = lambda conf: mock.Mock()
+    RepoB = mock.Mock()
+
+    repo = registry.get('a', RepoA, CONF)
+    assert registry.get('a', RepoA, CONF) is repo
+    RepoA.assert_called_once_with(CONF)
+
+    # different name or class means different repo
+    assert registry.get('b', RepoA, CONF) is not repo
+    assert registry.get('a', RepoB, CONF) is RepoB.return_value
+    assert RepoA.call_count == 2
+
+    registry.clear()
+    assert registry.get('a', RepoA, CONF) is not repo
+
+
+def test_registry_threads():
+    registry = repos.RepoRegistry()
+    Repo = mock.Mock()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        found = list(executor.map(lambda i: registry.get('a', Repo, CONF), range(100)))
+    assert all(r is Repo.return_value for r in found)
+    Repo.assert_called_once_with(CONF)
+
+
+def test_get_repo(app):
+    Repo = mock.Mock()
+    repos.init_app(app)
+    with app.app_context():
+        assert repos.get_repo('a', Repo, CONF) is repos.get_repo('a', Repo, CONF)
+    Repo.assert_called_once_with(CONF)
+
+    # new app - new repos
+    with Flask('another_app').app_context():
+        repos.get_repo('a', Repo, CONF)
+    assert Repo.call_count == 2
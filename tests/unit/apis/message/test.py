@@ -116,6 +116,16 @@ def test_get_success(RepoMock, client):
     assert resp.get_json() == MESSAGE_RETURN, resp.get_json()
 
 
+@mock.patch(MESSAGE_LAKE_REPO)
+def test_repo_reused(RepoMock, client):
+    RepoMock.return_value.get.side_effect = NoSuchKey()
+    for i in range(3):
+        resp = client.get(GET_URL.format(MESSAGE_REFERENCE))
+        assert resp.status_code == HTTPStatus.NOT_FOUND
+    RepoMock.assert_called_once()
+    assert RepoMock.return_value.get.call_count == 3
+
+
 @mock.patch(MESSAGE_LAKE_REPO)
 def test_get_error(RepoMock, client):
 
@@ -142,6 +152,40 @@ def test_get_error(RepoMock, client):
     )
 
 
+@mock.patch(MESSAGE_LAKE_REPO)
+@mock.patch(NOTIFICATIONS_REPO)
+@mock.patch('intergov.repos.message_lake.cache.time')
+def test_get_cache(time, NotificationsRepoMock, RepoMock, client):
+    time.monotonic.return_value = 0
+    instance = RepoMock.return_value
+    data = {**VALID_MESSAGE_DATA_DICT}
+
+    def get(status):
+        data['status'] = status
+        instance.get.reset_mock()
+        instance.get.return_value = Message.from_dict(data)
+        resp = client.get(GET_URL.format(MESSAGE_REFERENCE))
+        assert resp.status_code == HTTPStatus.CREATED
+        return resp.get_json()['status']
+
+    # not final ones are cached for a short time
+    assert get('pending') == 'pending'
+    instance.get.assert_called_once()
+    assert get('accepted') == 'pending'
+    instance.get.assert_not_called()
+    time.monotonic.return_value = 100
+    assert get('accepted') == 'accepted'
+    instance.get.assert_called_once()
+
+    # final ones are cached until patched
+    time.monotonic.return_value = 10000
+    assert get('rejected') == 'accepted'
+    instance.get.assert_not_called()
+    client.patch(PATCH_URL.format(MESSAGE_REFERENCE), json={'channel_id': 'x'})
+    assert get('rejected') == 'rejected'
+    instance.get.assert_called_once()
+
+
 @mock.patch(MESSAGE_LAKE_REPO)
 @mock.patch(NOTIFICATIONS_REPO)
 def test_patch_success(NotificationsRepoMock, MessageLakeRepoMock, client):
@@ -0,0 +1,62 @@
+from unittest import mock
+
+from intergov.channels import circuit_breaker
+from intergov.channels.circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+@mock.patch('intergov.channels.circuit_breaker.statsd_gauge')
+@mock.patch('intergov.channels.circuit_breaker.time')
+def test_circuit_breaker(time, statsd_gauge):
+    time.monotonic.return_value = 1000
+    breaker = CircuitBreaker('AU channel', failure_rate=0.5, min_calls=4, window_seconds=60, open_seconds=30)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+    # not enough calls to decide
+    for i in range(3):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    # old calls are forgotten
+    time.monotonic.return_value = 1061
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    # 3 of 5 failed
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    statsd_gauge.assert_called_once_with('channels.AU_channel.circuit_state', 2)
+    assert not breaker.allow()
+
+    # the single trial call after a while
+    time.monotonic.return_value = 1091
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.monotonic.return_value = 1122
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert statsd_gauge.call_args_list[-1] == mock.call(
+        'channels.AU_channel.circuit_state',
+        circuit_breaker.STATE_VALUES[CLOSED]
+    )
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+@mock.patch('intergov.channels.circuit_breaker.statsd_gauge')
+def test_metrics_outside_lock(statsd_gauge):
+    breaker = CircuitBreaker('AU channel', min_calls=1)
+    # metrics may be slow, other threads shouldn't wait for them
+    statsd_gauge.side_effect = lambda *args: locked.append(breaker._lock.locked())
+    locked = []
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert locked == [False]
@@ -0,0 +1,50 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from intergov.channels.concurrency import ConcurrencyLimitedChannel
+
+
+def test_concurrency_limited_channel():
+    lock = threading.Lock()
+    state = {'current': 0, 'max': 0}
+
+    def post_message(message):
+        with lock:
+            state['current'] += 1
+            state['max'] = max(state['max'], state['current'])
+        time.sleep(0.01)
+        with lock:
+            state['current'] -= 1
+        return message
+
+    channel = mock.MagicMock()
+    channel.__str__.return_value = 'Channel(http://channel)'
+    channel.post_message.side_effect = post_message
+    limited = ConcurrencyLimitedChannel(channel, 2)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(limited.post_message, range(16)))
+    assert results == list(range(16))
+    assert state['max'] == 2
+
+    # the rest is the channel's
+    assert str(limited) == 'Channel(http://channel)'
+    limited.screen_message('message')
+    channel.screen_message.assert_called_once_with('message')
+
+
+def test_concurrency_limited_channel_batch():
+    channel = mock.MagicMock(spec=['post_message'])
+    channel.post_message.side_effect = lambda message: message * 2
+    limited = ConcurrencyLimitedChannel(channel, 1)
+    # the channel can't post many, so messages are sent one by one
+    assert limited.post_messages([1, 2, 3]) == [2, 4, 6]
+
+    channel = mock.MagicMock()
+    channel.post_messages.return_value = ['a', 'b']
+    limited = ConcurrencyLimitedChannel(channel, 1)
+    assert limited.post_messages([1, 2]) == ['a', 'b']
+    channel.post_messages.assert_called_once_with([1, 2])
+    channel.post_message.assert_not_called()
@@ -0,0 +1,78 @@
+from unittest import mock
+
+import requests
+
+from intergov.channels.http_api_channel import HttpApiChannel
+from intergov.domain.wire_protocols.generic_discrete import Message
+from tests.unit.domain.wire_protocols.test_generic_message import _generate_msg_dict
+
+CONFIG = {
+    'Id': 'channel',
+    'Name': 'Channel',
+    'ChannelUrl': 'http://channel/',
+    'ChannelAuth': 'None',
+}
+
+
+def _response(status_code, json):
+    resp = mock.MagicMock()
+    resp.status_code = status_code
+    resp.json.return_value = json
+    return resp
+
+
+def _messages(count):
+    return [
+        Message.from_dict({**_generate_msg_dict(sender_ref='ref-{}'.format(i)), 'status': 'pending'})
+        for i in range(count)
+    ]
+
+
+def test_post_messages_one_by_one():
+    channel = HttpApiChannel(CONFIG)
+    channel.session = mock.MagicMock()
+    channel.session.post.side_effect = [
+        _response(200, {'id': 'ch-1'}),
+        _response(400, {}),
+        _response(201, {'id': 'ch-3'}),
+    ]
+    messages = _messages(3)
+    assert channel.post_messages(messages) == ['ch-1', False, 'ch-3']
+    assert channel.session.post.call_count == 3
+    url = channel.session.post.call_args[0][0]
+    assert url == 'http://channel/messages'
+    payload = channel.session.post.call_args[1]['json']
+    assert 'sender_ref' not in payload
+    assert payload['subject'] == str(messages[2].subject)
+
+
+def test_post_messages_batch():
+    channel = HttpApiChannel({
+        **CONFIG,
+        'ChannelBatchEndpoint': '/messages/batch',
+        'ChannelBatchSize': 2,
+    })
+    channel.session = mock.MagicMock()
+    channel.session.post.side_effect = [
+        _response(200, [{'id': 'ch-1'}, {'error': 'invalid'}]),
+        _response(200, [{'id': 'ch-3'}]),
+    ]
+    messages = _messages(3)
+    assert channel.post_messages(messages) == ['ch-1', False, 'ch-3']
+    assert channel.session.post.call_count == 2
+    args, kwargs = channel.session.post.call_args_list[0]
+    assert args[0] == 'http://channel/messages/batch'
+    assert [p['subject'] for p in kwargs['json']] == [str(m.subject) for m in messages[:2]]
+
+    # whole batch fails
+    channel.session.post.side_effect = [
+        _response(500, {}),
+        requests.ConnectionError(),
+    ]
+    assert channel.post_messages(messages) == [False] * 3
+    # response doesn't match the request
+    channel.session.post.side_effect = [
+        _response(200, [{'id': 'ch-1'}]),
+        _response(200, {'id': 'ch-3'}),
+    ]
+    assert channel.post_messages(messages) == [False] * 3
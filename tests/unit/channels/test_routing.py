@@ -0,0 +1,173 @@
+import json
+from unittest import mock
+
+from intergov.channels import routing
+from intergov.channels.routing import PredicateTrie, ReloadingRoutingIndex, RoutingIndex
+from intergov.domain.wire_protocols.generic_discrete import Message
+from intergov.use_cases.route_to_channel import get_channel_by_id
+from tests.unit.domain.wire_protocols.test_generic_message import _generate_msg_dict
+
+ROUTING_TABLE = [
+    {'Id': 'sg-1', 'Jurisdiction': 'SG'},
+    {'Id': 'cn-1', 'Jurisdiction': 'CN'},
+    {'Id': 'sg-2', 'Jurisdiction': 'SG'},
+    {'Id': 'sg-1', 'Jurisdiction': 'SG', 'Name': 'duplicate'},
+]
+
+
+def test_routing_index():
+    prepared = []
+    index = RoutingIndex([dict(rule) for rule in ROUTING_TABLE], prepare_rule=prepared.append)
+    assert len(prepared) == 4
+    assert [rule['Id'] for rule in index.for_receiver('SG')] == ['sg-1', 'sg-2', 'sg-1']
+    assert index.for_receiver('AU') == []
+    assert index.get_by_id('cn-1') is prepared[1]
+    # the first one, as the linear search finds
+    assert 'Name' not in index.get_by_id('sg-1')
+    assert index.get_by_id('unknown') is None
+    assert [rule['Id'] for rule in index] == ['sg-1', 'cn-1', 'sg-2', 'sg-1']
+    assert len(index) == 4
+    assert not RoutingIndex(None)
+
+    # the same results for the list and for the index
+    for channel_id in ('sg-1', 'cn-1', 'unknown'):
+        assert get_channel_by_id(channel_id, index) == get_channel_by_id(channel_id, ROUTING_TABLE)
+
+
+def _message(**kwargs):
+    msg_kwargs = {
+        'receiver': 'SG',
+        'sender': 'AU',
+        'predicate': 'UN.CEFACT.Trade.CertificateOfOrigin.created',
+        **kwargs
+    }
+    return Message.from_dict(_generate_msg_dict(**msg_kwargs))
+
+
+def test_predicate_trie():
+    trie = PredicateTrie()
+    trie.add([], 'any')
+    trie.add(['UN', 'CEFACT'], 'cefact')
+    trie.add(['UN', 'CEFACT', 'Trade'], 'trade')
+    trie.add(['UN', 'Other'], 'other')
+    assert trie.find('UN.CEFACT.Trade.CertificateOfOrigin') == [
+        (0, 'any'), (2, 'cefact'), (3, 'trade')
+    ]
+    assert trie.find('UN.CEFACT.TradeX') == [(0, 'any'), (2, 'cefact')]
+    assert trie.find('') == [(0, 'any')]
+
+
+def test_routing_index_match():
+    index = RoutingIndex([
+        {'Id': 'generic', 'Jurisdiction': 'SG'},
+        {'Id': 'trade', 'Jurisdiction': 'SG', 'Match': {'predicate': 'UN.CEFACT.Trade'}},
+        {'Id': 'coo', 'Jurisdiction': 'SG', 'Match': {
+            'predicate': ['UN.CEFACT.Trade.CertificateOfOrigin', 'UN.CEFACT.Trade.Invoice'],
+            'sender': 'AU',
+        }},
+        {'Id': 'nz', 'Jurisdiction': 'SG', 'Match': {
+            'predicate': 'UN.CEFACT.Trade.CertificateOfOrigin', 'sender': ['NZ'],
+        }},
+        {'Id': 'abn', 'Jurisdiction': 'SG', 'Match': {'subject': r'AU\.abn:'}},
+        {'Id': 'cn', 'Jurisdiction': 'CN'},
+    ])
+
+    def selected(**kwargs):
+        return [rule['Id'] for rule in index.for_message(_message(**kwargs))]
+
+    # the most specific first
+    assert selected() == ['coo', 'trade', 'generic']
+    assert selected(predicate='UN.CEFACT.Trade.Invoice.created') == ['coo', 'trade', 'generic']
+    assert selected(predicate='UN.CEFACT.TradeX.created') == ['generic']
+    assert selected(predicate='UN.CEFACT.Trade.Other', subject='AU.abn:1234') == [
+        'trade', 'generic', 'abn'
+    ]
+    assert selected(receiver='AU') == []
+
+
+def test_routing_index_weight():
+    index = RoutingIndex([
+        {'Id': 'light', 'Jurisdiction': 'SG', 'Weight': 1},
+        {'Id': 'heavy', 'Jurisdiction': 'SG', 'Weight': 3},
+        {'Id': 'standby', 'Jurisdiction': 'SG', 'Weight': 0},
+        {'Id': 'special', 'Jurisdiction': 'SG', 'Match': {'predicate': 'UN'}},
+    ])
+    first = {'light': 0, 'heavy': 0}
+    for i in range(2000):
+        selected = [rule['Id'] for rule in index.for_message(_message())]
+        assert selected[0] == 'special'
+        # the channel with zero weight is the last resort only
+        assert selected[-1] == 'standby'
+        assert sorted(selected[1:3]) == ['heavy', 'light']
+        first[selected[1]] += 1
+    assert 1200 < first['heavy'] < 1800
+
+
+@mock.patch('intergov.channels.routing.time')
+def test_reloading_routing_index(time):
+    time.monotonic.return_value = 1000
+    source = mock.Mock(return_value=json.dumps(ROUTING_TABLE[:2]))
+    prepare_rule = mock.Mock()
+    index = ReloadingRoutingIndex(prepare_rule=prepare_rule, check_interval=10, source=source)
+    assert [rule['Id'] for rule in index.for_receiver('SG')] == ['sg-1']
+    assert prepare_rule.call_count == 2
+
+    # not checked too often
+    source.return_value = json.dumps(ROUTING_TABLE[:3])
+    assert [rule['Id'] for rule in index.for_receiver('SG')] == ['sg-1']
+    assert source.call_count == 1
+    time.monotonic.return_value = 1011
+    assert [rule['Id'] for rule in index.for_receiver('SG')] == ['sg-1', 'sg-2']
+    assert index.get_by_id('sg-2')['Jurisdiction'] == 'SG'
+    assert prepare_rule.call_count == 5
+
+    # unchanged source means no rebuild
+    time.monotonic.return_value = 1022
+    assert not index.reload_if_changed()
+    assert prepare_rule.call_count == 5
+
+    # broken one is ignored
+    time.monotonic.return_value = 1033
+    source.return_value = '[{"Id": '
+    assert not index.reload_if_changed()
+    assert len(index) == 3
+    time.monotonic.return_value = 1044
+    source.return_value = json.dumps([])
+    assert index.reload_if_changed()
+    assert index.get_by_id('sg-1') is None
+
+
+def test_read_routing_table_source(tmpdir, monkeypatch):
+    monkeypatch.delenv(routing.ROUTING_TABLE_FILE_ENV, raising=False)
+    monkeypatch.setenv(routing.ROUTING_TABLE_ENV, json.dumps(ROUTING_TABLE))
+    assert routing.parse_routing_table(routing.read_routing_table_source()) == ROUTING_TABLE
+    table_file = tmpdir.join('routing.json')
+    table_file.write(json.dumps(ROUTING_TABLE[:1]))
+    monkeypatch.setenv(routing.ROUTING_TABLE_FILE_ENV, str(table_file))
+    assert routing.parse_routing_table(routing.read_routing_table_source()) == ROUTING_TABLE[:1]
+    assert routing.parse_routing_table(None) == []
+
+
+@mock.patch('intergov.channels.routing.time')
+def test_reloading_routing_index_file(time, tmpdir, monkeypatch):
+    time.monotonic.return_value = 1000
+    monkeypatch.delenv(routing.ROUTING_TABLE_FILE_ENV, raising=False)
+    monkeypatch.setenv(routing.ROUTING_TABLE_ENV, json.dumps(ROUTING_TABLE[:2]))
+
+    # the env variable is read once
+    index = ReloadingRoutingIndex(check_interval=10)
+    monkeypatch.setenv(routing.ROUTING_TABLE_ENV, json.dumps(ROUTING_TABLE[:3]))
+    time.monotonic.return_value = 1011
+    assert not index.reload_if_changed()
+    assert len(index) == 2
+
+    # the file is checked for changes
+    table_file = tmpdir.join('routing.json')
+    table_file.write(json.dumps(ROUTING_TABLE[:1]))
+    monkeypatch.setenv(routing.ROUTING_TABLE_FILE_ENV, str(table_file))
+    index = ReloadingRoutingIndex(check_interval=10)
+    assert len(index) == 1
+    table_file.write(json.dumps(ROUTING_TABLE[:3]))
+    time.monotonic.return_value = 1022
+    assert index.reload_if_changed()
+    assert len(index) == 3
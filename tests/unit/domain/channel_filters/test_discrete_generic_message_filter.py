@@ -53,3 +53,42 @@ def test_blacklist():
             if k == test_attr:
                 f.blacklist(k, kwargs[k])
             assert f.screen_message(m)
+
+
+def test_prefix():
+    m = protocol.Message(**kwargs)
+    predicates = [
+        'UN.CEFACT.Trade.CertificateOfOrigin.created',
+        'UN.CEFACT.Trade.Invoice.created',
+        'UN.Other.created',
+    ]
+    messages = [protocol.Message(**dict(kwargs, predicate=predicate)) for predicate in predicates]
+    f = gmf.DiscreteGenericMessageFilter()
+    for k in kwargs.keys():
+        if k != 'predicate':
+            f.allow_any(k)
+    f.whitelist_prefix('predicate', 'UN.CEFACT.')
+    assert f.screen_messages(messages) == [False, False, True]
+    f.blacklist_prefix('predicate', 'UN.CEFACT.Trade.Invoice')
+    assert f.screen_messages(messages) == [False, True, True]
+    f.whitelist_prefix('predicate', 'UN.CEFACT.Trade.Invoice')
+    assert f.screen_messages(messages) == [False, False, True]
+    assert f.screen_message(m)
+
+
+def test_screen_messages():
+    f = gmf.DiscreteGenericMessageFilter()
+    for k in kwargs.keys():
+        f.allow_any(k)
+    f.blacklist('receiver', 'CN')
+    dicts = [dict(kwargs, receiver=receiver) for receiver in ('CN', 'SG', 'CN', 'AU')]
+    # attributes are URI and Jurisdiction objects here
+    messages = [protocol.Message.from_dict(adict) for adict in dicts]
+    mask = f.screen_messages(messages)
+    assert mask == [True, False, True, False]
+    assert mask == [f.screen_message(msg) for msg in messages]
+    # the compiled rules are rebuilt after the change
+    f.whitelist('receiver', 'CN')
+    f.disallow_any('receiver')
+    assert f.screen_messages(messages) == [False, True, False, True]
+    assert f.screen_messages([]) == []
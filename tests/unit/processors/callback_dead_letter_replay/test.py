@@ -0,0 +1,56 @@
+from unittest import mock
+from intergov.processors.callback_dead_letter_replay import CallbackDeadLetterReplayer
+
+
+DEAD_LETTER_REPO_CONF = {
+    'test': 'dead-letter-repo-conf'
+}
+
+DELIVERY_OUTBOX_REPO_CONF = {
+    'test': 'delivery-outbox-repo-conf'
+}
+
+
+@mock.patch('intergov.processors.callback_dead_letter_replay.time')
+@mock.patch('intergov.processors.callback_dead_letter_replay.CallbackDeadLetterRepo')
+@mock.patch('intergov.processors.callback_dead_letter_replay.DeliveryOutboxRepo')
+@mock.patch('intergov.processors.callback_dead_letter_replay.ReplayCallbackDeadLettersUseCase')
+def test(
+    ReplayCallbackDeadLettersUseCase,
+    DeliveryOutboxRepo,
+    CallbackDeadLetterRepo,
+    time
+):
+    time.monotonic.return_value = 1000
+    replayer = CallbackDeadLetterReplayer(
+        dead_letter_repo_conf=DEAD_LETTER_REPO_CONF,
+        delivery_outbox_repo_conf=DELIVERY_OUTBOX_REPO_CONF,
+        host='subscriber.example.com'
+    )
+    args, kwargs = CallbackDeadLetterRepo.call_args
+    assert DEAD_LETTER_REPO_CONF.items() <= args[0].items()
+    args, kwargs = DeliveryOutboxRepo.call_args
+    assert DELIVERY_OUTBOX_REPO_CONF.items() <= args[0].items()
+    ReplayCallbackDeadLettersUseCase.assert_called_once_with(
+        dead_letter_repo=CallbackDeadLetterRepo.return_value,
+        delivery_outbox_repo=DeliveryOutboxRepo.return_value,
+        host='subscriber.example.com',
+        batch_size=CallbackDeadLetterReplayer.BATCH_SIZE
+    )
+    use_case = ReplayCallbackDeadLettersUseCase.return_value
+    use_case.execute.side_effect = [
+        100,
+        Exception(),
+        0
+    ]
+    replayer.RATE = 50
+    assert iter(replayer) is replayer
+    assert next(replayer) == 100
+    time.sleep.assert_not_called()
+    # the next batch waits for its share of the rate
+    time.monotonic.return_value = 1000.5
+    assert next(replayer) is None
+    time.sleep.assert_called_once_with(1.5)
+    time.monotonic.return_value = 1003
+    assert next(replayer) == 0
+    assert time.sleep.call_count == 1
@@ -0,0 +1,103 @@
+from unittest import mock
+from intergov.processors.callback_deliver import CallbacksDeliveryProcessor
+
+
+DELIVERY_OUTBOX_REPO_CONF = {
+    'test': 'delivery-outbox-repo-conf'
+}
+
+
+@mock.patch.object(CallbacksDeliveryProcessor, 'DEAD_LETTERS', True)
+@mock.patch('intergov.processors.callback_deliver.CallbackDeadLetterRepo')
+@mock.patch('intergov.processors.callback_deliver.CallbackRateLimiter')
+@mock.patch('intergov.processors.callback_deliver.DeliveryOutboxRepo')
+@mock.patch('intergov.processors.callback_deliver.DeliverCallbackUseCase')
+def test(
+    DeliverCallbackUseCase,
+    DeliveryOutboxRepo,
+    CallbackRateLimiter,
+    CallbackDeadLetterRepo
+):
+    processor = CallbacksDeliveryProcessor(
+        delivery_outbox_repo_conf=DELIVERY_OUTBOX_REPO_CONF,
+        batch_size=1
+    )
+
+    DeliveryOutboxRepo.assert_called_once()
+    args, kwargs = DeliveryOutboxRepo.call_args_list[0]
+    assert DELIVERY_OUTBOX_REPO_CONF.items() <= args[0].items()
+    DeliverCallbackUseCase.assert_called_once_with(
+        delivery_outbox_repo=DeliveryOutboxRepo.return_value,
+        workers=0,
+        per_host_limit=CallbacksDeliveryProcessor.PER_HOST_LIMIT,
+        rate_limiter=CallbackRateLimiter.return_value,
+        dead_letter_repo=CallbackDeadLetterRepo.return_value,
+        payload_repo=None
+    )
+    use_case = DeliverCallbackUseCase.return_value
+    use_case.execute.side_effect = [
+        True,
+        False,
+        None,
+        Exception()
+    ]
+    assert iter(processor) is processor
+    assert next(processor) is True
+    assert next(processor) is False
+    assert next(processor) is None
+    assert next(processor) is None
+
+
+@mock.patch.object(CallbacksDeliveryProcessor, 'DEAD_LETTERS', True)
+@mock.patch('intergov.processors.callback_deliver.CallbackDeadLetterRepo')
+@mock.patch('intergov.processors.callback_deliver.DeliveryOutboxRepo')
+@mock.patch('intergov.processors.callback_deliver.DeliverCallbackUseCase')
+def test_batch(
+    DeliverCallbackUseCase,
+    DeliveryOutboxRepo,
+    CallbackDeadLetterRepo
+):
+    processor = CallbacksDeliveryProcessor(batch_size=50, batch_wait_seconds=5)
+    DeliverCallbackUseCase.assert_called_once_with(
+        delivery_outbox_repo=DeliveryOutboxRepo.return_value,
+        workers=CallbacksDeliveryProcessor.WORKERS,
+        per_host_limit=CallbacksDeliveryProcessor.PER_HOST_LIMIT,
+        rate_limiter=mock.ANY,
+        dead_letter_repo=CallbackDeadLetterRepo.return_value,
+        payload_repo=None
+    )
+    use_case = DeliverCallbackUseCase.return_value
+    use_case.execute_batch.return_value = True
+    assert next(processor) is True
+    use_case.execute_batch.assert_called_once_with(50, wait_time_seconds=5)
+    use_case.execute.assert_not_called()
+
+
+@mock.patch.object(CallbacksDeliveryProcessor, 'CALLBACK_PAYLOADS', True)
+@mock.patch('intergov.processors.callback_deliver.CallbackPayloadRepo')
+@mock.patch('intergov.processors.callback_deliver.CallbackDeadLetterRepo')
+@mock.patch('intergov.processors.callback_deliver.DeliveryOutboxRepo')
+@mock.patch('intergov.processors.callback_deliver.DeliverCallbackUseCase')
+def test_payload_repo(
+    DeliverCallbackUseCase,
+    DeliveryOutboxRepo,
+    CallbackDeadLetterRepo,
+    CallbackPayloadRepo
+):
+    CallbacksDeliveryProcessor(payload_repo_conf={'bucket': 'payloads'})
+    assert CallbackPayloadRepo.call_args[0][0]['bucket'] == 'payloads'
+    assert DeliverCallbackUseCase.call_args[1]['payload_repo'] == CallbackPayloadRepo.return_value
+
+
+@mock.patch.object(CallbacksDeliveryProcessor, 'DEAD_LETTERS', False)
+@mock.patch('intergov.processors.callback_deliver.CallbackDeadLetterRepo')
+@mock.patch('intergov.processors.callback_deliver.DeliveryOutboxRepo')
+@mock.patch('intergov.processors.callback_deliver.DeliverCallbackUseCase')
+def test_no_dead_letters(
+    DeliverCallbackUseCase,
+    DeliveryOutboxRepo,
+    CallbackDeadLetterRepo
+):
+    CallbacksDeliveryProcessor()
+    CallbackDeadLetterRepo.assert_not_called()
+    assert DeliverCallbackUseCase.call_args[1]['dead_letter_repo'] is None
@@ -82,6 +82,8 @@ def test(
         object_retreval_repo=ObjectRetrievalRepo.return_value,
         notifications_repo=NotificationsRepo.return_value,
         blockchain_outbox_repo=ApiOutboxRepo.return_value,
+        side_effects_workers=InboundMessageProcessor.SIDE_EFFECTS_WORKERS,
+        step_journal_repo=None,
     )
 
     assert iter(processor) is processor
@@ -96,3 +98,28 @@ def test(
     assert next(processor) is False
     assert next(processor) is None
     assert next(processor) is None
+
+
+@mock.patch('intergov.processors.message_processor.BCInboxRepo')
+@mock.patch('intergov.processors.message_processor.ApiOutboxRepo')
+@mock.patch('intergov.processors.message_processor.MessageLakeRepo')
+@mock.patch('intergov.processors.message_processor.ObjectACLRepo')
+@mock.patch('intergov.processors.message_processor.ObjectRetrievalRepo')
+@mock.patch('intergov.processors.message_processor.NotificationsRepo')
+@mock.patch('intergov.processors.message_processor.ProcessMessageUseCase')
+@mock.patch('intergov.processors.message_processor.time')
+def test_batch_mode(time, ProcessMessageUseCase, *repos):
+    processor = InboundMessageProcessor(batch_size=50, batch_wait_seconds=10)
+    use_case = ProcessMessageUseCase.return_value
+    use_case.execute_batch.side_effect = [
+        True,
+        None,
+        Exception()
+    ]
+    assert next(processor) is True
+    use_case.execute_batch.assert_called_with(50, wait_time_seconds=10)
+    assert next(processor) is None
+    time.sleep.assert_not_called()
+    assert next(processor) is None
+    time.sleep.assert_called_once()
+    use_case.execute.assert_not_called()
@@ -0,0 +1,201 @@
+import json
+from unittest import mock
+
+from intergov.channels.concurrency import ConcurrencyLimitedChannel
+from intergov.channels.routing import ReloadingRoutingIndex
+from intergov.processors.multichannel_router import MultichannelWorker
+from intergov.repos.api_outbox.postgres_objects import Message as PostgresMessageRepr
+from intergov.use_cases.route_to_channel import CIRCUIT_OPEN
+from tests.unit.domain.wire_protocols.test_generic_message import _generate_msg_dict
+
+ROUTING_TABLE = [
+    {
+        'Id': 'channel-1',
+        'Name': 'Channel 1',
+        'Jurisdiction': 'CN',
+        'ChannelUrl': 'http://channel-1',
+        'ChannelAuth': 'None',
+    },
+    {
+        'Id': 'channel-2',
+        'Name': 'Channel 2',
+        'Jurisdiction': 'SG',
+        'ChannelUrl': 'http://channel-2',
+        'ChannelAuth': 'None',
+        'MaxConcurrency': 1,
+    },
+]
+
+
+def _pg_message(id):
+    data = _generate_msg_dict()
+    return PostgresMessageRepr(
+        id=id,
+        sender=data['sender'],
+        receiver=data['receiver'],
+        subject=data['subject'],
+        obj=data['obj'],
+        predicate=data['predicate'],
+        sender_ref='ref-{}'.format(id),
+        status='sending',
+    )
+
+
+def _worker(concurrency, channel_concurrency=0, batch_size=1):
+    class Worker(MultichannelWorker):
+        ROUTING_TABLE = [dict(rule) for rule in ROUTING_TABLE]
+        CONCURRENCY = concurrency
+        CHANNEL_CONCURRENCY = channel_concurrency
+        BATCH_SIZE = batch_size
+    return Worker()
+
+
+@mock.patch('intergov.processors.multichannel_router.ApiOutboxRepo')
+@mock.patch('intergov.processors.multichannel_router.MessageUpdatesRepo')
+@mock.patch('intergov.processors.multichannel_router.RouteToChannelUseCase')
+def test_serial(RouteToChannelUseCase, MessageUpdatesRepo, ApiOutboxRepo):
+    worker = _worker(0)
+    assert worker.executor is None
+    outbox_repo = ApiOutboxRepo.return_value
+    uc = RouteToChannelUseCase.return_value
+
+    outbox_repo.claim_next_pending.return_value = []
+    assert next(worker) is None
+
+    outbox_repo.claim_next_pending.return_value = [_pg_message(1)]
+    uc.execute.return_value = ('channel-1', 'channel-msg-id')
+    assert next(worker) is True
+    outbox_repo.claim_next_pending.assert_called_with(1, lease_seconds=worker.CLAIM_LEASE_SECONDS)
+    outbox_repo.patch.assert_called_once_with(1, {'status': 'accepted'})
+    MessageUpdatesRepo.return_value.post_job.assert_called_once()
+
+    outbox_repo.patch.reset_mock()
+    uc.execute.return_value = False
+    assert next(worker) is False
+    outbox_repo.patch.assert_called_once_with(1, {'status': 'rejected'})
+
+    # channels are not tried, so the message is left until its lease expires
+    outbox_repo.patch.reset_mock()
+    MessageUpdatesRepo.return_value.post_job.reset_mock()
+    uc.execute.return_value = CIRCUIT_OPEN
+    assert next(worker) is False
+    outbox_repo.patch.assert_not_called()
+    MessageUpdatesRepo.return_value.post_job.assert_not_called()
+
+    # the failed use case means the pause
+    outbox_repo.patch.reset_mock()
+    uc.execute.side_effect = Exception('Boom')
+    with mock.patch('intergov.processors.multichannel_router.time.sleep') as sleep:
+        assert next(worker) is False
+        sleep.assert_called()
+    outbox_repo.patch.assert_called_once_with(1, {'status': 'rejected'})
+
+
+@mock.patch('intergov.processors.multichannel_router.ApiOutboxRepo')
+@mock.patch('intergov.processors.multichannel_router.MessageUpdatesRepo')
+@mock.patch('intergov.processors.multichannel_router.RouteToChannelUseCase')
+def test_parallel(RouteToChannelUseCase, MessageUpdatesRepo, ApiOutboxRepo):
+    worker = _worker(4, channel_concurrency=3)
+    assert worker.executor is not None
+    channels = [rule['ChannelInstance'] for rule in worker.ROUTING_TABLE]
+    assert all(isinstance(ch, ConcurrencyLimitedChannel) for ch in channels)
+    assert [ch.limit for ch in channels] == [3, 1]
+
+    outbox_repo = ApiOutboxRepo.return_value
+    outbox_repo.patch.return_value = True
+    uc = RouteToChannelUseCase.return_value
+    messages = [_pg_message(i) for i in range(1, 7)]
+
+    def execute(message):
+        if message.sender_ref == 'ref-2':
+            raise Exception('Boom')
+        return ('channel-1', message.sender_ref)
+
+    uc.execute.side_effect = execute
+    outbox_repo.claim_next_pending.side_effect = lambda n, lease_seconds: [
+        messages.pop(0) for i in range(min(n, len(messages)))
+    ]
+
+    results = []
+    with mock.patch('intergov.processors.multichannel_router.time.sleep') as sleep:
+        for i in range(20):
+            result = next(worker)
+            if result is None:
+                break
+            results += result
+        # failures don't stop the others
+        sleep.assert_not_called()
+    assert sorted(results) == [False] + [True] * 5
+    # no more than 4 messages in flight
+    assert outbox_repo.claim_next_pending.call_args_list[0][0][0] == 4
+    assert outbox_repo.patch.call_count == 6
+    rejected = [c for c in outbox_repo.patch.call_args_list if c[0][1] == {'status': 'rejected'}]
+    assert [c[0][0] for c in rejected] == [2]
+    worker.executor.shutdown()
+
+
+@mock.patch('intergov.processors.multichannel_router.ApiOutboxRepo')
+@mock.patch('intergov.processors.multichannel_router.MessageUpdatesRepo')
+@mock.patch('intergov.processors.multichannel_router.RouteToChannelUseCase')
+def test_batch(RouteToChannelUseCase, MessageUpdatesRepo, ApiOutboxRepo):
+    worker = _worker(0, batch_size=3)
+    outbox_repo = ApiOutboxRepo.return_value
+    outbox_repo.patch.return_value = True
+    uc = RouteToChannelUseCase.return_value
+
+    outbox_repo.claim_next_pending.return_value = [_pg_message(i) for i in range(1, 4)]
+    uc.execute_many.return_value = [('channel-1', 'ch-1'), False, ('channel-1', 'ch-3')]
+    assert next(worker) == [True, False, True]
+    outbox_repo.claim_next_pending.assert_called_once_with(3, lease_seconds=worker.CLAIM_LEASE_SECONDS)
+    uc.execute_many.assert_called_once()
+    assert [m.sender_ref for m in uc.execute_many.call_args[0][0]] == ['ref-1', 'ref-2', 'ref-3']
+    uc.execute.assert_not_called()
+    # each message gets its own status
+    assert outbox_repo.patch.call_args_list == [
+        mock.call(1, {'status': 'accepted'}),
+        mock.call(2, {'status': 'rejected'}),
+        mock.call(3, {'status': 'accepted'}),
+    ]
+    assert MessageUpdatesRepo.return_value.post_job.call_count == 3
+
+    # the failed use case rejects them all
+    outbox_repo.patch.reset_mock()
+    uc.execute_many.side_effect = Exception('Boom')
+    with mock.patch('intergov.processors.multichannel_router.time.sleep'):
+        assert next(worker) == [False] * 3
+    assert outbox_repo.patch.call_count == 3
+
+    # parallel worker sends batches
+    worker = _worker(2, batch_size=2)
+    uc.execute_many.side_effect = lambda messages: [('channel-1', 'ch')] * len(messages)
+    messages = [_pg_message(i) for i in range(1, 6)]
+    outbox_repo.claim_next_pending.reset_mock()
+    outbox_repo.claim_next_pending.side_effect = lambda n, lease_seconds: [
+        messages.pop(0) for i in range(min(n, len(messages)))
+    ]
+    results = []
+    for i in range(20):
+        result = next(worker)
+        if result is None:
+            break
+        results += result
+    assert results == [True] * 5
+    assert outbox_repo.claim_next_pending.call_args_list[0][0][0] == 4
+    worker.executor.shutdown()
+
+
+@mock.patch('intergov.processors.multichannel_router.ApiOutboxRepo')
+@mock.patch('intergov.processors.multichannel_router.MessageUpdatesRepo')
+def test_routing_table_reload(MessageUpdatesRepo, ApiOutboxRepo, monkeypatch):
+    monkeypatch.delenv('IGL_MCHR_ROUTING_TABLE_FILE', raising=False)
+    monkeypatch.setenv('IGL_MCHR_ROUTING_TABLE', json.dumps(ROUTING_TABLE[:1]))
+
+    class Worker(MultichannelWorker):
+        ROUTING_TABLE_RELOAD_SECONDS = 10
+
+    worker = Worker()
+    assert isinstance(worker.routing_index, ReloadingRoutingIndex)
+    assert worker.uc.ROUTING_TABLE is worker.routing_index
+    rules = worker.routing_index.for_receiver('CN')
+    assert [rule['Id'] for rule in rules] == ['channel-1']
+    assert str(rules[0]['ChannelInstance']) == 'HttpApiChannel(http://channel-1)'
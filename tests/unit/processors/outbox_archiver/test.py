@@ -0,0 +1,35 @@
+from unittest import mock
+from intergov.processors.outbox_archiver import OutboxArchiver
+
+
+OUTBOX_REPO_CONF = {
+    'test': 'outbox-repo-conf'
+}
+
+
+@mock.patch('intergov.processors.outbox_archiver.ApiOutboxRepo')
+@mock.patch('intergov.processors.outbox_archiver.ArchiveOutboxMessagesUseCase')
+def test(
+    ArchiveOutboxMessagesUseCase,
+    ApiOutboxRepo
+):
+    archiver = OutboxArchiver(outbox_repo_conf=OUTBOX_REPO_CONF)
+
+    ApiOutboxRepo.assert_called_once()
+    args, kwargs = ApiOutboxRepo.call_args_list[0]
+    assert OUTBOX_REPO_CONF.items() <= args[0].items()
+    ArchiveOutboxMessagesUseCase.assert_called_once_with(
+        outbox_repo=ApiOutboxRepo.return_value,
+        older_than_seconds=OutboxArchiver.ARCHIVE_AFTER_SECONDS,
+        batch_size=OutboxArchiver.BATCH_SIZE
+    )
+    use_case = ArchiveOutboxMessagesUseCase.return_value
+    use_case.execute.side_effect = [
+        10,
+        0,
+        Exception()
+    ]
+    assert iter(archiver) is archiver
+    assert next(archiver) == 10
+    assert next(archiver) == 0
+    assert next(archiver) is None
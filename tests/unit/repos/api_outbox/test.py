@@ -1,6 +1,10 @@
+import datetime
 from unittest import mock
 import pytest
-from intergov.repos.api_outbox.postgresrepo import PostgresRepo
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import ProgrammingError
+from intergov.conf import env_postgres_config
+from intergov.repos.api_outbox.postgresrepo import PostgresRepo, dispose_engines
 from tests.unit.domain.wire_protocols.test_generic_message import (
     _generate_msg_object
 )
@@ -14,6 +18,22 @@ CONNECTION_DATA = {
 }
 
 
+POOL_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+}
+
+
+@pytest.fixture(autouse=True)
+def engines():
+    # engines are shared by the repos, but each test mocks its own
+    dispose_engines()
+    yield
+    dispose_engines()
+
+
 def _generate_message_mock(**kwargs):
     message_mock = mock.MagicMock()
     data = _generate_msg_object(**kwargs).to_dict()
@@ -22,8 +42,9 @@ def _generate_message_mock(**kwargs):
     return message_mock
 
 
+@mock.patch('intergov.repos.api_outbox.postgresrepo.migrate')
 @mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine', autospec=True)
-def test_initialization(create_engine):
+def test_initialization(create_engine, migrate):
     # non default dbname
     PostgresRepo(CONNECTION_DATA)
     user = CONNECTION_DATA['user']
@@ -31,7 +52,8 @@ def test_initialization(create_engine):
     host = CONNECTION_DATA['host']
     dbname = CONNECTION_DATA['dbname']
     create_engine.assert_called_once_with(
-        f"postgresql+psycopg2://{user}:{password}@{host}/{dbname}"
+        f"postgresql+psycopg2://{user}:{password}@{host}/{dbname}",
+        **POOL_OPTIONS
     )
     create_engine.reset_mock()
     # default name
@@ -39,7 +61,8 @@ def test_initialization(create_engine):
     connection_data = {**CONNECTION_DATA, 'dbname': None}
     PostgresRepo(connection_data)
     create_engine.assert_called_once_with(
-        f"postgresql+psycopg2://{user}:{password}@{host}/{dbname}"
+        f"postgresql+psycopg2://{user}:{password}@{host}/{dbname}",
+        **POOL_OPTIONS
     )
     # testing missing keys errors
     for key in CONNECTION_DATA.keys():
@@ -50,9 +73,107 @@ def test_initialization(create_engine):
         assert str(einfo.value) == str(KeyError(key))
 
 
+@mock.patch('intergov.repos.api_outbox.postgresrepo.migrate')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine', autospec=True)
+def test_pool_options_from_env(create_engine, migrate, monkeypatch):
+    monkeypatch.setenv('IGL_DEFAULT_POSTGRES_POOL_SIZE', '15')
+    monkeypatch.setenv('IGL_TEST_POOL_MAX_OVERFLOW', '0')
+    monkeypatch.setenv('IGL_TEST_CREATE_SCHEMA', 'false')
+    PostgresRepo({**env_postgres_config('TEST'), **CONNECTION_DATA})
+    create_engine.assert_called_once_with(
+        mock.ANY,
+        **{**POOL_OPTIONS, 'pool_size': 15, 'max_overflow': 0}
+    )
+    assert not migrate.called
+
+
+@mock.patch('intergov.repos.api_outbox.postgresrepo.Base')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.migrate')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
+def test_engine_shared(create_engine, migrate, Base):
+    create_engine.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    repo = PostgresRepo(CONNECTION_DATA)
+    other_repo = PostgresRepo(CONNECTION_DATA)
+    # the same pool and sessions for the same database
+    assert repo.engine is other_repo.engine
+    assert repo.DBSession is other_repo.DBSession
+    create_engine.assert_called_once()
+    # schema is created once
+    Base.metadata.create_all.assert_called_once_with(bind=repo.engine)
+    migrate.assert_called_once_with(repo.engine)
+
+    # the different pool settings mean the different engine
+    create_engine.reset_mock()
+    tuned_repo = PostgresRepo({
+        **CONNECTION_DATA,
+        'pool_size': 20,
+        'pool_pre_ping': False,
+        'create_schema': False,
+    })
+    assert tuned_repo.engine is not repo.engine
+    create_engine.assert_called_once_with(
+        mock.ANY,
+        **{**POOL_OPTIONS, 'pool_size': 20, 'pool_pre_ping': False}
+    )
+    # and the schema is not created if it's disabled
+    assert migrate.call_count == 1
+
+    # disposed engines are created again
+    create_engine.reset_mock()
+    dispose_engines()
+    repo.engine.dispose.assert_called_once()
+    PostgresRepo(CONNECTION_DATA)
+    create_engine.assert_called_once()
+    assert migrate.call_count == 2
+
+
+def _inserted_row(msg, id):
+    row = {
+        'sender': str(msg.sender),
+        'receiver': str(msg.receiver),
+        'subject': str(msg.subject),
+        'obj': str(msg.obj),
+        'predicate': str(msg.predicate),
+        'sender_ref': str(msg.sender_ref),
+    }
+    row_mock = mock.MagicMock()
+    row_mock.id = id
+    row_mock.__getitem__.side_effect = row.__getitem__
+    return row_mock
+
+
 @mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
 @mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
 def test_post(sessionmaker, create_engine):
+    session = sessionmaker.return_value.return_value
+    repo = PostgresRepo(CONNECTION_DATA)
+    # testing post
+    message = _generate_msg_object()
+    session.execute.return_value.fetchall.return_value = [_inserted_row(message, 1)]
+    assert repo.post(message) == 1
+    session.commit.assert_called_once()
+    # single statement which skips duplicates
+    statement = session.execute.call_args[0][0]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert sql.startswith('INSERT INTO message')
+    assert 'ON CONFLICT (sender, sender_ref, receiver, md5(subject), obj, predicate)' in sql
+    assert 'DO NOTHING RETURNING message.id' in sql
+    session.query.assert_not_called()
+    # testing duplicate
+    session.execute.return_value.fetchall.return_value = []
+    assert repo.post(message) is True
+    # errors are not hidden
+    session.reset_mock()
+    session.execute.side_effect = Exception()
+    with pytest.raises(Exception):
+        repo.post(message)
+    session.rollback.assert_called_once()
+    session.close.assert_called_once()
+
+
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
+def test_post_without_dedup_index(sessionmaker, create_engine):
     def session_add(m):
         m.id = 1
 
@@ -61,18 +182,47 @@ def test_post(sessionmaker, create_engine):
     query.count.return_value = 0
 
     session = sessionmaker.return_value.return_value
+    session.execute.side_effect = ProgrammingError(
+        'INSERT', {}, Exception('there is no unique or exclusion constraint matching the ON CONFLICT specification')
+    )
     session.query.return_value = query
     session.add.side_effect = session_add
 
     repo = PostgresRepo(CONNECTION_DATA)
-    # testing post
     message = _generate_msg_object()
-    assert repo.post(message) is 1
-    session.commit.assert_called_once()
+    assert repo.post(message) == 1
+    assert repo.post_many([message]) == [1]
     # testing duplicate
     query.count.return_value = 1
     assert repo.post(message) is True
 
+    session.execute.side_effect = ProgrammingError('INSERT', {}, Exception('something else'))
+    with pytest.raises(ProgrammingError):
+        repo.post(message)
+
+
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
+def test_post_many(sessionmaker, create_engine):
+    session = sessionmaker.return_value.return_value
+    repo = PostgresRepo(CONNECTION_DATA)
+    messages = [_generate_msg_object() for i in range(3)]
+    # the second one is a duplicate
+    session.execute.return_value.fetchall.return_value = [
+        _inserted_row(messages[2], 12),
+        _inserted_row(messages[0], 10),
+    ]
+    assert repo.post_many(messages) == [10, True, 12]
+    session.execute.assert_called_once()
+    session.commit.assert_called_once()
+    statement = session.execute.call_args[0][0]
+    compiled = statement.compile(dialect=postgresql.dialect())
+    assert 'sender_ref_m2' in compiled.params
+
+    session.reset_mock()
+    assert repo.post_many([]) == []
+    session.execute.assert_not_called()
+
 
 @mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
 @mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
@@ -238,3 +388,130 @@ def test_unsafe(sessionmaker, create_engine):
     repo.is_empty()
     query.count.assert_called_once()
     session.close.assert_called_once()
+
+
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
+def test_claim_next_pending(sessionmaker, create_engine):
+    rows = []
+    for i in [2, 1]:
+        row = _generate_msg_object(sender_ref=f'ref-{i}').to_dict()
+        row['id'] = i
+        row['status'] = 'sending'
+        rows.append(row)
+    session = sessionmaker.return_value.return_value
+    session.execute.return_value.fetchall.return_value = rows
+    repo = PostgresRepo(CONNECTION_DATA)
+
+    claimed = repo.claim_next_pending(2, lease_seconds=30)
+    assert [m.id for m in claimed] == [1, 2]
+    assert claimed[0].sender_ref == 'ref-1'
+    assert claimed[0].status == 'sending'
+    session.commit.assert_called_once()
+    session.close.assert_called_once()
+
+    # single statement which doesn't wait for the rows locked by others
+    statement = session.execute.call_args[0][0]
+    compiled = statement.compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert sql.startswith('UPDATE message SET')
+    assert 'FOR UPDATE SKIP LOCKED' in sql
+    assert 'RETURNING' in sql
+    assert compiled.params['param_1'] == 2
+
+    session.reset_mock()
+    session.execute.side_effect = Exception()
+    assert repo.claim_next_pending() == []
+    session.rollback.assert_called_once()
+    session.close.assert_called_once()
+
+
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
+def test_iter_search(sessionmaker, create_engine):
+    rows = []
+    for i in range(1, 6):
+        row = _generate_message_mock()
+        row.id = i
+        rows.append(row)
+    query = mock.MagicMock()
+    query.filter.return_value = query
+    query.order_by.return_value = query
+    pages = [rows[:2], rows[2:4], rows[4:]]
+    query.limit.return_value.all.side_effect = pages
+    session = sessionmaker.return_value.return_value
+    session.query.return_value = query
+    repo = PostgresRepo(CONNECTION_DATA)
+
+    found = list(repo.iter_search({'sender__eq': 'AU'}, page_size=2))
+    assert [msg_id for msg_id, msg in found] == [1, 2, 3, 4, 5]
+    assert found[0][1].sender == rows[0].sender
+    # page per query, the short last page ends the scan
+    assert query.limit.call_count == 3
+    query.limit.assert_called_with(2)
+    assert session.close.call_count == 3
+    # the next page starts after the last id seen
+    filters = [str(c[0][0]) for c in query.filter.call_args_list]
+    assert filters.count('message.sender = :sender_1') == 3
+    assert filters.count('message.id > :id_1') == 2
+
+    # the full last page means one more query
+    query.reset_mock()
+    query.filter.return_value = query
+    query.order_by.return_value = query
+    query.limit.return_value.all.side_effect = [rows[3:5], []]
+    found = list(repo.iter_search(page_size=2, after_id=3))
+    assert [msg_id for msg_id, msg in found] == [4, 5]
+    assert query.limit.call_count == 2
+
+
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
+def test_search_count(sessionmaker, create_engine):
+    query = mock.MagicMock()
+    query.filter.return_value = query
+    query.count.return_value = 42
+    session = sessionmaker.return_value.return_value
+    session.query.return_value = query
+    repo = PostgresRepo(CONNECTION_DATA)
+    assert repo.search_count({'receiver__eq': 'SG'}) == 42
+    query.filter.assert_called_once()
+    query.all.assert_not_called()
+    session.close.assert_called_once()
+
+
+@mock.patch('intergov.repos.api_outbox.postgresrepo.create_engine')
+@mock.patch('intergov.repos.api_outbox.postgresrepo.sessionmaker')
+def test_archive_final(sessionmaker, create_engine):
+    session = sessionmaker.return_value.return_value
+    session.execute.return_value.scalar.return_value = datetime.datetime(2020, 12, 15, 10, 30)
+    session.execute.return_value.rowcount = 7
+    repo = PostgresRepo(CONNECTION_DATA)
+
+    assert repo.archive_final(3600, batch_size=100) == 7
+    session.commit.assert_called_once()
+    session.close.assert_called_once()
+    executed = [str(c[0][0]) for c in session.execute.call_args_list]
+    # the partition for the current month is created on demand
+    assert (
+        "CREATE TABLE IF NOT EXISTS message_archive_2020_12 PARTITION OF message_archive "
+        "FOR VALUES FROM ('2020-12-01T00:00:00') TO ('2021-01-01T00:00:00')"
+    ) in executed
+    archive_statement = executed[-1]
+    assert archive_statement.startswith('WITH moved AS (DELETE FROM message')
+    assert "status IN ('accepted', 'rejected')" in archive_statement
+    assert 'INSERT INTO message_archive' in archive_statement
+    assert session.execute.call_args[0][1] == {
+        'age': 3600,
+        'batch_size': 100,
+        'archived_at': datetime.datetime(2020, 12, 15, 10, 30),
+    }
+
+    # nothing is half-done on errors
+    session.reset_mock()
+    session.execute.side_effect = [mock.MagicMock(), Exception('Boom')]
+    with pytest.raises(Exception):
+        repo.archive_final(3600)
+    session.rollback.assert_called_once()
+    session.commit.assert_not_called()
+    session.close.assert_called_once()
@@ -0,0 +1,59 @@
+from unittest import mock
+
+from intergov.repos.api_outbox.migrations import MIGRATIONS, migrate
+
+
+def _executed(conn):
+    return [str(call[0][0]) for call in conn.execute.call_args_list]
+
+
+def test_migrate():
+    engine = mock.MagicMock()
+    conn = engine.begin.return_value.__enter__.return_value
+    conn.execute.return_value.first.return_value = None
+
+    assert migrate(engine) == [name for name, statements in MIGRATIONS]
+    executed = _executed(conn)
+    assert executed[0].startswith('CREATE TABLE IF NOT EXISTS api_outbox_migrations')
+    for name, statements in MIGRATIONS:
+        for statement in statements:
+            assert statement in executed
+    assert any('message_active_status_idx' in s and "WHERE status IN ('pending', 'sending')" in s for s in executed)
+    assert any('UNIQUE INDEX' in s and "WHERE status != 'rejected'" in s for s in executed)
+    # each one in its own transaction, after the lock is taken
+    assert engine.begin.call_count == len(MIGRATIONS) + 1
+    assert sum('pg_advisory_xact_lock' in s for s in executed) == len(MIGRATIONS)
+
+    # applied ones are not applied again
+    conn.reset_mock()
+    conn.execute.return_value.first.return_value = (1,)
+    assert migrate(engine) == []
+    executed = _executed(conn)
+    for name, statements in MIGRATIONS:
+        for statement in statements:
+            assert statement not in executed
+
+
+def test_migrate_failure():
+    engine = mock.MagicMock()
+    conn = engine.begin.return_value.__enter__.return_value
+    conn.execute.return_value.first.return_value = None
+
+    def execute(statement, **kwargs):
+        if 'broken' in str(statement):
+            raise Exception('duplicates')
+        return mock.DEFAULT
+
+    conn.execute.side_effect = execute
+    migrations = [
+        ('0001', ['SELECT 1']),
+        ('0002', ['SELECT broken']),
+        ('0003', ['SELECT 3']),
+    ]
+    # the failed one is not recorded, the following ones are applied anyway
+    assert migrate(engine, migrations) == ['0001', '0003']
+    inserted = [
+        call[1]['name'] for call in conn.execute.call_args_list
+        if str(call[0][0]).startswith('INSERT')
+    ]
+    assert inserted == ['0001', '0003']
@@ -0,0 +1,96 @@
+import json
+from unittest import mock
+
+from intergov.repos.base.elasticmq.batch import BatchElasticMQRepoMixin
+from tests.unit.domain.wire_protocols.test_generic_message import _generate_msg_dict
+
+
+QUEUE_URL = 'http://elasticmq/queue/test'
+
+
+class DummyRepo(BatchElasticMQRepoMixin):
+    def __init__(self):
+        self.client = mock.Mock()
+        self.queue_url = QUEUE_URL
+
+
+def _sqs_messages(bodies, start=0):
+    return {
+        'Messages': [
+            {'ReceiptHandle': 'rh-{}'.format(start + i), 'Body': json.dumps(body)}
+            for i, body in enumerate(bodies)
+        ]
+    }
+
+
+def test_get_many():
+    repo = DummyRepo()
+    msg_dicts = [_generate_msg_dict() for i in range(12)]
+    repo.client.receive_message.side_effect = [
+        _sqs_messages(msg_dicts[:10]),
+        _sqs_messages(msg_dicts[10:], start=10),
+    ]
+    fetched = repo.get_many(15, wait_time_seconds=20)
+    assert len(fetched) == 12
+    assert fetched[0][0] == 'rh-0'
+    assert fetched[11][0] == 'rh-11'
+    assert fetched[3][1].to_dict() == msg_dicts[3]
+
+    first_call, second_call = repo.client.receive_message.call_args_list
+    # only the first call is long polling
+    assert first_call[1] == {'QueueUrl': QUEUE_URL, 'MaxNumberOfMessages': 10, 'WaitTimeSeconds': 20}
+    assert second_call[1] == {'QueueUrl': QUEUE_URL, 'MaxNumberOfMessages': 5, 'WaitTimeSeconds': 0}
+
+    # empty queue
+    repo.client.receive_message.side_effect = None
+    repo.client.receive_message.return_value = {}
+    assert repo.get_many(5) == []
+
+
+def test_get_jobs_skips_broken_bodies():
+    repo = DummyRepo()
+    repo.client.receive_message.return_value = {
+        'Messages': [
+            {'ReceiptHandle': 'rh-0', 'Body': '{"a": 1}'},
+            {'ReceiptHandle': 'rh-1', 'Body': 'not a json'},
+        ]
+    }
+    assert repo.get_jobs(10) == [('rh-0', {'a': 1})]
+
+
+def test_delete_many():
+    repo = DummyRepo()
+    msg_ids = ['rh-{}'.format(i) for i in range(15)]
+    repo.client.delete_message_batch.side_effect = [
+        {'Successful': [], 'Failed': [{'Id': '3'}]},
+        {'Successful': []},
+    ]
+    assert repo.delete_many(msg_ids) == ['rh-3']
+    assert repo.client.delete_message_batch.call_count == 2
+    first_call, second_call = repo.client.delete_message_batch.call_args_list
+    assert len(first_call[1]['Entries']) == 10
+    assert second_call[1]['Entries'][0] == {'Id': '0', 'ReceiptHandle': 'rh-10'}
+
+
+def test_post_jobs():
+    repo = DummyRepo()
+    jobs = [{'n': i} for i in range(11)]
+    repo.client.send_message_batch.side_effect = [
+        {'Successful': []},
+        {'Successful': [], 'Failed': [{'Id': '0'}]},
+    ]
+    assert repo.post_jobs(jobs, delay_seconds=3) == [{'n': 10}]
+    first_call = repo.client.send_message_batch.call_args_list[0]
+    assert first_call[1]['Entries'][1] == {'Id': '1', 'MessageBody': '{"n": 1}', 'DelaySeconds': 3}
+
+
+def test_post_jobs_size_limit():
+    repo = DummyRepo()
+    repo.client.send_message_batch.return_value = {'Successful': []}
+    jobs = [{'payload': 'x' * 100 * 1024} for i in range(5)]
+    assert repo.post_jobs(jobs) == []
+    # no more than 256KB per batch
+    assert [
+        len(call[1]['Entries'])
+        for call in repo.client.send_message_batch.call_args_list
+    ] == [2, 2, 1]
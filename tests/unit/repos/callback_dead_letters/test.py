@@ -0,0 +1,59 @@
+import json
+from unittest import mock
+
+from intergov.repos.callback_dead_letters import CallbackDeadLetterRepo
+
+
+CONNECTION_DATA = {
+    'host': 'minio.host',
+    'port': 1000,
+    'access_key': 'access_key',
+    'secret_key': 'secret_key',
+    'bucket': 'bucket',
+    'use_ssl': False
+}
+
+JOB = {
+    's': 'http://subscriber.example.com:8000/callback',
+    'payload': {'sender': 'AU'},
+    'retry': 2,
+}
+
+
+@mock.patch('intergov.repos.callback_dead_letters.minio.miniorepo.miniorepo.boto3')
+def test_post_get(boto3):
+    repo = CallbackDeadLetterRepo(CONNECTION_DATA)
+    s3_client = boto3.client.return_value
+
+    key = repo.post(JOB, reason='max retries reached')
+    assert key.startswith('subscriber.example.com:8000/')
+    assert key.endswith('.json')
+    kwargs = s3_client.put_object.call_args[1]
+    assert kwargs['Key'] == key
+    stored = json.loads(kwargs['Body'])
+    assert stored['job'] == JOB
+    assert stored['reason'] == 'max retries reached'
+
+    body = mock.MagicMock()
+    body.read.return_value = kwargs['Body'].encode('utf-8')
+    s3_client.get_object.return_value = {'Body': body}
+    assert repo.get(key) == stored
+
+
+@mock.patch('intergov.repos.callback_dead_letters.minio.miniorepo.miniorepo.boto3')
+def test_list_delete(boto3):
+    repo = CallbackDeadLetterRepo(CONNECTION_DATA)
+    s3_client = boto3.client.return_value
+
+    s3_client.list_objects_v2.return_value = {'Contents': [{'Key': 'a'}, {'Key': 'b'}]}
+    assert repo.list_keys(prefix=repo.host_prefix('host'), start_after='0', limit=5000) == ['a', 'b']
+    s3_client.list_objects_v2.assert_called_once_with(
+        Bucket='bucket', Prefix='host/', MaxKeys=1000, StartAfter='0'
+    )
+    s3_client.list_objects_v2.return_value = {}
+    assert repo.list_keys() == []
+
+    s3_client.delete_objects.return_value = {'Errors': [{'Key': 'key-1'}]}
+    assert repo.delete_many('key-{}'.format(i) for i in range(1500)) == ['key-1', 'key-1']
+    assert s3_client.delete_objects.call_count == 2
+    assert len(s3_client.delete_objects.call_args[1]['Delete']['Objects']) == 500
@@ -0,0 +1,36 @@
+import hashlib
+import json
+from unittest import mock
+
+from intergov.repos.callback_payloads import CallbackPayloadRepo
+
+
+CONNECTION_DATA = {
+    'host': 'minio.host',
+    'port': 1000,
+    'access_key': 'access_key',
+    'secret_key': 'secret_key',
+    'bucket': 'bucket',
+    'use_ssl': False
+}
+
+PAYLOAD = {'sender': 'AU', 'obj': 'x' * 1000}
+
+
+@mock.patch('intergov.repos.callback_payloads.minio.miniorepo.miniorepo.boto3')
+def test_post_get(boto3):
+    repo = CallbackPayloadRepo(CONNECTION_DATA)
+    s3_client = boto3.client.return_value
+
+    content = json.dumps(PAYLOAD)
+    key = repo.post(PAYLOAD)
+    assert key == hashlib.sha256(content.encode('utf-8')).hexdigest() + '.json'
+    assert s3_client.put_object.call_args[1]['Key'] == key
+    assert s3_client.put_object.call_args[1]['Body'] == content
+    # the same payload is the same object
+    assert repo.post(PAYLOAD, content=repo.serialize(PAYLOAD)) == key
+
+    body = mock.MagicMock()
+    body.read.return_value = content.encode('utf-8')
+    s3_client.get_object.return_value = {'Body': body}
+    assert repo.get(key) == PAYLOAD
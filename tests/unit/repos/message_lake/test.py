@@ -1,8 +1,10 @@
 import json
+import uuid
 from unittest import mock
 import pytest
+from botocore.client import ClientError
 
-from intergov.repos.message_lake.minio.miniorepo import MessageLakeMinioRepo
+from intergov.repos.message_lake.minio.miniorepo import MessageLakeMinioRepo, merge_metadata
 from tests.unit.domain.wire_protocols.test_generic_message import _generate_msg_object
 
 
@@ -103,7 +105,7 @@ def test_get(boto3):
     repo.get_object_content.side_effect = raise_error('metadata.json')
 
     assert repo.get(str(msg.sender), str(msg.sender_ref))
-    repo.get_object_content.side_effect = raise_error('content.json')
+    repo.get_object_content.side_effect = raise_error(('content.json', 'message.json'))
     assert not repo.get(str(msg.sender), str(msg.sender_ref))
 
     exception.response['Error']['Code'] = 'Random'
@@ -111,3 +113,207 @@ def test_get(boto3):
         repo.get_object_content.side_effect = raise_error(key)
         with pytest.raises(Exception):
             repo.get(str(msg.sender), str(msg.sender_ref))
+
+
+@mock.patch('intergov.repos.message_lake.minio.miniorepo.ClientError', Exception)
+@mock.patch('intergov.repos.message_lake.minio.miniorepo.miniorepo.boto3')
+def test_journal(boto3):
+    repo = MessageLakeMinioRepo(CONNECTION_DATA)
+    journal = {'received': ['message_lake', 'object_acl']}
+
+    repo.get_object_content = mock.Mock()
+    repo.get_object_content.return_value = json.dumps(journal)
+    assert repo.get_journal('AU', 'xxxx-xxxx-xxxx') == journal
+    path = repo.get_object_content.call_args[0][0]
+    assert path.startswith('AU/') and path.endswith('/journal.json')
+
+    exception = Exception()
+    exception.response = {
+        'Error': {
+            'Code': 'NoSuchKey'
+        }
+    }
+    repo.get_object_content.side_effect = exception
+    assert repo.get_journal('AU', 'xxxx-xxxx-xxxx') == {}
+    exception.response['Error']['Code'] = 'Random'
+    with pytest.raises(Exception):
+        repo.get_journal('AU', 'xxxx-xxxx-xxxx')
+
+    repo.put_message_related_object = mock.Mock()
+    repo.put_journal('AU', 'xxxx-xxxx-xxxx', journal)
+    repo.put_message_related_object.assert_called_once_with(
+        sender='AU',
+        sender_ref='xxxx-xxxx-xxxx',
+        rel_path='/journal.json',
+        content_body=json.dumps(journal)
+    )
+
+
+class FakeS3Client:
+    """
+    In-memory stand-in of the S3 client which understands If-Match header
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.handlers = []
+        self.meta = mock.Mock()
+        self.meta.events.register.side_effect = (
+            lambda event, handler: self.handlers.append(handler)
+        )
+        # called before each put, to emulate concurrent writers
+        self.before_put = None
+
+    @staticmethod
+    def _error(code):
+        return ClientError({'Error': {'Code': code}}, 'Operation')
+
+    def get_object(self, Key, **kwargs):
+        if Key not in self.objects:
+            raise self._error('NoSuchKey')
+        content, etag = self.objects[Key]
+        body = mock.Mock()
+        body.read.return_value = content.encode('utf-8')
+        return {'Body': body, 'ETag': etag}
+
+    def put_object(self, Key, Body, **kwargs):
+        params = {'headers': {}}
+        for handler in self.handlers:
+            handler(params=params, model=None, context={})
+        if self.before_put:
+            self.before_put()
+        if_match = params['headers'].get('If-Match')
+        if if_match and self.objects.get(Key, (None, None))[1] != if_match:
+            raise self._error('PreconditionFailed')
+        self.write(Key, Body)
+        return {}
+
+    def write(self, key, body):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        self.objects[key] = (body, '"{}"'.format(uuid.uuid4().hex))
+
+    def read(self, key_suffix):
+        for key, (content, etag) in self.objects.items():
+            if key.endswith(key_suffix):
+                return json.loads(content)
+
+    def key(self, key_suffix):
+        for key in self.objects:
+            if key.endswith(key_suffix):
+                return key
+
+
+@mock.patch('intergov.repos.message_lake.minio.miniorepo.miniorepo.boto3')
+def test_combined_layout(boto3):
+    s3_client = boto3.client.return_value = FakeS3Client()
+    repo = MessageLakeMinioRepo(dict(CONNECTION_DATA, layout='combined'))
+    assert repo.layout == 'combined'
+    msg = _generate_msg_object(sender_ref='xxxx-xxxx-xxxx', status='pending')
+    sender = str(msg.sender)
+
+    # single write
+    assert repo.post(msg)
+    assert len(s3_client.objects) == 1
+    stored = s3_client.read('/message.json')
+    assert stored['content']['sender_ref'] == 'xxxx-xxxx-xxxx'
+    assert stored['metadata'] == {'status': 'pending'}
+
+    # single read
+    with mock.patch.object(s3_client, 'get_object', wraps=s3_client.get_object) as get_object:
+        found = repo.get(sender, 'xxxx-xxxx-xxxx')
+        get_object.assert_called_once()
+    assert found.sender_ref == 'xxxx-xxxx-xxxx'
+    assert found.status == 'pending'
+
+    # metadata is updated in the same object
+    repo.update_metadata(sender, 'xxxx-xxxx-xxxx', {'status': 'accepted'})
+    assert len(s3_client.objects) == 1
+    assert s3_client.read('/message.json')['metadata'] == {'status': 'accepted'}
+    assert repo.get(sender, 'xxxx-xxxx-xxxx').status == 'accepted'
+
+    # and vice versa
+    repo.layout = 'separate'
+    assert repo.get(sender, 'xxxx-xxxx-xxxx').status == 'accepted'
+
+    # messages stored with the separate layout are still readable
+    s3_client.objects.clear()
+    assert repo.get(sender, 'xxxx-xxxx-xxxx') is None
+    assert repo.post(msg)
+    assert len(s3_client.objects) == 2
+    repo.layout = 'combined'
+    assert repo.get(sender, 'xxxx-xxxx-xxxx').status == 'pending'
+    repo.update_metadata(sender, 'xxxx-xxxx-xxxx', {'status': 'rejected'})
+    assert len(s3_client.objects) == 2
+    assert s3_client.read('/metadata.json') == {'status': 'rejected'}
+
+
+@mock.patch('intergov.repos.message_lake.minio.miniorepo.miniorepo.boto3')
+def test_update_metadata_after_layout_change(boto3):
+    s3_client = boto3.client.return_value = FakeS3Client()
+    repo = MessageLakeMinioRepo(dict(CONNECTION_DATA, layout='combined'))
+    msg = _generate_msg_object(sender_ref='xxxx-xxxx-xxxx', status='pending')
+    sender = str(msg.sender)
+    assert repo.post(msg)
+
+    # switched back to the separate layout
+    repo = MessageLakeMinioRepo(dict(CONNECTION_DATA, layout='separate'))
+    assert repo.update_metadata(sender, 'xxxx-xxxx-xxxx', {'status': 'accepted'})
+    assert len(s3_client.objects) == 1
+    assert s3_client.read('/message.json')['metadata'] == {'status': 'accepted'}
+    assert repo.get(sender, 'xxxx-xxxx-xxxx').status == 'accepted'
+
+
+@mock.patch('intergov.repos.message_lake.minio.miniorepo.time')
+@mock.patch('intergov.repos.message_lake.minio.miniorepo.miniorepo.boto3')
+def test_update_metadata_conflicts(boto3, time):
+    s3_client = boto3.client.return_value = FakeS3Client()
+    repo = MessageLakeMinioRepo(CONNECTION_DATA)
+    msg = _generate_msg_object(sender_ref='xxxx-xxxx-xxxx', status='pending')
+    sender = str(msg.sender)
+    assert repo.post(msg)
+    metadata_key = s3_client.key('/metadata.json')
+
+    # somebody patches channel id while we are updating the status
+    def concurrent_patch():
+        s3_client.before_put = None
+        s3_client.write(metadata_key, json.dumps({'status': 'pending', 'channel_id': 'ch1'}))
+
+    s3_client.before_put = concurrent_patch
+    repo.update_metadata(sender, 'xxxx-xxxx-xxxx', {'status': 'accepted'})
+    # both of the updates survive
+    assert s3_client.read('/metadata.json') == {'status': 'accepted', 'channel_id': 'ch1'}
+    time.sleep.assert_called_once()
+    # the header is only set for the conditional writes
+    assert repo.post(msg)
+    assert s3_client.read('/metadata.json') == {'status': 'pending'}
+
+    # the number of attempts is limited
+    time.reset_mock()
+
+    def always_conflict():
+        s3_client.write(metadata_key, json.dumps({'status': 'pending'}))
+
+    s3_client.before_put = always_conflict
+    with pytest.raises(ClientError):
+        repo.update_metadata(sender, 'xxxx-xxxx-xxxx', {'status': 'accepted'})
+    assert time.sleep.call_count == repo.UPDATE_MAX_ATTEMPTS - 1
+    for call in time.sleep.call_args_list:
+        assert 0 < call[0][0] <= repo.UPDATE_RETRY_MAX_SECONDS
+
+    # the other errors are not retried
+    s3_client.before_put = None
+    s3_client.objects.clear()
+    time.reset_mock()
+    with pytest.raises(ClientError):
+        repo.update_metadata(sender, 'xxxx-xxxx-xxxx', {'status': 'accepted'})
+    assert not time.sleep.called
+
+
+def test_merge_metadata():
+    current = {'status': 'pending', 'channel_id': 'ch1'}
+    assert merge_metadata(current, {'status': 'accepted'}) == {
+        'status': 'accepted', 'channel_id': 'ch1'
+    }
+    assert current == {'status': 'pending', 'channel_id': 'ch1'}
+    assert merge_metadata(None, {'status': 'accepted'}) == {'status': 'accepted'}
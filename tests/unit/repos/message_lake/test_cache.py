@@ -0,0 +1,71 @@
+from unittest import mock
+
+from intergov.repos.message_lake.cache import CachedMessageLakeRepo, MessageLakeCache
+from tests.unit.domain.wire_protocols.test_generic_message import _generate_msg_object
+
+
+@mock.patch('intergov.repos.message_lake.cache.time')
+def test_cache(time):
+    time.monotonic.return_value = 100
+    cache = MessageLakeCache(max_size=2, ttl=5)
+    pending = _generate_msg_object(sender_ref='1', status='pending')
+    accepted = _generate_msg_object(sender_ref='2', status='accepted')
+
+    assert cache.get('AU', '1') is None
+    cache.put('AU', '1', pending)
+    cache.put('AU', '2', accepted)
+    assert cache.get('AU', '1') is pending
+    assert cache.get('AU', '2') is accepted
+
+    # not final ones expire
+    time.monotonic.return_value = 106
+    assert cache.get('AU', '1') is None
+    assert cache.get('AU', '2') is accepted
+
+    # least recently used are pushed out
+    cache.put('AU', '1', pending)
+    cache.get('AU', '2')
+    cache.put('AU', '3', pending)
+    assert cache.get('AU', '1') is None
+    assert cache.get('AU', '2') is accepted
+    assert cache.get('AU', '3') is pending
+
+    cache.invalidate('AU', '2')
+    assert cache.get('AU', '2') is None
+    cache.clear()
+    assert cache.get('AU', '3') is None
+
+    # disabled
+    cache = MessageLakeCache(max_size=0)
+    cache.put('AU', '2', accepted)
+    assert cache.get('AU', '2') is None
+
+
+def test_cached_repo():
+    msg = _generate_msg_object(sender_ref='1', status='accepted')
+    repo = mock.Mock()
+    repo.get.return_value = msg
+    cached_repo = CachedMessageLakeRepo(repo, MessageLakeCache())
+
+    assert cached_repo.get('AU', '1') is msg
+    assert cached_repo.get('AU', '1') is msg
+    repo.get.assert_called_once_with('AU', '1')
+
+    # writes invalidate
+    cached_repo.update_metadata('AU', '1', {'channel_id': 'x'})
+    repo.update_metadata.assert_called_once_with('AU', '1', {'channel_id': 'x'})
+    assert cached_repo.get('AU', '1') is msg
+    assert repo.get.call_count == 2
+    cached_repo.post(msg)
+    repo.post.assert_called_once_with(msg)
+    cached_repo.get(msg.sender, '1')
+    assert repo.get.call_count == 3
+
+    # not found ones are not cached
+    repo.get.return_value = None
+    assert cached_repo.get('AU', '2') is None
+    assert cached_repo.get('AU', '2') is None
+    assert repo.get.call_count == 5
+
+    # the rest goes to the repo as is
+    assert cached_repo.get_journal is repo.get_journal
@@ -0,0 +1,162 @@
+import datetime
+from unittest import mock
+
+from intergov.repos.subscriptions import SubscriptionsChangesRepo, SubscriptionsIndex
+
+
+CONNECTION_DATA = {
+    'host': 'minio.host',
+    'port': 1000,
+    'access_key': 'access_key',
+    'secret_key': 'secret_key',
+    'bucket': 'bucket',
+    'use_ssl': False
+}
+
+
+@mock.patch('intergov.repos.subscriptions.minio.miniorepo.miniorepo.boto3')
+def test_changes_repo(boto3):
+    repo = SubscriptionsChangesRepo(CONNECTION_DATA)
+    s3_client = boto3.client.return_value
+
+    key = repo.post('UN.CEFACT.*')
+    assert key.startswith('changes/')
+    assert key.endswith('/UN.CEFACT.*')
+    assert s3_client.put_object.call_args[1]['Key'] == key
+    assert repo.key_at(datetime.datetime(2020, 1, 2, 3, 4, 5, 6)) == 'changes/20200102T030405000006'
+
+    s3_client.list_objects_v2.side_effect = [
+        {'Contents': [{'Key': 'changes/1.a/UN.CEFACT'}], 'IsTruncated': True},
+        {'Contents': [{'Key': 'changes/2.b/AU.*'}], 'IsTruncated': False},
+    ]
+    assert repo.list_changes(start_after='changes/0') == [
+        ('changes/1.a/UN.CEFACT', 'UN.CEFACT'),
+        ('changes/2.b/AU.*', 'AU.*'),
+    ]
+    assert s3_client.list_objects_v2.call_args_list[0][1]['StartAfter'] == 'changes/0'
+    assert s3_client.list_objects_v2.call_args_list[1][1]['StartAfter'] == 'changes/1.a/UN.CEFACT'
+
+    s3_client.list_objects_v2.side_effect = None
+    s3_client.list_objects_v2.return_value = {}
+    assert repo.list_changes() == []
+    assert 'StartAfter' not in s3_client.list_objects_v2.call_args[1]
+
+
+def _subscriptions_repo():
+    repo = mock.Mock()
+    repo.get_subscriptions_by_pattern.side_effect = lambda pattern: [pattern.predicate]
+    return repo
+
+
+def _lookups(repo):
+    return [call[0][0].predicate for call in repo.get_subscriptions_by_pattern.call_args_list]
+
+
+def test_index_cache():
+    repo = _subscriptions_repo()
+    index = SubscriptionsIndex(repo)
+
+    assert index.get_subscribers('UN.CEFACT.Trade') == ['UN.CEFACT.Trade']
+    assert index.get_subscribers('UN.CEFACT.Trade') == ['UN.CEFACT.Trade']
+    assert index.get_subscribers('UN.CEFACT') == ['UN.CEFACT']
+    assert _lookups(repo) == ['UN.CEFACT.Trade', 'UN.CEFACT']
+
+    # empty results are cached as well
+    repo.get_subscriptions_by_pattern.side_effect = lambda pattern: []
+    assert index.get_subscribers('AU.gov') == []
+    assert index.get_subscribers('AU.gov') == []
+    assert len(_lookups(repo)) == 3
+
+
+def test_index_invalidate():
+    repo = _subscriptions_repo()
+    index = SubscriptionsIndex(repo)
+    for predicate in ('UN', 'UN.CEFACT', 'UN.CEFACT.Trade', 'UN.CEFACTX', 'AU.gov'):
+        index.get_subscribers(predicate)
+
+    index.invalidate('un.cefact.*')
+    for predicate in ('UN', 'UN.CEFACT', 'UN.CEFACT.Trade', 'UN.CEFACTX', 'AU.gov'):
+        index.get_subscribers(predicate)
+    # only the predicates under the changed one are looked up again
+    assert _lookups(repo)[5:] == ['UN.CEFACT', 'UN.CEFACT.Trade']
+
+    index.invalidate()
+    index.get_subscribers('AU.gov')
+    assert _lookups(repo)[-1] == 'AU.gov'
+
+
+@mock.patch('intergov.repos.subscriptions.index.time')
+def test_index_ttl(time):
+    time.monotonic.return_value = 100
+    repo = _subscriptions_repo()
+    index = SubscriptionsIndex(repo, ttl=30)
+
+    index.get_subscribers('UN.CEFACT')
+    time.monotonic.return_value = 129
+    index.get_subscribers('UN.CEFACT')
+    assert len(_lookups(repo)) == 1
+
+    time.monotonic.return_value = 130
+    index.get_subscribers('UN.CEFACT')
+    assert len(_lookups(repo)) == 2
+
+
+@mock.patch('intergov.repos.subscriptions.index.time')
+def test_index_changes(time):
+    time.monotonic.return_value = 100
+    repo = _subscriptions_repo()
+    changes = mock.Mock()
+    changes.key_at.return_value = 'changes/0'
+    changes.list_changes.return_value = []
+    index = SubscriptionsIndex(repo, changes_repo=changes, ttl=300, check_interval=5)
+
+    index.get_subscribers('UN.CEFACT')
+    index.get_subscribers('AU.gov')
+    assert not changes.list_changes.called
+
+    time.monotonic.return_value = 105
+    changes.list_changes.return_value = [('changes/1.a/UN.*', 'UN.*')]
+    index.get_subscribers('UN.CEFACT')
+    index.get_subscribers('AU.gov')
+    changes.list_changes.assert_called_once_with(start_after='changes/0')
+    assert _lookups(repo) == ['UN.CEFACT', 'AU.gov', 'UN.CEFACT']
+
+    time.monotonic.return_value = 110
+    changes.list_changes.return_value = []
+    index.get_subscribers('UN.CEFACT')
+    changes.list_changes.assert_called_with(start_after='changes/1.a/UN.*')
+    assert len(_lookups(repo)) == 3
+
+    # changes unknown, so anything could have changed
+    time.monotonic.return_value = 115
+    changes.list_changes.side_effect = Exception("Hey")
+    index.get_subscribers('AU.gov')
+    assert _lookups(repo)[-1] == 'AU.gov'
+
+
+def test_index_uncached():
+    repo = _subscriptions_repo()
+    index = SubscriptionsIndex(repo)
+
+    for i in range(2):
+        assert index.get_subscribers('message.ref-1.received') == ['message.ref-1.received']
+    assert len(_lookups(repo)) == 2
+    assert index._size == 0
+
+
+def test_index_max_nodes():
+    repo = _subscriptions_repo()
+    index = SubscriptionsIndex(repo, max_nodes=4)
+
+    index.get_subscribers('UN.CEFACT.Trade')
+    index.get_subscribers('UN.CEFACT')
+    assert index._size == 3
+    # would be 5 nodes, so everything is dropped first
+    index.get_subscribers('AU.gov')
+    assert index._size == 2
+    index.get_subscribers('AU.gov')
+    index.get_subscribers('UN.CEFACT')
+    assert _lookups(repo) == ['UN.CEFACT.Trade', 'UN.CEFACT', 'AU.gov', 'UN.CEFACT']
+
+    index.invalidate('AU')
+    assert index._size == 2
@@ -153,7 +153,16 @@ TEST_ENV_POSTGRES_DEFAULT = {
     igl_value('default_postgres', 'host'): TEST_POSTGRES_DEFAULT_CONF['host'],
     igl_value('default_postgres', 'user'): TEST_POSTGRES_DEFAULT_CONF['user'],
     igl_value('default_postgres', 'password'): TEST_POSTGRES_DEFAULT_CONF['password'],
-    igl_value('default_postgres', 'dbname'): TEST_POSTGRES_DEFAULT_CONF['dbname']
+    igl_value('default_postgres', 'dbname'): TEST_POSTGRES_DEFAULT_CONF['dbname'],
+    igl_value('default_postgres', 'pool_recycle'): '600',
+}
+
+TEST_POSTGRES_POOL_DEFAULT_CONF = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_recycle': 600,
+    'pool_pre_ping': True,
+    'create_schema': True,
 }
 
 
@@ -170,6 +179,11 @@ CUSTOM_SQS_CONF['use_ssl'] = True
 CUSTOM_POSTGRES_CONF = {}
 for key, value in TEST_POSTGRES_DEFAULT_CONF.items():
     CUSTOM_POSTGRES_CONF[key] = f"{key}:{key}:{value}".upper()
+CUSTOM_POSTGRES_POOL_CONF = {
+    **TEST_POSTGRES_POOL_DEFAULT_CONF,
+    'pool_size': 20,
+    'pool_pre_ping': False,
+}
 
 CUSTOM_S3_CONF_NAME = "CUSTOM_S3_CONF_NAME"
 CUSTOM_SQS_CONF_NAME = "CUSTOM_SQS_CONF_NAME"
@@ -198,7 +212,9 @@ TEST_ENV_CUSTOM_POSTGRES_CONF = {
     igl_value(CUSTOM_POSTGRES_CONF_NAME, 'host'): CUSTOM_POSTGRES_CONF['host'],
     igl_value(CUSTOM_POSTGRES_CONF_NAME, 'user'): CUSTOM_POSTGRES_CONF['user'],
     igl_value(CUSTOM_POSTGRES_CONF_NAME, 'password'): CUSTOM_POSTGRES_CONF['password'],
-    igl_value(CUSTOM_POSTGRES_CONF_NAME, 'dbname'): CUSTOM_POSTGRES_CONF['dbname']
+    igl_value(CUSTOM_POSTGRES_CONF_NAME, 'dbname'): CUSTOM_POSTGRES_CONF['dbname'],
+    igl_value(CUSTOM_POSTGRES_CONF_NAME, 'pool_size'): '20',
+    igl_value(CUSTOM_POSTGRES_CONF_NAME, 'pool_pre_ping'): 'false',
 }
 
 TEST_ENV = {
@@ -237,7 +253,7 @@ def test_complex():
 
     assert to_str_dict(default_s3_conf) == TEST_S3_DEFAULT_CONF
     assert to_str_dict(default_sqs_conf) == TEST_SQS_DEFAULT_CONF
-    assert to_str_dict(default_postgres_conf) == TEST_POSTGRES_DEFAULT_CONF
+    assert default_postgres_conf == {**TEST_POSTGRES_DEFAULT_CONF, **TEST_POSTGRES_POOL_DEFAULT_CONF}
 
     # bool values
     assert isinstance(default_s3_conf['use_ssl'], bool)
@@ -263,4 +279,4 @@ def test_complex():
 
     assert custom_s3_conf == CUSTOM_S3_CONF, os.environ
     assert custom_sqs_conf == CUSTOM_SQS_CONF, os.environ
-    assert custom_postgres_conf == CUSTOM_POSTGRES_CONF, os.environ
+    assert custom_postgres_conf == {**CUSTOM_POSTGRES_CONF, **CUSTOM_POSTGRES_POOL_CONF}, os.environ
@@ -0,0 +1,34 @@
+from unittest import mock
+
+import responses
+
+from intergov import http_client
+
+
+def test_get_session():
+    session = http_client.get_session()
+    assert session is http_client.get_session()
+    adapter = session.get_adapter('https://channel.example.com')
+    assert adapter is session.get_adapter('http://channel.example.com')
+    assert adapter.max_retries.total == http_client.RETRIES
+    assert adapter.max_retries.status_forcelist == http_client.RETRY_STATUSES
+
+
+@mock.patch('requests.Session.request')
+def test_default_timeout(request):
+    session = http_client.create_session(timeout=(1, 2))
+    session.get('http://example.com')
+    assert request.call_args[1]['timeout'] == (1, 2)
+    # the explicit one wins
+    session.post('http://example.com', timeout=10)
+    assert request.call_args[1]['timeout'] == 10
+
+
+@responses.activate
+def test_requests():
+    responses.add(responses.GET, 'http://example.com/messages?a=1', json={'id': 1})
+    responses.add(responses.POST, 'http://example.com/messages', json={'id': 2})
+    responses.add(responses.PATCH, 'http://example.com/messages/2', status=409)
+    assert http_client.get('http://example.com/messages', params={'a': 1}).json() == {'id': 1}
+    assert http_client.post('http://example.com/messages', json={}).json() == {'id': 2}
+    assert http_client.patch('http://example.com/messages/2', json={}).status_code == 409
@@ -0,0 +1,89 @@
+from unittest import mock
+
+from intergov import rate_limiter
+from intergov.rate_limiter import (
+    CallbackRateLimiter,
+    MemoryRateLimitStore,
+    SqliteRateLimitStore,
+    parse_retry_after,
+    queue_delay,
+)
+
+URL = 'http://subscriber.example.com/callback'
+OTHER_URL = 'http://subscriber.example.com/other-callback'
+
+
+@mock.patch('intergov.rate_limiter.time')
+def test_token_bucket(time):
+    time.time.return_value = 1000
+    limiter = CallbackRateLimiter(rate=2, burst=3)
+    assert [limiter.acquire(URL) for i in range(3)] == [0, 0, 0]
+    # the same host
+    assert limiter.acquire(OTHER_URL) == 0.5
+    assert limiter.acquire('http://another.example.com/') == 0
+    time.time.return_value = 1000.5
+    assert limiter.acquire(URL) == 0
+    assert limiter.acquire(URL) == 0.5
+    # never more than burst
+    time.time.return_value = 2000
+    assert [limiter.acquire(URL) for i in range(4)] == [0, 0, 0, 0.5]
+
+
+@mock.patch('intergov.rate_limiter.random')
+@mock.patch('intergov.rate_limiter.time')
+def test_backoff_and_block(time, random):
+    time.time.return_value = 1000
+    random.uniform.side_effect = lambda a, b: b
+    limiter = CallbackRateLimiter(backoff_base=2, backoff_max=10)
+    assert [limiter.record_failure(URL) for i in range(5)] == [2, 4, 8, 10, 10]
+    assert limiter.record_failure(OTHER_URL) == 2
+    limiter.record_success(URL)
+    assert limiter.record_failure(URL) == 2
+
+    limiter.block(URL, 60)
+    assert limiter.acquire(OTHER_URL) == 60
+    assert limiter.record_failure(OTHER_URL) == 60
+    # shorter block doesn't shorten the current one
+    limiter.block(URL, 10)
+    time.time.return_value = 1030
+    assert limiter.acquire(URL) == 30
+    time.time.return_value = 1061
+    assert limiter.acquire(URL) == 0
+
+
+def test_sqlite_store(tmpdir):
+    path = str(tmpdir.join('rate-limits.db'))
+    # two processes sharing the file
+    first = CallbackRateLimiter(SqliteRateLimitStore(path), rate=0.001, burst=2)
+    second = CallbackRateLimiter(SqliteRateLimitStore(path), rate=0.001, burst=2)
+    assert first.acquire(URL) == 0
+    assert second.acquire(URL) == 0
+    assert first.acquire(URL) > 0
+    assert second.acquire(URL) > 0
+    second.block(URL, 100)
+    assert first.acquire(URL) > 99
+
+    store = SqliteRateLimitStore(path)
+    assert store.update('key', lambda state: ({'value': 1}, 'created')) == 'created'
+    assert store.update('key', lambda state: (None, state)) == {'value': 1}
+    assert store.update('key', lambda state: (None, state)) == {}
+
+
+def test_get_store(tmpdir):
+    assert isinstance(rate_limiter.get_store(''), MemoryRateLimitStore)
+    assert isinstance(rate_limiter.get_store(str(tmpdir.join('rate-limits.db'))), SqliteRateLimitStore)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(' 5 ') == 5
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412460) == 20
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412500) == 0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_queue_delay():
+    assert queue_delay(0) == 1
+    assert queue_delay(1.2) == 2
+    assert queue_delay(10000) == 900
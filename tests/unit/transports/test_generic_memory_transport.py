@@ -1,5 +1,7 @@
 import pytest
 
+from intergov.domain.channel_filters import generic_message_filter as gmf
+from intergov.domain.channel_filters.none_filter import NoneFilter
 from intergov.domain.wire_protocols import generic_discrete as gd
 from intergov.transports import generic_memory as gm
 from tests.unit.domain.wire_protocols import test_generic_message as tgm
@@ -25,3 +27,17 @@ def test_generic_memory_transport_post_message(valid_message_dicts):
     for msg in [gd.Message.from_dict(msg) for msg in valid_message_dicts]:
         transport.post_message(msg)
         assert msg in transport.get_messages()
+
+
+def test_generic_memory_transport_get_messages_filtered(valid_message_dicts):
+    messages = [gd.Message.from_dict(msg) for msg in valid_message_dicts]
+    transport = gm.GenericMemoryTransport(valid_message_dicts)
+    channel_filter = gmf.DiscreteGenericMessageFilter()
+    for field in channel_filter.fields:
+        channel_filter.allow_any(field)
+    assert transport.get_messages(channel_filter) == messages
+    channel_filter.blacklist('sender', 'AU')
+    assert transport.get_messages(channel_filter) == [
+        msg for msg in messages if str(msg.sender) != 'AU'
+    ]
+    assert transport.get_messages(NoneFilter()) == messages
@@ -0,0 +1,18 @@
+from unittest import mock
+
+from intergov.use_cases import ArchiveOutboxMessagesUseCase
+
+
+def test_execute():
+    outbox_repo = mock.MagicMock()
+    outbox_repo.archive_final.return_value = 100
+    use_case = ArchiveOutboxMessagesUseCase(
+        outbox_repo=outbox_repo,
+        older_than_seconds=3600,
+        batch_size=100
+    )
+    assert use_case.execute() == 100
+    outbox_repo.archive_final.assert_called_once_with(3600, batch_size=100)
+
+    outbox_repo.archive_final.return_value = 0
+    assert use_case.execute() == 0
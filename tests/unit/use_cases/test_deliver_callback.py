@@ -1,6 +1,10 @@
+import collections
+import threading
+import time
 import uuid
 from unittest import mock
 
+from intergov.rate_limiter import CallbackRateLimiter
 from intergov.use_cases import deliver_callback as uc
 
 
@@ -20,15 +24,15 @@ def test_deliver_callback_ok():
     assert use_case.execute() is not False
 
 
-@mock.patch('intergov.use_cases.deliver_callback.requests')
-def test_deliver_notification(requests):
+@mock.patch('intergov.use_cases.deliver_callback.http_client')
+def test_deliver_notification(http_client):
     dummy_url = 'http://dummy_url.com/404'
     delivery_outbox = mock.Mock()
     use_case = uc.DeliverCallbackUseCase(delivery_outbox)
 
     response = mock.Mock()
     response.status_code = 200
-    requests.post.return_value = response
+    http_client.post.return_value = response
 
     assert use_case._deliver_notification(dummy_url, {'payload': 'payload'})
     response.status_code = 400
@@ -135,3 +139,232 @@ def test_deliver_callback_does_not_resubmit_on_success():
     use_case.execute()
 
     assert delivery_outbox.post_job.not_called()
+
+
+def _batch_use_case(delivered_urls, workers=0, per_host_limit=2):
+    delivery_outbox = mock.Mock()
+    delivery_outbox.delete_many.return_value = []
+    delivery_outbox.post_jobs.return_value = []
+    use_case = uc.DeliverCallbackUseCase(
+        delivery_outbox,
+        workers=workers,
+        per_host_limit=per_host_limit,
+        rate_limiter=CallbackRateLimiter(rate=1000, burst=1000)
+    )
+    use_case._deliver_notification = mock.Mock(side_effect=lambda url, payload: url in delivered_urls)
+    return use_case
+
+
+def _posted_jobs(delivery_outbox):
+    return [
+        job
+        for args, kwargs in delivery_outbox.post_jobs.call_args_list
+        for job in args[0]
+    ]
+
+
+def test_execute_batch():
+    ok_url = 'http://ok.example.com/callback'
+    failing_url = 'http://failing.example.com/callback'
+    fetched = [
+        ('id-1', {'s': ok_url, 'payload': {'n': 1}}),
+        ('id-2', {'s': failing_url, 'payload': {'n': 2}}),
+        ('id-3', {'s': failing_url, 'payload': {'n': 3}, 'retry': 1}),
+        ('id-4', {'s': failing_url, 'payload': {'n': 4}, 'retry': 2}),
+        ('id-5', {'s': ok_url, 'payload': {'n': 5}, 'retry': 3}),
+    ]
+    for workers in (0, 4):
+        use_case = _batch_use_case({ok_url}, workers=workers)
+        delivery_outbox = use_case.delivery_outbox
+        delivery_outbox.get_jobs.return_value = fetched
+        assert use_case.execute_batch(10, wait_time_seconds=5) is False
+        delivery_outbox.get_jobs.assert_called_once_with(10, 5)
+        # the one over max retries is not delivered at all
+        assert use_case._deliver_notification.call_count == 4
+        delivery_outbox.delete_many.assert_called_once_with(['id-1', 'id-2', 'id-3', 'id-4', 'id-5'])
+        # re-posted with retries count increased, the last retry is dropped
+        assert _posted_jobs(delivery_outbox) == [
+            {'s': failing_url, 'payload': {'n': 2}, 'retry': 1},
+            {'s': failing_url, 'payload': {'n': 3}, 'retry': 2},
+        ]
+
+    use_case = _batch_use_case({ok_url})
+    use_case.delivery_outbox.get_jobs.return_value = fetched[:1]
+    assert use_case.execute_batch(10) is True
+    use_case.delivery_outbox.post_jobs.assert_not_called()
+
+    use_case.delivery_outbox.get_jobs.return_value = []
+    assert use_case.execute_batch(10) is None
+
+
+def test_execute_batch_not_deleted():
+    failing_url = 'http://failing.example.com/callback'
+    use_case = _batch_use_case(set())
+    use_case.delivery_outbox.get_jobs.return_value = [
+        ('id-1', {'s': failing_url, 'payload': {'n': 1}}),
+        ('id-2', {'s': failing_url, 'payload': {'n': 2}}),
+    ]
+    use_case.delivery_outbox.delete_many.return_value = ['id-1']
+    assert use_case.execute_batch(10) is False
+    # re-posted before the deletion, so the one not deleted may be delivered twice
+    assert _posted_jobs(use_case.delivery_outbox) == [
+        {'s': failing_url, 'payload': {'n': 1}, 'retry': 1},
+        {'s': failing_url, 'payload': {'n': 2}, 'retry': 1},
+    ]
+
+
+def test_execute_batch_not_posted():
+    ok_url = 'http://ok.example.com/callback'
+    failing_url = 'http://failing.example.com/callback'
+    use_case = _batch_use_case({ok_url})
+    delivery_outbox = use_case.delivery_outbox
+    delivery_outbox.get_jobs.return_value = [
+        ('id-1', {'s': ok_url, 'payload': {'n': 1}}),
+        ('id-2', {'s': failing_url, 'payload': {'n': 2}}),
+        ('id-3', {'s': failing_url, 'payload': {'n': 3}}),
+    ]
+    # the queue rejects part of the batch
+    delivery_outbox.post_jobs.side_effect = lambda jobs, delay_seconds: [
+        job for job in jobs if job['payload']['n'] == 3
+    ]
+    assert use_case.execute_batch(10) is False
+    # the rejected one is left in the queue to be received again
+    delivery_outbox.delete_many.assert_called_once_with(['id-1', 'id-2'])
+
+
+def test_per_host_limit():
+    slow_url = 'http://slow.example.com/callback/{}'
+    in_flight = collections.Counter()
+    max_in_flight = collections.Counter()
+    lock = threading.Lock()
+
+    def deliver(url, payload):
+        host = url.split('/')[2]
+        with lock:
+            in_flight[host] += 1
+            max_in_flight[host] = max(max_in_flight[host], in_flight[host])
+        time.sleep(0.01)
+        with lock:
+            in_flight[host] -= 1
+        return True
+
+    use_case = _batch_use_case(set(), workers=8, per_host_limit=2)
+    use_case._deliver_notification = mock.Mock(side_effect=deliver)
+    jobs = [{'s': slow_url.format(i), 'payload': {}} for i in range(10)]
+    jobs += [{'s': 'http://other.example.com/{}'.format(i), 'payload': {}} for i in range(3)]
+    assert use_case._deliver_many(jobs) == [True] * 13
+    assert max_in_flight['slow.example.com'] == 2
+    assert max_in_flight['other.example.com'] <= 2
+
+
+def test_throttled():
+    url = 'http://busy.example.com/callback'
+    use_case = _batch_use_case({url})
+    use_case.rate_limiter = CallbackRateLimiter(rate=0.5, burst=2)
+    delivery_outbox = use_case.delivery_outbox
+    delivery_outbox.get_jobs.return_value = [
+        ('id-{}'.format(i), {'s': url, 'payload': {'n': i}, 'retry': 1})
+        for i in range(4)
+    ]
+    assert use_case.execute_batch(10) is False
+    assert use_case._deliver_notification.call_count == 2
+    # put back as they were, after the bucket is refilled
+    delivery_outbox.post_jobs.assert_called_once()
+    args, kwargs = delivery_outbox.post_jobs.call_args
+    assert args[0] == [
+        {'s': url, 'payload': {'n': 2}, 'retry': 1},
+        {'s': url, 'payload': {'n': 3}, 'retry': 1},
+    ]
+    assert kwargs['delay_seconds'] == 2
+
+    # the same in the one by one mode
+    delivery_outbox.get_job.return_value = ('id-5', {'s': url, 'payload': {'n': 5}})
+    assert use_case.execute() is False
+    delivery_outbox.post_job.assert_called_once_with({'s': url, 'payload': {'n': 5}}, delay_seconds=2)
+    delivery_outbox.delete.assert_called_once_with('id-5')
+
+
+def test_throttled_not_posted():
+    url = 'http://busy.example.com/callback'
+    use_case = _batch_use_case({url})
+    use_case.rate_limiter = CallbackRateLimiter(rate=0.5, burst=0)
+    delivery_outbox = use_case.delivery_outbox
+    delivery_outbox.get_job.return_value = ('id-1', {'s': url, 'payload': {'n': 1}})
+
+    for failure in (False, Exception('Boom')):
+        delivery_outbox.reset_mock()
+        if isinstance(failure, Exception):
+            delivery_outbox.post_job.side_effect = failure
+        else:
+            delivery_outbox.post_job.return_value = failure
+        assert use_case.execute() is False
+        delivery_outbox.post_job.assert_called_once()
+        # left in the queue to be received again
+        delivery_outbox.delete.assert_not_called()
+    assert not use_case._deliver_notification.called
+
+
+@mock.patch('intergov.use_cases.deliver_callback.http_client')
+def test_retry_after(http_client):
+    url = 'http://busy.example.com/callback'
+    delivery_outbox = mock.Mock()
+    delivery_outbox.get_job.return_value = ('id-1', {'s': url, 'payload': {'n': 1}})
+    use_case = uc.DeliverCallbackUseCase(delivery_outbox)
+    response = mock.Mock()
+    response.status_code = 429
+    response.headers = {'Retry-After': '120'}
+    http_client.post.return_value = response
+
+    assert use_case.execute() is False
+    args, kwargs = delivery_outbox.post_job.call_args
+    assert args[0] == {'s': url, 'payload': {'n': 1}, 'retry': 1}
+    assert 119 <= kwargs['delay_seconds'] <= 120
+    # the host is blocked, the next job is not even tried
+    assert use_case.execute() is False
+    assert http_client.post.call_count == 1
+
+
+def test_dead_letters():
+    url = 'http://failing.example.com/callback'
+    use_case = _batch_use_case(set())
+    use_case.dead_letter_repo = mock.Mock()
+    use_case.delivery_outbox.get_jobs.return_value = [
+        ('id-1', {'s': url, 'payload': {'n': 1}, 'retry': 2}),
+        ('id-2', {'s': url, 'payload': {'n': 2}, 'retry': 3}),
+    ]
+    assert use_case.execute_batch(10) is False
+    assert use_case.dead_letter_repo.post.call_args_list == [
+        mock.call({'s': url, 'payload': {'n': 2}, 'retry': 3}, reason='max retries reached'),
+        mock.call({'s': url, 'payload': {'n': 1}, 'retry': 2}, reason='max retries reached'),
+    ]
+    use_case.delivery_outbox.post_jobs.assert_not_called()
+
+    # the broken dead letter repo doesn't break the delivery
+    use_case.dead_letter_repo.post.side_effect = Exception('unavailable')
+    use_case.delivery_outbox.get_job.return_value = ('id-3', {'s': url, 'payload': {'n': 3}, 'retry': 2})
+    assert use_case.execute() is False
+    assert use_case.dead_letter_repo.post.call_count == 3
+
+
+def test_payload_key():
+    use_case = _batch_use_case({'http://a/1'})
+    use_case.payload_repo = mock.Mock()
+    use_case.payload_repo.get.return_value = {'big': 'payload'}
+    fetched = [
+        ('q-1', {'s': 'http://a/1', 'payload_key': 'key.json'}),
+        ('q-2', {'s': 'http://a/2', 'payload_key': 'key.json', 'retry': 1}),
+    ]
+    assert use_case.process_batch(fetched) is False
+
+    # read once for all the jobs
+    use_case.payload_repo.get.assert_called_once_with('key.json')
+    use_case._deliver_notification.assert_any_call('http://a/1', {'big': 'payload'})
+    assert _posted_jobs(use_case.delivery_outbox) == [
+        {'s': 'http://a/2', 'payload_key': 'key.json', 'retry': 2}
+    ]
+
+
+def test_payload_key_no_repo():
+    use_case = _batch_use_case({'http://a/1'})
+    assert use_case.process_batch([('q-1', {'s': 'http://a/1', 'payload_key': 'key.json'})]) is False
+    assert not use_case._deliver_notification.called
@@ -16,3 +16,12 @@ def test_execute():
     with pytest.raises(Exception) as e:
         uc.execute(*USE_CASE_ARGS)
         assert str(e) == str(repo.bulk_delete.side_effect)
+
+
+def test_changes():
+    repo = mock.MagicMock()
+    repo.get_subscriptions_by_pattern.return_value = {mock.Mock(callback_url=CALLBACK)}
+    changes_repo = mock.Mock()
+    uc = SubscriptionDeregisterUseCase(repo, changes_repo=changes_repo)
+    uc.execute(*USE_CASE_ARGS)
+    changes_repo.post.assert_called_once_with("UN.CEFACT.*")
@@ -4,6 +4,7 @@ import random
 import uuid
 
 from intergov.domain.wire_protocols import generic_discrete as protocol
+from intergov.repos.delivery_outbox import DeliveryOutboxRepo
 from intergov.use_cases import DispatchMessageToSubscribersUseCase
 from tests.unit.domain.wire_protocols import test_generic_message as test_protocol
 
@@ -94,3 +95,79 @@ def test_multiple_descriptions(valid_message_dicts):
     use_case.execute()
 
     assert not notifications.delete.called
+
+
+def test_subscriptions_index(valid_message_dicts):
+    message_dict = valid_message_dicts[0]
+    notifications = mock.Mock()
+    notifications.get_job.return_value = (1234, message_dict)
+    delivery_outbox = mock.Mock()
+    delivery_outbox.post_job.return_value = True
+    subscriptions = mock.Mock()
+    subscriptions_index = mock.Mock()
+    subscriptions_index.get_subscribers.return_value = [mock.Mock(callback_url='https://foo.com/bar')]
+    use_case = DispatchMessageToSubscribersUseCase(
+        notifications,
+        delivery_outbox,
+        subscriptions,
+        subscriptions_index=subscriptions_index)
+    use_case.execute()
+
+    subscriptions_index.get_subscribers.assert_called_once_with(message_dict['predicate'])
+    assert not subscriptions.get_subscriptions_by_pattern.called
+    assert delivery_outbox.post_job.call_args[0][0]['s'] == 'https://foo.com/bar'
+
+
+def _batch_use_case(message_dict, subscribers_count, **kwargs):
+    notifications = mock.Mock()
+    notifications.get_job.return_value = (1234, message_dict)
+    delivery_outbox = mock.Mock(spec=DeliveryOutboxRepo)
+    delivery_outbox.post_jobs.return_value = []
+    subscriptions = mock.Mock()
+    subscriptions.get_subscriptions_by_pattern.return_value = [
+        mock.Mock(callback_url='https://foo.com/{}'.format(i))
+        for i in range(subscribers_count)
+    ]
+    return DispatchMessageToSubscribersUseCase(notifications, delivery_outbox, subscriptions, **kwargs)
+
+
+def test_batch_post(valid_message_dicts):
+    use_case = _batch_use_case(valid_message_dicts[0], 25)
+    assert use_case.execute()
+
+    jobs = use_case.delivery_outbox.post_jobs.call_args[0][0]
+    assert [job['s'] for job in jobs] == ['https://foo.com/{}'.format(i) for i in range(25)]
+    assert all(job['payload'] == jobs[0]['payload'] for job in jobs)
+    assert not use_case.delivery_outbox.post_job.called
+    assert use_case.notifications.delete.called
+
+    use_case = _batch_use_case(valid_message_dicts[0], 25)
+    use_case.delivery_outbox.post_jobs.return_value = [{'s': 'https://foo.com/1'}]
+    assert use_case.execute() is False
+    assert not use_case.notifications.delete.called
+
+
+def test_payload_stored(valid_message_dicts):
+    payload_repo = mock.Mock()
+    payload_repo.serialize.side_effect = lambda payload: 'x' * 100
+    payload_repo.post.return_value = 'key.json'
+
+    use_case = _batch_use_case(valid_message_dicts[0], 3, payload_repo=payload_repo, payload_size_limit=100)
+    assert use_case.execute()
+    assert not payload_repo.post.called
+    assert 'payload' in use_case.delivery_outbox.post_jobs.call_args[0][0][0]
+
+    use_case = _batch_use_case(valid_message_dicts[0], 3, payload_repo=payload_repo, payload_size_limit=99)
+    assert use_case.execute()
+    payload_repo.post.assert_called_once()
+    assert payload_repo.post.call_args[1]['content'] == 'x' * 100
+    assert use_case.delivery_outbox.post_jobs.call_args[0][0] == [
+        {'s': 'https://foo.com/{}'.format(i), 'payload_key': 'key.json'}
+        for i in range(3)
+    ]
+
+    # sent inline if can't be stored
+    payload_repo.post.side_effect = Exception("Hey")
+    use_case = _batch_use_case(valid_message_dicts[0], 3, payload_repo=payload_repo, payload_size_limit=99)
+    assert use_case.execute()
+    assert 'payload' in use_case.delivery_outbox.post_jobs.call_args[0][0][0]
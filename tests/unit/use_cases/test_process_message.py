@@ -132,3 +132,277 @@ def test_repo_exceptions(valid_message_dicts):
         assert not use_case.execute()
         repo_method.assert_called()
         repo_method.side_effect = None
+
+
+def test_batch():
+    messages = []
+    for status in ['received', 'received', 'pending']:
+        message_dict = test_protocol._generate_msg_dict()
+        message_dict['status'] = status
+        message_dict['sender'] = 'CN'
+        message_dict['receiver'] = 'AU'
+        messages.append(protocol.Message.from_dict(message_dict))
+    # the last one is pending but from the remote jurisdiction - must fail
+
+    bc_inbox = mock.Mock()
+    bc_inbox.get_many.return_value = [
+        (i, m) for i, m in enumerate(messages)
+    ]
+    message_lake = mock.Mock()
+    object_acl = mock.Mock()
+    object_retreival = mock.Mock()
+    notifications = mock.Mock()
+    use_case = ProcessMessageUseCase(
+        'AU',
+        bc_inbox,
+        message_lake,
+        object_acl,
+        object_retreival,
+        notifications,
+        None
+    )
+
+    assert use_case.execute_batch(10, wait_time_seconds=5) is False
+    bc_inbox.get_many.assert_called_once_with(10, 5)
+    assert message_lake.post.call_count == 3
+    assert object_retreival.post_job.call_count == 2
+    # only successful ones are deleted and in one call
+    bc_inbox.delete_many.assert_called_once_with([0, 1])
+    assert not bc_inbox.delete.called
+
+    bc_inbox.reset_mock()
+    bc_inbox.get_many.return_value = [(0, messages[0])]
+    assert use_case.execute_batch(10) is True
+    bc_inbox.delete_many.assert_called_once_with([0])
+
+    bc_inbox.reset_mock()
+    bc_inbox.get_many.return_value = []
+    assert use_case.execute_batch(10) is None
+    assert not bc_inbox.delete_many.called
+
+
+def test_concurrent_side_effects():
+    message_dict = test_protocol._generate_msg_dict()
+    message_dict['status'] = 'pending'
+    message_dict['sender'] = 'AU'
+    message_dict['receiver'] = 'CN'
+    m = protocol.Message.from_dict(message_dict)
+
+    bc_inbox = mock.Mock()
+    bc_inbox.get.return_value = (432, m)
+    message_lake = mock.Mock()
+    object_acl = mock.Mock()
+    object_retreival = mock.Mock()
+    notifications = mock.Mock()
+    blockchain_outbox = mock.Mock()
+    use_case = ProcessMessageUseCase(
+        'AU',
+        bc_inbox,
+        message_lake,
+        object_acl,
+        object_retreival,
+        notifications,
+        blockchain_outbox,
+        side_effects_workers=5
+    )
+    assert use_case.executor is not None
+
+    assert use_case.execute()
+    message_lake.post.assert_called_once_with(m)
+    object_acl.post.assert_called_once_with(m)
+    notifications.post.assert_called_once()
+    notifications.post_job.assert_called_once()
+    blockchain_outbox.post.assert_called_once_with(m)
+    assert not object_retreival.post_job.called
+    bc_inbox.delete.assert_called_once_with(432)
+
+    # any failed side effect means the message is not deleted
+    bc_inbox.reset_mock()
+    object_acl.post.side_effect = Exception()
+    assert not use_case.execute()
+    assert not bc_inbox.delete.called
+    object_acl.post.side_effect = None
+    blockchain_outbox.post.return_value = False
+    assert not use_case.execute()
+    assert not bc_inbox.delete.called
+
+
+def test_notifications_after_message_lake():
+    message_dict = test_protocol._generate_msg_dict()
+    message_dict['status'] = 'received'
+    message_dict['sender'] = 'CN'
+    message_dict['receiver'] = 'AU'
+    m = protocol.Message.from_dict(message_dict)
+
+    calls = []
+    bc_inbox = mock.Mock()
+    bc_inbox.get.return_value = (432, m)
+    message_lake = mock.Mock()
+    message_lake.post.side_effect = lambda msg: calls.append('message_lake') or True
+    notifications = mock.Mock()
+    notifications.post_job.side_effect = lambda job: calls.append('notification_job')
+    use_case = ProcessMessageUseCase(
+        'AU',
+        bc_inbox,
+        message_lake,
+        mock.Mock(),
+        mock.Mock(),
+        notifications,
+        None,
+        side_effects_workers=5
+    )
+    assert use_case.execute()
+    assert calls == ['message_lake', 'notification_job']
+
+    # the message is not in the lake, so nobody is notified
+    message_lake.post.side_effect = Exception()
+    notifications.reset_mock()
+    bc_inbox.reset_mock()
+    assert not use_case.execute()
+    assert not notifications.post.called
+    assert not notifications.post_job.called
+    assert not bc_inbox.delete.called
+
+
+def test_step_journal():
+    message_dict = test_protocol._generate_msg_dict()
+    message_dict['status'] = 'received'
+    message_dict['sender'] = 'CN'
+    message_dict['receiver'] = 'AU'
+    m = protocol.Message.from_dict(message_dict)
+
+    bc_inbox = mock.Mock()
+    bc_inbox.get.return_value = (432, m)
+    message_lake = mock.Mock()
+    object_acl = mock.Mock()
+    object_retreival = mock.Mock()
+    notifications = mock.Mock()
+    journal = mock.Mock()
+    journal.get_journal.return_value = {}
+    use_case = ProcessMessageUseCase(
+        'AU',
+        bc_inbox,
+        message_lake,
+        object_acl,
+        object_retreival,
+        notifications,
+        None,
+        step_journal_repo=journal
+    )
+
+    # notifications are failed, the rest is recorded as done
+    notifications.post.side_effect = Exception()
+    assert not use_case.execute()
+    journal.get_journal.assert_called_once_with('CN', m.sender_ref)
+    journal.put_journal.assert_called_once_with('CN', m.sender_ref, {
+        'received': ['message_lake', 'object_acl', 'notification_job', 'object_retrieval']
+    })
+    assert not bc_inbox.delete.called
+
+    # redelivery does only the failed step
+    notifications.post.side_effect = None
+    journal.get_journal.return_value = journal.put_journal.call_args[0][2]
+    for repo in [message_lake, object_acl, object_retreival, notifications, journal]:
+        repo.reset_mock()
+    assert use_case.execute()
+    notifications.post.assert_called_once()
+    assert not notifications.post_job.called
+    assert not message_lake.post.called
+    assert not object_acl.post.called
+    assert not object_retreival.post_job.called
+    journal.put_journal.assert_called_once()
+    bc_inbox.delete.assert_called_once_with(432)
+
+    # steps done for another status don't count
+    # and the broken journal is not a reason to fail
+    m.status = 'pending'
+    m.sender = 'AU'
+    use_case.blockchain_outbox_repo = mock.Mock()
+    journal.get_journal.side_effect = Exception()
+    journal.put_journal.side_effect = Exception()
+    assert use_case.execute()
+    message_lake.post.assert_called_once_with(m)
+    use_case.blockchain_outbox_repo.post.assert_called_once_with(m)
+
+
+def test_step_journal_statuses():
+    message_dict = test_protocol._generate_msg_dict()
+    message_dict['status'] = 'received'
+    message_dict['sender'] = 'CN'
+    message_dict['receiver'] = 'AU'
+    m = protocol.Message.from_dict(message_dict)
+
+    bc_inbox = mock.Mock()
+    bc_inbox.get.return_value = (432, m)
+    notifications = mock.Mock()
+    journal = mock.Mock()
+    journal.get_journal.return_value = {}
+    use_case = ProcessMessageUseCase(
+        'AU',
+        bc_inbox,
+        mock.Mock(),
+        mock.Mock(),
+        mock.Mock(),
+        notifications,
+        None,
+        step_journal_repo=journal
+    )
+
+    # both statuses fail on notifications, so both are journaled
+    notifications.post.side_effect = Exception()
+    assert not use_case.execute()
+    journal.get_journal.return_value = journal.put_journal.call_args[0][2]
+
+    m.status = 'accepted'
+    assert not use_case.execute()
+    saved = journal.put_journal.call_args[0][2]
+    assert saved == {
+        'received': ['message_lake', 'object_acl', 'notification_job', 'object_retrieval'],
+        'accepted': ['message_lake', 'object_acl', 'notification_job'],
+    }
+
+    # the journal which can't be read is not overwritten
+    journal.reset_mock()
+    journal.get_journal.side_effect = Exception()
+    assert not use_case.execute()
+    assert not journal.put_journal.called
+
+
+def test_batch_outbox():
+    messages = []
+    for sender, status in [('AU', 'pending'), ('CN', 'received'), ('AU', 'pending'), ('AU', 'pending')]:
+        message_dict = test_protocol._generate_msg_dict()
+        message_dict['status'] = status
+        message_dict['sender'] = sender
+        message_dict['receiver'] = 'CN' if sender == 'AU' else 'AU'
+        messages.append(protocol.Message.from_dict(message_dict))
+
+    bc_inbox = mock.Mock()
+    bc_inbox.get_many.return_value = list(enumerate(messages))
+    blockchain_outbox = mock.Mock()
+    # the last one is failed to be posted in the batch
+    blockchain_outbox.post_many.return_value = [1, True, None]
+    use_case = ProcessMessageUseCase(
+        'AU',
+        bc_inbox,
+        mock.Mock(),
+        mock.Mock(),
+        mock.Mock(),
+        mock.Mock(),
+        blockchain_outbox
+    )
+
+    assert use_case.execute_batch(10) is True
+    # outgoing messages are posted in one go
+    blockchain_outbox.post_many.assert_called_once_with([messages[0], messages[2], messages[3]])
+    # and the failed one is retried as usual
+    blockchain_outbox.post.assert_called_once_with(messages[3])
+    bc_inbox.delete_many.assert_called_once_with([0, 1, 2, 3])
+
+    # batch failure means one by one posting
+    bc_inbox.reset_mock()
+    blockchain_outbox.reset_mock()
+    blockchain_outbox.post_many.side_effect = Exception()
+    assert use_case.execute_batch(10) is True
+    assert blockchain_outbox.post.call_count == 3
+    bc_inbox.delete_many.assert_called_once_with([0, 1, 2, 3])
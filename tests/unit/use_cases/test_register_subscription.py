@@ -16,3 +16,19 @@ def test_execute():
         uc.execute(*USE_CASE_ARGS)
         assert str(e) == str(repo.post.side_effect)
 
+
+def test_changes():
+    repo = mock.MagicMock()
+    changes_repo = mock.Mock()
+    uc = SubscriptionRegisterUseCase(repo, changes_repo=changes_repo)
+    assert uc.execute(*USE_CASE_ARGS)
+    changes_repo.post.assert_called_once_with("UN.CEFACT.*")
+
+    # the subscription is saved already
+    changes_repo.post.side_effect = Exception("Hey")
+    assert uc.execute(*USE_CASE_ARGS)
+
+    changes_repo.post.reset_mock()
+    repo.subscribe_by_pattern.return_value = None
+    assert uc.execute(*USE_CASE_ARGS) is None
+    assert not changes_repo.post.called
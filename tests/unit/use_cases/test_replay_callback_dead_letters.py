@@ -0,0 +1,69 @@
+from unittest import mock
+
+from intergov.use_cases import ReplayCallbackDeadLettersUseCase
+
+
+def _dead_letters(stored):
+    repo = mock.Mock()
+    repo.host_prefix.side_effect = lambda host: host + '/'
+
+    def list_keys(prefix='', start_after=None, limit=1000):
+        keys = sorted(key for key in stored if key.startswith(prefix) and key > (start_after or ''))
+        return keys[:limit]
+
+    def get(key):
+        if stored[key] is None:
+            raise ValueError(key)
+        return {'job': stored[key], 'reason': 'max retries reached'}
+
+    def delete_many(keys):
+        for key in keys:
+            del stored[key]
+        return []
+
+    repo.list_keys.side_effect = list_keys
+    repo.get.side_effect = get
+    repo.delete_many.side_effect = delete_many
+    return repo
+
+
+def test_replay():
+    stored = {
+        'a.example.com/1': {'s': 'http://a.example.com/1', 'payload': {'n': 1}, 'retry': 2},
+        'a.example.com/2': {'s': 'http://a.example.com/2', 'payload': {'n': 2}, 'retry': 2},
+        'a.example.com/3': None,
+        'a.example.com/4': {'s': 'http://a.example.com/4', 'payload': {'n': 4}, 'retry': 2},
+        'b.example.com/1': {'s': 'http://b.example.com/1', 'payload': {'n': 5}, 'retry': 2},
+    }
+    dead_letters = _dead_letters(stored)
+    delivery_outbox = mock.Mock()
+    delivery_outbox.post_jobs.return_value = []
+    uc = ReplayCallbackDeadLettersUseCase(
+        dead_letters, delivery_outbox, host='a.example.com', batch_size=2
+    )
+
+    assert uc.execute() == 2
+    delivery_outbox.post_jobs.assert_called_once_with([
+        {'s': 'http://a.example.com/1', 'payload': {'n': 1}, 'retry': 0},
+        {'s': 'http://a.example.com/2', 'payload': {'n': 2}, 'retry': 0},
+    ])
+    # the broken one is skipped
+    assert uc.execute() == 1
+    assert delivery_outbox.post_jobs.call_args[0][0] == [
+        {'s': 'http://a.example.com/4', 'payload': {'n': 4}, 'retry': 0},
+    ]
+    assert uc.execute() == 0
+    assert sorted(stored) == ['a.example.com/3', 'b.example.com/1']
+
+
+def test_replay_post_failed():
+    stored = {
+        'a.example.com/1': {'s': 'http://a.example.com/1', 'payload': {'n': 1}},
+        'a.example.com/2': {'s': 'http://a.example.com/2', 'payload': {'n': 2}},
+    }
+    delivery_outbox = mock.Mock()
+    delivery_outbox.post_jobs.side_effect = lambda jobs: jobs[:1]
+    uc = ReplayCallbackDeadLettersUseCase(_dead_letters(stored), delivery_outbox)
+    assert uc.execute() == 1
+    assert list(stored) == ['a.example.com/1']
+    assert uc.execute() == 0
@@ -0,0 +1,172 @@
+from unittest import mock
+
+from intergov.channels.routing import RoutingIndex
+from intergov.domain.wire_protocols.generic_discrete import Message
+from intergov.use_cases.route_to_channel import CIRCUIT_OPEN, RouteToChannelUseCase
+from tests.unit.domain.wire_protocols.test_generic_message import _generate_msg_dict
+
+
+def _channel(name):
+    channel = mock.MagicMock()
+    channel.__str__.return_value = name
+    channel.screen_message.return_value = False
+    return channel
+
+
+def _message(receiver, sender_ref):
+    return Message.from_dict(_generate_msg_dict(receiver=receiver, sender_ref=sender_ref))
+
+
+def test_execute():
+    channel = _channel('channel-sg')
+    channel.post_message.return_value = 'ch-id'
+    uc = RouteToChannelUseCase([
+        {'Jurisdiction': 'SG', 'ChannelInstance': channel},
+    ])
+    assert uc.execute(_message('SG', 'ref-1')) == ('channel-sg', 'ch-id')
+    assert not uc.execute(_message('CN', 'ref-2'))
+
+
+def test_execute_many():
+    sg_first = _channel('sg-first')
+    sg_second = _channel('sg-second')
+    cn = _channel('cn')
+    cn.screen_message.return_value = True
+    messages = [
+        _message('SG', 'ref-1'),
+        _message('SG', 'ref-2'),
+        _message('CN', 'ref-3'),
+        _message('SG', 'ref-4'),
+    ]
+    # the second message is not accepted by the first channel
+    sg_first.post_messages.return_value = ['ch-1', False, 'ch-4']
+    sg_second.post_messages.return_value = ['ch-2']
+    uc = RouteToChannelUseCase([
+        {'Jurisdiction': 'SG', 'ChannelInstance': sg_first},
+        {'Jurisdiction': 'CN', 'ChannelInstance': cn},
+        {'Jurisdiction': 'SG', 'ChannelInstance': sg_second},
+    ])
+    assert uc.execute_many(messages) == [
+        ('sg-first', 'ch-1'),
+        ('sg-second', 'ch-2'),
+        False,
+        ('sg-first', 'ch-4'),
+    ]
+    # single request per channel
+    sg_first.post_messages.assert_called_once_with([messages[0], messages[1], messages[3]])
+    sg_second.post_messages.assert_called_once_with([messages[1]])
+    cn.post_messages.assert_not_called()
+
+    # channel failure doesn't break the others
+    sg_first.post_messages.side_effect = Exception('Boom')
+    sg_second.post_messages.return_value = ['ch-1', 'ch-2', 'ch-4']
+    assert uc.execute_many(messages) == [
+        ('sg-second', 'ch-1'),
+        ('sg-second', 'ch-2'),
+        False,
+        ('sg-second', 'ch-4'),
+    ]
+
+    # channels without post_messages get the messages one by one
+    channel = mock.MagicMock(spec=['post_message', 'screen_message'])
+    channel.screen_message.return_value = False
+    channel.post_message.side_effect = ['ch-1', 'ch-2']
+    uc = RouteToChannelUseCase([
+        {'Jurisdiction': 'SG', 'ChannelInstance': channel},
+    ])
+    results = uc.execute_many(messages[:2])
+    assert [r[1] for r in results] == ['ch-1', 'ch-2']
+
+
+def test_circuit_breaker():
+    broken = _channel('broken')
+    broken.post_message.side_effect = Exception('Timeout')
+    healthy = _channel('healthy')
+    healthy.post_message.return_value = 'ch-id'
+    uc = RouteToChannelUseCase(
+        [
+            {'Id': 'broken', 'Jurisdiction': 'SG', 'ChannelInstance': broken},
+            {'Id': 'healthy', 'Jurisdiction': 'SG', 'ChannelInstance': healthy},
+        ],
+        circuit_breaker_conf={'min_calls': 2, 'open_seconds': 60}
+    )
+    # the failing channel is tried, then the next one
+    for i in range(2):
+        assert uc.execute(_message('SG', 'ref-1')) == ('healthy', 'ch-id')
+    assert broken.post_message.call_count == 2
+    # then it is skipped
+    for i in range(3):
+        assert uc.execute(_message('SG', 'ref-1')) == ('healthy', 'ch-id')
+    assert broken.post_message.call_count == 2
+    assert healthy.post_message.call_count == 5
+
+    broken.post_messages.side_effect = Exception('Timeout')
+    healthy.post_messages.return_value = ['ch-1', 'ch-2']
+    messages = [_message('SG', 'ref-1'), _message('SG', 'ref-2')]
+    assert uc.execute_many(messages) == [('healthy', 'ch-1'), ('healthy', 'ch-2')]
+    broken.post_messages.assert_not_called()
+
+
+def test_circuit_breaker_reload():
+    channels = []
+
+    def prepare_rule(rule):
+        # new instance on every reload, as the router does
+        channel = _channel(rule['Id'])
+        channel.post_message.side_effect = Exception('Timeout')
+        rule['ChannelInstance'] = channel
+        channels.append(channel)
+
+    table = [
+        {'Id': 'broken', 'Jurisdiction': 'SG'},
+        {'Id': 'other', 'Jurisdiction': 'CN'},
+    ]
+    index = RoutingIndex([dict(rule) for rule in table], prepare_rule=prepare_rule)
+    uc = RouteToChannelUseCase(index, circuit_breaker_conf={'min_calls': 2, 'open_seconds': 60})
+    for i in range(2):
+        uc.execute(_message('SG', 'ref-1'))
+    uc.execute(_message('CN', 'ref-2'))
+    assert set(uc._breakers) == {'broken', 'other'}
+
+    # reloaded: the state of the same channel is kept, the removed one is forgotten
+    index._build([dict(table[0])])
+    assert uc.execute(_message('SG', 'ref-1')) is CIRCUIT_OPEN
+    assert not channels[-1].post_message.called
+    assert set(uc._breakers) == {'broken'}
+
+
+def test_all_circuits_open():
+    broken = _channel('broken')
+    broken.post_message.side_effect = Exception('Timeout')
+    uc = RouteToChannelUseCase(
+        [{'Id': 'broken', 'Jurisdiction': 'SG', 'ChannelInstance': broken}],
+        circuit_breaker_conf={'min_calls': 2, 'open_seconds': 60}
+    )
+    # tried and failed, so not sent
+    for i in range(2):
+        assert uc.execute(_message('SG', 'ref-1')) is False
+    # not tried at all, the message must not be rejected
+    result = uc.execute(_message('SG', 'ref-1'))
+    assert result is CIRCUIT_OPEN
+    assert not result
+    assert broken.post_message.call_count == 2
+
+    messages = [_message('SG', 'ref-1'), _message('CN', 'ref-2')]
+    assert uc.execute_many(messages) == [CIRCUIT_OPEN, False]
+    broken.post_messages.assert_not_called()
+
+
+def test_match():
+    generic = _channel('generic')
+    generic.post_message.return_value = 'generic-id'
+    trade = _channel('trade')
+    trade.post_message.return_value = 'trade-id'
+    uc = RouteToChannelUseCase([
+        {'Jurisdiction': 'SG', 'ChannelInstance': generic},
+        {'Jurisdiction': 'SG', 'ChannelInstance': trade, 'Match': {'predicate': 'UN.CEFACT.Trade'}},
+    ])
+    message = Message.from_dict(_generate_msg_dict(
+        receiver='SG', sender_ref='ref-1', predicate='UN.CEFACT.Trade.CertificateOfOrigin.created'
+    ))
+    assert uc.execute(message) == ('trade', 'trade-id')
+    assert uc.execute(_message('SG', 'ref-2')) == ('generic', 'generic-id')